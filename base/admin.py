@@ -1,8 +1,12 @@
 from django.contrib import admin
-from .models import Room, Topic, Message, User
+from .models import Room, Topic, Membership, Message, MessageArchive, Task, User
 # Register your models here.
 
 admin.site.register(User)
 admin.site.register(Room)
 admin.site.register(Topic)
-admin.site.register(Message)
\ No newline at end of file
+admin.site.register(Message)
+admin.site.register(Membership)
+admin.site.register(MessageArchive)
+# to look at failed background tasks ( last_error has the traceback ).
+admin.site.register(Task)
@@ -0,0 +1,76 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+
+from base import db, export, queries, search
+from base.pagination import InvalidCursor, apaginate
+from . import views
+from .serializers import InvalidFields, RoomSerializer
+
+'''
+NOTE:
+Async versions of getRooms and getRoom, used when ASYNC_VIEWS is on.
+Django REST framework's @api_view only runs sync views, so these are plain django async views that return
+the same JSON ( and the same ETag / 304 answers, check views.rooms_etag ). The rooms are fully loaded
+( host and topic selected, participants prefetched when asked for ) before RoomSerializer sees them,
+so serializing them doesn't touch the database.
+'''
+
+
+async def getRooms(request):
+    try:
+        fields = RoomSerializer.parse_fields(request.GET.get('fields'))
+    except InvalidFields as exc:
+        return JsonResponse({'detail': str(exc)}, status=400)
+    q = request.GET.get('q') or ''
+    room_ids = await sync_to_async(search.search_rooms)(q) if q else None
+    rooms, ordering = queries.api_rooms(q, request.GET.get('topic'), room_ids,
+                                        with_participants='participants' in (fields or ()))
+
+    stats = await rooms.aaggregate(**queries.last_modified_aggregates())
+    last_modified = views.rooms_last_modified(stats['last_modified'])
+    etag = views.rooms_etag(request, stats['last_modified'], stats['count'])
+    cached = views.not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+
+    try:
+        page = await apaginate(rooms, request.GET.get('cursor'), per_page=views.ROOMS_PER_PAGE, ordering=ordering)
+    except InvalidCursor:
+        return JsonResponse({'detail': 'Invalid cursor.'}, status=400)
+    serializer = RoomSerializer(page.object_list, many=True, fields=fields, context={'request': request})
+    response = JsonResponse({'next': views.next_page_url(request, page), 'results': serializer.data})
+    return views.add_validators(response, etag, last_modified)
+
+
+async def getRoom(request, pk):
+    try:
+        fields = RoomSerializer.parse_fields(request.GET.get('fields'))
+    except InvalidFields as exc:
+        return JsonResponse({'detail': str(exc)}, status=400)
+    room = await queries.api_room(pk, with_participants='participants' in (fields or ())).afirst()
+    if room is None:
+        raise Http404
+    last_modified = views.rooms_last_modified(room.updated)
+    etag = views.rooms_etag(request, room.updated)
+    cached = views.not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+    serializer = RoomSerializer(room, many=False, fields=fields, context={'request': request})
+    return views.add_validators(JsonResponse(serializer.data), etag, last_modified)
+
+
+async def getExport(request):
+    # request.user is lazy, reading it runs a query ( or a cache get ), so not in the event loop.
+    if not await sync_to_async(export.may_export)(request):
+        return JsonResponse({'detail': 'Staff or the export token only.'}, status=403)
+    try:
+        since = export.parse_since(request.GET.get('since'))
+        types = export.parse_types(request.GET.get('types'))
+    except export.InvalidExport as exc:
+        return JsonResponse({'detail': str(exc)}, status=400)
+    # the rows are read after the view returned, when ReplicaMiddleware is done, so we pin the database here.
+    # an async generator, so the ASGI handler streams it instead of reading it into memory first.
+    chunks = export.aexport_ndjson(since, types, using=db.read_alias())
+    response = StreamingHttpResponse(chunks, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="studybud.ndjson"'
+    return response
@@ -9,17 +9,62 @@ And for that we use this serializers.py file which have some classes which will
 want to serialize and turn it into a json formatted data.
 '''
 
-from rest_framework.serializers import ModelSerializer
-from base.models import Room
+from rest_framework.serializers import ModelSerializer, PrimaryKeyRelatedField
+from base.models import Room, Topic, User
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+class HostSerializer(ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'name', 'avatar']
+
+
+class TopicSerializer(ModelSerializer):
+    class Meta:
+        model = Topic
+        fields = ['id', 'name']
+
 
 class RoomSerializer(ModelSerializer):
+    host = HostSerializer(read_only=True)
+    topic = TopicSerializer(read_only=True)
+    participants = PrimaryKeyRelatedField(many=True, read_only=True)
+
+    # sent when the client doesn't ask for ?fields=. The participant ids can be thousands per room,
+    # so they're only sent when asked for; participant_count is usually enough.
+    DEFAULT_FIELDS = ['id', 'host', 'topic', 'name', 'description', 'participant_count', 'message_count',
+                      'updated', 'created']
+
     class Meta:
         model = Room
-        fields = "__all__"
+        fields = ['id', 'host', 'topic', 'name', 'description', 'participants', 'participant_count',
+                  'message_count', 'updated', 'created']
         '''
         NOTE:
         In such classes, we always need to set atleast two values. The model and fields.
-        so it is taking the all the values in the class Room ( like host, topic, description, name )
-        and return all of them ( as we've set the fields = "__all__" ).
-        
-        '''
\ No newline at end of file
+        host and topic are nested serializers, so the response has {"id": 1, "username": ...} instead of just the id.
+        The view loads them with select_related(), so that doesn't cost a query per room.
+        '''
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # sparse fieldsets: ?fields=id,name,topic only serializes those.
+        for name in set(self.fields) - set(fields or self.DEFAULT_FIELDS):
+            self.fields.pop(name)
+
+    @classmethod
+    def parse_fields(cls, value):
+        '''
+        Turns ?fields=id,name into ['id', 'name'], or None when the client didn't ask for specific fields.
+        '''
+        if not value:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in cls.Meta.fields]
+        if unknown or not fields:
+            raise InvalidFields(f"Unknown field(s): {', '.join(unknown) or value}.")
+        return fields
@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+rooms_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('', views.getRoutes),
-    path('rooms/', views.getRooms),
-    path('rooms/<str:pk>/', views.getRoom),
+    path('rooms/', rooms_views.getRooms, name='api-rooms'),
+    path('rooms/<int:pk>/', rooms_views.getRoom, name='api-room'),
+    path('export/', rooms_views.getExport, name='api-export'),
+    path('topics/', views.getTopics, name='api-topics'),
+    path('topics/trending/', views.getTrendingTopics, name='api-trending-topics'),
 ]
\ No newline at end of file
@@ -1,20 +1,41 @@
+import datetime
+import hashlib
+
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from base.models import Room
-from .serializers import RoomSerializer
+from base import db, export, fragments, queries, search, topicindex
+from base.pagination import paginate, InvalidCursor
+from .serializers import InvalidFields, RoomSerializer
+
+
+ROOMS_PER_PAGE = 50
+# the most topics /api/topics and /api/topics/trending send at once.
+TOPICS_LIMIT = 50
+# what a room in the API shows: message_count changes with the messages ( counters.py ), without saving the Room.
+ROOMS_DEPEND_ON = ('Room', 'Topic', 'User', 'Message')
 
 @api_view(['GET'])
 def getRoutes(request):
     routes = [
-        'GET /api'
-        'GET /api/rooms',
-        'GET /api/rooms/:id'
+        'GET /api',
+        'GET /api/rooms?q=&topic=&fields=&cursor=',
+        'GET /api/rooms/:id?fields=',
+        'GET /api/export?since=&types=',
+        'GET /api/topics?q=&limit=',
+        'GET /api/topics/trending?limit=',
     ]
     '''
     NOTE:
     the routes we're making here are used to get the data in json format. So in the second link, /api/rooms -- anyone can 
     get the room names using that api.
     For the third one anyone can get the data of any particular room by giving the room id within the url.
+
+    ?q= searches the rooms like the home page does, ?topic= only keeps the rooms of one topic ( by name ),
+    ?fields=id,name,topic only sends those fields and ?cursor= is the next page ( the "next" link in the response ).
     '''
     return Response(routes)
     '''
@@ -24,19 +45,147 @@ def getRoutes(request):
     So this json response is going to convert this data into json data.  
     '''
 
+def rooms_etag(request, *parts):
+    '''
+    NOTE:
+    An ETag is a fingerprint of the response. The client sends it back in If-None-Match and when nothing changed
+    we answer 304 Not Modified with an empty body, instead of sending the same rooms again.
+    Room.updated changes when a room is saved, the fragment versions ( check fragments.py ) also change when
+    participants join, a message is posted or a host / topic is renamed, and the full path covers ?fields=, ?q= and
+    the cursor.
+    '''
+    versions = fragments.versions(ROOMS_DEPEND_ON)
+    raw = ':'.join(str(part) for part in (*versions, *parts, request.get_full_path()))
+    return f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def rooms_last_modified(updated):
+    # the newest Room.updated, or the last bump of ROOMS_DEPEND_ON when that came later ( a new message ).
+    changed = fragments.changed_at(ROOMS_DEPEND_ON)
+    if changed is None:
+        return updated
+    changed = datetime.datetime.fromtimestamp(changed, tz=datetime.timezone.utc)
+    return max(updated, changed) if updated else changed
+
+
+def not_modified(request, etag, last_modified):
+    # returns a 304 response when the client's copy is still fresh, otherwise None.
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    return add_validators(response, etag, last_modified) if response is not None else None
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def next_page_url(request, page):
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
 @api_view(['GET'])
 def getRooms(request):
-    rooms = Room.objects.all()
-    serializer = RoomSerializer(rooms, many=True)
+    try:
+        fields = RoomSerializer.parse_fields(request.GET.get('fields'))
+    except InvalidFields as exc:
+        return Response({'detail': str(exc)}, status=400)
+    q = request.GET.get('q') or ''
+    room_ids = search.search_rooms(q) if q else None
+    rooms, ordering = queries.api_rooms(q, request.GET.get('topic'), room_ids,
+                                        with_participants='participants' in (fields or ()))
+
+    stats = rooms.aggregate(**queries.last_modified_aggregates())
+    last_modified = rooms_last_modified(stats['last_modified'])
+    etag = rooms_etag(request, stats['last_modified'], stats['count'])
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+
+    try:
+        page = paginate(rooms, request.GET.get('cursor'), per_page=ROOMS_PER_PAGE, ordering=ordering)
+    except InvalidCursor:
+        return Response({'detail': 'Invalid cursor.'}, status=400)
+    serializer = RoomSerializer(page.object_list, many=True, fields=fields, context={'request': request})
     '''
     NOTE:
     many=True --- means, we might need to serialize more than one number of objects, and thus we added this param.
+
+    The rooms come one page at a time. "next" is the url of the following page ( with ?cursor= ), or None on the last page.
     '''
-    return Response(serializer.data)
+    response = Response({'next': next_page_url(request, page), 'results': serializer.data})
+    return add_validators(response, etag, last_modified)
 
 
 @api_view(['GET'])
 def getRoom(request, pk):
-    room = Room.objects.get(id=pk)
-    serializer = RoomSerializer(room, many=False)
-    return Response(serializer.data)
\ No newline at end of file
+    try:
+        fields = RoomSerializer.parse_fields(request.GET.get('fields'))
+    except InvalidFields as exc:
+        return Response({'detail': str(exc)}, status=400)
+    room = get_object_or_404(queries.api_room(pk, with_participants='participants' in (fields or ())))
+    # get_object_or_404 --- an unknown id is a 404 response now, it used to be a 500 ( Room.DoesNotExist ).
+    last_modified = rooms_last_modified(room.updated)
+    etag = rooms_etag(request, room.updated)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+    serializer = RoomSerializer(room, many=False, fields=fields, context={'request': request})
+    return add_validators(Response(serializer.data), etag, last_modified)
+
+
+
+@api_view(['GET'])
+def getExport(request):
+    '''
+    NOTE:
+    Streams every topic, user ( public fields only ), room and message as NDJSON, check export.py.
+    ?since=2024-05-01T10:00:00Z only sends the rooms and messages updated after that,
+    ?types=rooms,messages picks the tables.
+    StreamingHttpResponse sends the lines while we're still reading the database, so the response never sits
+    in memory as a whole.
+    Only staff and the analytics jobs ( EXPORT_TOKEN ) may read it, check export.may_export().
+    '''
+    if not export.may_export(request):
+        return Response({'detail': 'Staff or the export token only.'}, status=403)
+    try:
+        since = export.parse_since(request.GET.get('since'))
+        types = export.parse_types(request.GET.get('types'))
+    except export.InvalidExport as exc:
+        return Response({'detail': str(exc)}, status=400)
+    # the rows are read after the view returned, when ReplicaMiddleware is done, so we pin the database here.
+    chunks = export.export_ndjson(since, types, using=db.read_alias())
+    response = StreamingHttpResponse(chunks, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="studybud.ndjson"'
+    return response
+
+
+def topics_limit(request, default):
+    try:
+        return max(1, min(int(request.GET.get('limit', default)), TOPICS_LIMIT))
+    except ValueError:
+        return default
+
+
+@api_view(['GET'])
+def getTopics(request):
+    '''
+    NOTE:
+    The topic autocomplete of the room form: the topics with a word starting with ?q=, the ones with the most rooms first.
+    It's answered from the in-memory index in topicindex.py, the database isn't asked at all.
+    '''
+    matches = topicindex.complete(request.GET.get('q') or '', topics_limit(request, topicindex.AUTOCOMPLETE_LIMIT))
+    return Response([topic._asdict() for topic in matches])
+
+
+@api_view(['GET'])
+def getTrendingTopics(request):
+    # the topics with the most messages in the last TRENDING_WINDOW_HOURS, check topicindex.trending().
+    trending = topicindex.trending(topics_limit(request, 10))
+    return Response([topic._asdict() for topic in trending])
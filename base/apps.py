@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        from . import signals  # noqa: F401 ( importing it connects the receivers )
+        from . import tasks  # noqa: F401 ( and this registers the background tasks, check taskqueue.py )
@@ -0,0 +1,195 @@
+import datetime
+import json
+import re
+import zlib
+from contextvars import ContextVar
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import fragments
+from .models import Message, MessageArchive, User
+from .pagination import InvalidCursor, KeysetPage, _link_next_page, decode_cursor, encode_cursor
+
+'''
+NOTE:
+Hot / cold messages.
+
+Most rooms are read from the newest message down, and hardly anyone scrolls back a year. But every old message still
+sits in the messages table and in every one of its indexes, making them bigger ( and colder in memory ) for all the
+pages that only want the newest 50.
+
+`python manage.py archive_messages --older-than 180d` ( from cron ) moves the messages that weren't touched for that
+long into MessageArchive ( models.py ): chunks of up to CHUNK_SIZE messages of one room, zlib compressed json lines,
+newest first. The room page reads the hot messages as before, and only when you scroll past the oldest of them it
+shows an "Archived messages" link, which reads the chunks ( ?archived=<cursor>, check paginate_request() ).
+
+Archiving isn't deleting: the delete signals of the archived messages know it ( archiving() ) and leave the room's
+message_count, the unread counts and the open room pages alone ( counters.recount() counts the archived ones too ).
+Archived messages are read only, they can't be deleted one by one, and they go away with their room.
+The NDJSON export ( export.py ) sends them with the other messages, marked "archived": true.
+'''
+
+CHUNK_SIZE = 500
+COMPRESS_LEVEL = 9
+FIELDS = ('id', 'user_id', 'body', 'created', 'updated')
+
+_AGE = re.compile(r'^(\d+)([hdw]?)$')
+_AGE_UNITS = {'h': 'hours', 'd': 'days', 'w': 'weeks', '': 'days'}
+
+# per thread / asyncio task, like the read alias in db.py.
+_archiving = ContextVar('studybud_archiving', default=False)
+
+
+def archiving():
+    # True while _archive_chunk() deletes the messages it has just archived, check the Message signals.
+    return _archiving.get()
+
+
+def parse_age(value):
+    # "90d", "12w", "36h", a plain number is days.
+    found = _AGE.match(str(value).strip().lower())
+    if not found:
+        raise ValueError(f"{value!r} is not an age like 90d, 12w or 36h")
+    return datetime.timedelta(**{_AGE_UNITS[found.group(2)]: int(found.group(1))})
+
+
+def pack(rows):
+    lines = (json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')) for row in rows)
+    return zlib.compress('\n'.join(lines).encode(), COMPRESS_LEVEL)
+
+
+def unpack(data):
+    return [json.loads(line) for line in zlib.decompress(bytes(data)).decode().split('\n') if line]
+
+
+def _archive_chunk(room_id, cutoff, using, chunk_size):
+    # one transaction per chunk, so a big run never holds the tables for long.
+    with transaction.atomic(using=using):
+        rows = list(Message.objects.using(using).filter(room_id=room_id, updated__lt=cutoff)
+                    .order_by('updated', 'id').values(*FIELDS)[:chunk_size])
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+        MessageArchive.objects.using(using).create(
+            room_id=room_id, first_message_id=min(ids), last_message_id=max(ids),
+            oldest=rows[0]['updated'], newest=rows[-1]['updated'], message_count=len(rows),
+            data=pack(reversed(rows)),
+        )
+        # the timeline entries go with them ( on_delete=CASCADE ).
+        token = _archiving.set(True)
+        try:
+            Message.objects.using(using).filter(id__in=ids).delete()
+        finally:
+            _archiving.reset(token)
+        return len(rows)
+
+
+def archive_messages(older_than, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+    '''
+    Moves the messages not updated for older_than ( a timedelta ) into MessageArchive.
+    Returns ( rooms, chunks, messages ).
+    '''
+    cutoff = timezone.now() - older_than
+    room_ids = list(Message.objects.using(using).filter(updated__lt=cutoff).order_by()
+                    .values_list('room_id', flat=True).distinct())
+    chunks = messages = 0
+    for room_id in room_ids:
+        while archived := _archive_chunk(room_id, cutoff, using, chunk_size):
+            chunks += 1
+            messages += archived
+    if messages:
+        # the recent activity panels may still show some of them.
+        fragments.bump('Message')
+    return len(room_ids), chunks, messages
+
+
+def to_archive(older_than, using=DEFAULT_DB_ALIAS):
+    # what archive_messages() would move, for --dry-run.
+    cutoff = timezone.now() - older_than
+    return Message.objects.using(using).filter(updated__lt=cutoff).count()
+
+
+def export_rows(room_id, data, since=None):
+    # the messages of one chunk for export.py, oldest first, only the ones updated after `since` when it's given.
+    for row in reversed(unpack(data)):
+        if since is None or parse_datetime(row['updated']) > since:
+            yield {'id': row['id'], 'room_id': room_id, 'user_id': row['user_id'], 'body': row['body'],
+                   'created': row['created'], 'updated': row['updated'], 'archived': True}
+
+
+class ArchivedMessage:
+    '''
+    An archived message, with what room.html uses of a Message.
+    '''
+    archived = True
+
+    def __init__(self, row, user):
+        self.id = row['id']
+        self.user_id = row['user_id']
+        self.user = user
+        self.body = row['body']
+        self.created = parse_datetime(row['created'])
+        self.updated = parse_datetime(row['updated'])
+
+
+def has_archive(room_id):
+    return MessageArchive.objects.filter(room_id=room_id).exists()
+
+
+def _start(cursor):
+    if not cursor:
+        return None, 0
+    chunk_id, offset = decode_cursor(cursor, 2)
+    if not isinstance(chunk_id, int) or not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor(cursor)
+    return chunk_id, offset
+
+
+def page(room_id, cursor=None, per_page=50):
+    '''
+    A KeysetPage of the archived messages of a room, newest first. The cursor is ( chunk id, position in it ),
+    a page can go on into the next ( older ) chunk.
+    '''
+    chunk_id, offset = _start(cursor)
+    chunks = MessageArchive.objects.filter(room_id=room_id).order_by('-id')
+    if chunk_id is not None:
+        chunks = chunks.filter(id__lte=chunk_id)
+    # the ids only come from the index, a chunk's data is read when the page gets to it.
+    chunk_ids = list(chunks.values_list('id', flat=True)[:per_page + 1])
+    rows, next_cursor = [], None
+    for i, current in enumerate(chunk_ids):
+        if len(rows) == per_page:
+            next_cursor = encode_cursor([current, 0])
+            break
+        lines = unpack(MessageArchive.objects.values_list('data', flat=True).get(id=current))
+        start = offset if current == chunk_id else 0
+        taken = lines[start:start + per_page - len(rows)]
+        rows.extend(taken)
+        if start + len(taken) < len(lines):
+            next_cursor = encode_cursor([current, start + len(taken)])
+            break
+    users = User.objects.in_bulk({row['user_id'] for row in rows})
+    # a deleted user takes their messages with them, archived or not.
+    messages = [ArchivedMessage(row, users[row['user_id']]) for row in rows if row['user_id'] in users]
+    return KeysetPage(messages, next_cursor)
+
+
+def paginate_request(request, room_id, per_page=50, param='archived'):
+    '''
+    Same as pagination.paginate_request(), for the archive of a room ( ?archived= is its first page ).
+    '''
+    try:
+        found = page(room_id, request.GET.get(param), per_page)
+    except InvalidCursor:
+        found = page(room_id, None, per_page)
+    return _link_next_page(request, found, param)
+
+
+def first_page_url(request, room_id, param='archived'):
+    # the link under the oldest hot message, when the room has an archive.
+    if not has_archive(room_id):
+        return None
+    return f"{request.path}?{param}="
@@ -0,0 +1,147 @@
+import gzip
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:
+    # optional, `pip install brotli` for the .br files. Without it there are only the .gz ones.
+    brotli = None
+
+'''
+NOTE:
+The static files ( static/styles, static/js, the icons ) for production.
+
+`python manage.py build_static` does two things:
+    1. build_sprite(): every icon in static/images/icons goes into one file, static/images/sprite.svg, as a <symbol>.
+       The templates draw an icon with {% icon 'user-group' %} ( templatetags/icons.py ), a tiny
+       <svg><use href=".../sprite.svg#icon-user-group"></use></svg>, instead of pasting all of its paths again
+       in every room card. The browser downloads the sprite once and caches it.
+    2. collectstatic into STATIC_ROOT with CompressedManifestStaticFilesStorage ( STORAGES in settings.py ):
+       every file also gets a copy named after its content ( style.css -> style.3f2a9c1b7d4e.css, {% static %}
+       links to that one ) so browsers can cache it forever, and the text files get a .gz ( and a .br when brotli
+       is installed ) next to them, compressed once at build time instead of on every request.
+
+In production the web server serves STATIC_ROOT, django never sees those requests. With nginx:
+
+    location /static/ {
+        alias /srv/studybud/staticfiles/;
+        gzip_static on;
+        brotli_static on;    # with the ngx_brotli module
+        location ~ "[.][0-9a-f]{12}[.][^/.]+$" {
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }
+    }
+
+views.serveStatic does the same in python, for trying a build with DEBUG on ( check studybud/urls.py ).
+'''
+
+ICONS_DIR = Path(settings.BASE_DIR) / 'static' / 'images' / 'icons'
+SPRITE_NAME = 'images/sprite.svg'
+SPRITE_PATH = Path(settings.BASE_DIR) / 'static' / SPRITE_NAME
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+
+# ( suffix, Content-Encoding ), the best one the browser accepts wins.
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.ico')
+# smaller files fit in one packet anyway
+MIN_COMPRESS_SIZE = 256
+
+ET.register_namespace('', SVG_NS)
+
+
+def build_sprite(icons_dir=ICONS_DIR):
+    '''
+    Returns the sprite of the icons in icons_dir, one <symbol id="icon-NAME"> per NAME.svg.
+    '''
+    symbols = []
+    for path in sorted(Path(icons_dir).glob('*.svg')):
+        root = ET.parse(path).getroot()
+        symbol = ET.Element(f'{{{SVG_NS}}}symbol', {'id': f'icon-{path.stem}'})
+        if root.get('viewBox'):
+            symbol.set('viewBox', root.get('viewBox'))
+        for child in root:
+            # {% icon %} writes the <title>, the sprite only needs the shapes.
+            if child.tag != f'{{{SVG_NS}}}title':
+                symbol.append(child)
+        ET.indent(symbol, level=1)
+        symbols.append('  ' + ET.tostring(symbol, encoding='unicode').replace(f' xmlns="{SVG_NS}"', ''))
+    return f'<svg xmlns="{SVG_NS}">\n' + '\n'.join(symbols) + '\n</svg>\n'
+
+
+def write_sprite(path=SPRITE_PATH, icons_dir=ICONS_DIR):
+    Path(path).write_text(build_sprite(icons_dir))
+    return path
+
+
+def compress(path):
+    '''
+    Writes path.gz ( and path.br ) next to path when that saves something, returns the files it wrote.
+    '''
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+    compressors = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.insert(0, ('.br', lambda raw: brotli.compress(raw, quality=11)))
+    written = []
+    for suffix, compressor in compressors:
+        compressed = compressor(data)
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''
+    ManifestStaticFilesStorage ( the content hashed names ) that also precompresses what collectstatic copied.
+    '''
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                for written in compress(self.path(name)):
+                    yield name, os.path.relpath(written, self.location), True
+
+
+def accepted_encodings(header):
+    # "gzip, deflate, br;q=0.9" -> {'gzip', 'deflate', 'br'}, anything with q=0 is refused.
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def precompressed(path, accept_encoding, root=None):
+    '''
+    The name of the best precompressed variant of path in STATIC_ROOT the browser accepts, or path itself.
+    '''
+    accepted = accepted_encodings(accept_encoding)
+    for suffix, encoding in ENCODINGS:
+        if encoding not in accepted:
+            continue
+        try:
+            if os.path.isfile(safe_join(root or settings.STATIC_ROOT, path + suffix)):
+                return path + suffix
+        except SuspiciousFileOperation:
+            # serve() answers 404 for the path itself
+            break
+    return path
@@ -0,0 +1,134 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.shortcuts import redirect, render
+
+from . import archive, queries, roomcards, search, topicindex, unread, views
+from .models import User
+from .conditional import conditional_page
+from .pagination import apaginate_request
+from .ratelimit import rate_limit
+
+'''
+NOTE:
+Async versions of the read heavy pages ( home, room, userProfile ).
+
+Under an ASGI server a normal ( sync ) view holds a worker thread for the whole request, also while it's only
+waiting for the database. These views use django's async ORM ( afirst, acount, async for ) instead, and the room
+and profile pages start their independent queries together with asyncio.gather().
+They build the same querysets as views.py ( from queries.py ) and render the same templates.
+
+ASYNC_VIEWS in settings.py decides which set urls.py uses.
+
+Template rendering stays sync, it runs in sync_to_async( render ). Templates read things like request.user
+and the messages framework lazily, which may hit the database, and that isn't allowed in async code.
+
+The sidebar topics and the recent activity are handed to the template as lazy querysets, the same as views.py does.
+They're inside cached fragments ( check fragments.py ), so most renders never run those queries at all.
+'''
+
+
+def login_required(view):
+    # django 4.2's login_required only wraps sync views.
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path(), 'login')
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _list(queryset):
+    return [row async for row in queryset]
+
+
+async def _count(rooms, room_ids):
+    # when searching we already know how many rooms matched.
+    return len(room_ids) if room_ids is not None else await rooms.acount()
+
+
+async def _render(request, template_name, context, using=None):
+    return await sync_to_async(render)(request, template_name, context, using=using)
+
+
+@conditional_page(*views.HOME_DEPENDS_ON)
+async def home(request):
+    q = request.GET.get('q') or ''
+    room_ids = topic_ids = None
+    if q:
+        room_ids, topic_ids = await asyncio.gather(
+            sync_to_async(search.search_rooms)(q),
+            sync_to_async(search.search_topics)(q),
+        )
+    rooms, ordering = queries.feed_cards(q, request.GET.get('sort'), room_ids)
+    room_count, rooms_page = await asyncio.gather(
+        _count(rooms, room_ids),
+        apaginate_request(request, rooms, per_page=views.ROOMS_PER_PAGE, ordering=ordering),
+    )
+    roomcards.to_cards(rooms_page)
+    viewer_id = await sync_to_async(lambda: request.user.id if request.user.is_authenticated else None)()
+    await sync_to_async(unread.annotate_rooms)(request.user, rooms_page)
+    topics = queries.sidebar_topics(5)
+    room_messages = queries.home_activity(views.RECENT_ACTIVITY_LIMIT, topic_ids=topic_ids, viewer_id=viewer_id)
+    trending = await sync_to_async(topicindex.trending)(views.TRENDING_TOPICS)
+    context = {'rooms': rooms_page, 'rooms_page': rooms_page, 'topics': topics, "room_count": room_count,
+               "room_messages": room_messages, "trending": trending}
+    return await _render(request, 'base/home.html', context, using=views.page_engine('home'))
+
+
+@login_required
+@rate_limit('post-message')
+async def room(request, pk):
+    viewer_id = await sync_to_async(lambda: request.user.id)()
+    if request.method == 'POST':
+        # writes stay on the sync code path ( Room.post_message ), only the page itself is async.
+        room = await queries.room_detail(pk, viewer_id=viewer_id).afirst()
+        if room is None:
+            raise Http404
+        await sync_to_async(room.post_message)(request.user, request.POST.get('body'), join=not room.is_member)
+        return redirect('room', pk=room.id)
+
+    archived = 'archived' in request.GET
+    if archived:
+        messages = sync_to_async(archive.paginate_request)(request, pk, per_page=views.MESSAGES_PER_PAGE)
+    else:
+        messages = apaginate_request(request, queries.room_messages(pk), per_page=views.MESSAGES_PER_PAGE)
+    room, messages_page, participants = await asyncio.gather(
+        queries.room_detail(pk, viewer_id=viewer_id).afirst(),
+        messages,
+        _list(queries.room_participants(pk)),
+    )
+    if room is None:
+        raise Http404
+    archive_url = None
+    if not archived and not messages_page.has_next:
+        archive_url = await sync_to_async(archive.first_page_url)(request, room.id)
+    live = not request.GET.get('cursor') and not archived
+    last_message_id = max((message.id for message in messages_page), default=0)
+    if room.is_member and not archived:
+        await sync_to_async(unread.mark_read)(viewer_id, room.id, last_message_id)
+    context = {'room': room, 'room_messages': messages_page, 'messages_page': messages_page,
+               'participants': participants, 'live': live, 'last_message_id': last_message_id,
+               'archive_url': archive_url, 'is_member': room.is_member}
+    return await _render(request, 'base/room.html', context, using=views.page_engine('room'))
+
+
+@login_required
+async def userProfile(request, pk):
+    user, rooms_page = await asyncio.gather(
+        User.objects.filter(id=pk).afirst(),
+        apaginate_request(request, queries.hosted_cards(pk), per_page=views.ROOMS_PER_PAGE),
+    )
+    if user is None:
+        raise Http404
+    roomcards.to_cards(rooms_page)
+    await sync_to_async(unread.annotate_rooms)(request.user, rooms_page)
+    room_messages = queries.recent_activity(views.RECENT_ACTIVITY_LIMIT, user_id=pk)
+    topics = queries.sidebar_topics()
+    context = {"user": user, "rooms": rooms_page, "rooms_page": rooms_page,
+               "room_messages": room_messages, "topics": topics}
+    return await _render(request, 'base/profile.html', context, using=views.page_engine('user-profile'))
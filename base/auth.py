@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+'''
+NOTE:
+Every logged in request used to cost two queries before the view even started: the session row ( django_session )
+and the User row ( AuthenticationMiddleware, SELECT ... FROM base_user WHERE id = ... ).
+
+    - the session: SESSION_ENGINE in settings.py can keep it in the cache ( cached_db ) or in the cookie
+      itself ( signed_cookies ), check STUDYBUD_SESSION_ENGINE there.
+    - the user: CachedAuthenticationMiddleware below keeps the User in the cache for USER_CACHE_TIMEOUT seconds.
+      Saving or deleting the user drops it ( signals.py ), so a changed name or avatar shows up right away.
+      A change that skips save() ( a plain .update() ) shows up once the cached copy runs out, and so does a change
+      made by another process when every process has its own local memory cache ( STUDYBUD_CACHE_DIR shares it ).
+
+A cached user is only used after the same checks django.contrib.auth.get_user() does: the session's backend
+is still configured, the user may log in ( is_active ) and the session hash matches the password, so changing the
+password still logs out the other sessions. Anything that doesn't pass goes the normal way, through the database.
+
+The password hash itself never goes into the cache ( with STUDYBUD_CACHE_DIR that would be a file on disk ).
+We keep the other columns and the session hash made from it, and the User comes back with password deferred:
+reading user.password loads it from the database, and saving the user ( the profile form ) leaves it alone.
+'''
+
+USER_CACHE_TIMEOUT = 300
+
+
+def _key(user_id):
+    return f"user:{user_id}"
+
+
+def forget_user(user_id):
+    cache.delete(_key(user_id))
+
+
+def _cached_fields():
+    return [field for field in get_user_model()._meta.concrete_fields if field.attname != 'password']
+
+
+def _to_cache(user):
+    return {
+        'db': user._state.db,
+        'values': [field.get_prep_value(getattr(user, field.attname)) for field in _cached_fields()],
+        'session_auth_hash': user.get_session_auth_hash(),
+    }
+
+
+def _from_cache(request):
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    backend_path = session.get(auth.BACKEND_SESSION_KEY)
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS or not session_hash:
+        return None
+    cached = cache.get(_key(user_id))
+    if not isinstance(cached, dict) or not constant_time_compare(session_hash, cached['session_auth_hash']):
+        return None
+    fields = _cached_fields()
+    # from_db() like a queryset would, the password is a deferred field then.
+    user = get_user_model().from_db(cached['db'], [field.attname for field in fields], cached['values'])
+    if not getattr(user, 'is_active', True):
+        return None
+    user.backend = backend_path
+    return user
+
+
+def get_user(request):
+    '''
+    django.contrib.auth.get_user(), with the User from the cache when it's there.
+    '''
+    user = _from_cache(request)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache.set(_key(user.pk), _to_cache(user), USER_CACHE_TIMEOUT)
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    '''
+    AuthenticationMiddleware that loads request.user through get_user() above, still only when something uses it.
+    '''
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: self.get_user(request))
+
+    @staticmethod
+    def get_user(request):
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = get_user(request)
+        return request._cached_user
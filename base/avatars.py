@@ -0,0 +1,120 @@
+import hashlib
+import io
+import os
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+'''
+NOTE:
+Avatar thumbnails.
+
+An uploaded avatar used to be saved as it was, so a 3000x3000 photo got downloaded for a 28px circle on every feed card.
+Now store() saves the upload under the hash of its content and makes square thumbnails of it in WebP and JPEG:
+
+    avatars/3f/3f9a...c1.png        the original
+    avatars/3f/3f9a...c1-40.webp    40x40 WebP
+    avatars/3f/3f9a...c1-40.jpg     40x40 JPEG ( for the few browsers without WebP )
+    ... and the same for 80 and 160
+
+The same picture uploaded twice ( or by two users ) has the same hash, so it's stored only once.
+A file never changes under its name, which is why serveMedia() in views.py can tell browsers to cache them forever.
+
+Uploads Pillow can't read are kept as they are under avatars/raw/, and avatars from before this change
+( and the default avatar.svg ) just use their original file; `python manage.py thumbnail_avatars` converts those.
+'''
+
+THUMBNAIL_SIZES = (40, 80, 160)
+FORMATS = {'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+           'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}}
+HASH_LENGTH = 32
+
+# the names store() gives out, thumbnails exist for these.
+STORED_NAME = re.compile(r'^avatars/[0-9a-f]{2}/(?P<digest>[0-9a-f]{%d})' % HASH_LENGTH)
+
+
+def _digest_path(digest):
+    return f"avatars/{digest[:2]}/{digest}"
+
+
+def thumbnail_name(digest, size, extension):
+    return f"{_digest_path(digest)}-{size}.{extension}"
+
+
+def _save_once(name, data):
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, ContentFile(data))
+
+
+def _thumbnails(image, digest):
+    # every size is made from the original, not from the previous thumbnail, so they stay sharp.
+    for size in THUMBNAIL_SIZES:
+        square = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for extension, options in FORMATS.items():
+            name = thumbnail_name(digest, size, extension)
+            if default_storage.exists(name):
+                continue
+            out = io.BytesIO()
+            (square if extension == 'webp' else square.convert('RGB')).save(out, **options)
+            default_storage.save(name, ContentFile(out.getvalue()))
+
+
+def store(file):
+    '''
+    Saves an uploaded image ( any django File ) and its thumbnails, returns the name for User.avatar.
+    '''
+    file.seek(0)
+    data = file.read()
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    extension = os.path.splitext(file.name or '')[1].lower() or '.img'
+    try:
+        image = Image.open(io.BytesIO(data))
+        # big JPEGs can be decoded at 1/2, 1/4 or 1/8 of their size, that's much faster and enough for 160px.
+        image.draft('RGB', (max(THUMBNAIL_SIZES), max(THUMBNAIL_SIZES)))
+        # phones save photos sideways and put the rotation in the EXIF data.
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return _save_once(f"avatars/raw/{digest}{extension}", data)
+    _thumbnails(image, digest)
+    return _save_once(f"{_digest_path(digest)}{extension}", data)
+
+
+def store_upload(field_file):
+    '''
+    Called from signals.py before a User is saved with a new avatar, instead of django saving the upload as it is.
+    '''
+    field_file.name = store(field_file.file)
+    field_file._committed = True
+
+
+def digest_of(avatar):
+    match = STORED_NAME.match(avatar.name or '') if avatar else None
+    return match.group('digest') if match else None
+
+
+def pick_size(size):
+    # the smallest thumbnail that is at least `size` pixels, or the biggest one.
+    return next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
+
+
+def thumbnail_url(avatar, size, extension='jpg'):
+    '''
+    The url of the right thumbnail for a `size` px avatar, or the original when it has no thumbnails.
+    '''
+    digest = digest_of(avatar)
+    if digest is None:
+        return avatar.url if avatar else ''
+    return default_storage.url(thumbnail_name(digest, pick_size(size), extension))
+
+
+def srcset(avatar, size, extension):
+    digest = digest_of(avatar)
+    one, two = pick_size(size), pick_size(size * 2)
+    urls = [f"{default_storage.url(thumbnail_name(digest, one, extension))} 1x"]
+    if two != one:
+        urls.append(f"{default_storage.url(thumbnail_name(digest, two, extension))} 2x")
+    return ', '.join(urls)
@@ -0,0 +1,136 @@
+import datetime
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import fragments, unread
+
+'''
+NOTE:
+HTTP caching for the pages, so a browser ( or a reverse proxy like nginx / a CDN ) doesn't download a page again
+when nothing on it changed.
+
+    @conditional_page('Room', 'Topic', 'Message', 'User')
+    def home(request):
+        ...
+
+Before running the view we work out two validators for the page:
+    - ETag: a fingerprint of the fragment versions of the models ( check fragments.py, every save or delete bumps
+      them ), the url and, for a logged in user, who they are and their unread counts.
+    - Last-Modified: the newest `updated` of those models ( an index lookup, check the -updated indexes in models.py )
+      or the last time one of them changed in a way that leaves no `updated` behind, like a delete.
+      It's cached per fragment version, so it's only looked up once after every change.
+When the browser's copy still matches ( If-None-Match / If-Modified-Since ) we answer 304 Not Modified
+and the view doesn't run at all.
+
+Cache-Control:
+    - anonymous: "public, max-age=PAGE_CACHE_MAX_AGE", a proxy may serve it to every anonymous visitor.
+    - logged in: "private, no-cache", only the browser keeps it and it has to ask ( and usually gets a 304 ) first.
+Both get "Vary: Cookie", so a proxy never hands a logged in page to someone else.
+A page that sets a cookie ( a new CSRF token, a session ) is never public.
+'''
+
+LAST_MODIFIED_PREFIX = 'page-last-modified'
+
+
+def _last_modified(model_names, model_versions):
+    key = f"{LAST_MODIFIED_PREFIX}:{':'.join(model_names)}:{'.'.join(str(v) for v in model_versions)}"
+    cache = fragments.get_cache()
+    found = cache.get(key)
+    if found is None:
+        newest = [
+            model.objects.aggregate(newest=Max('updated'))['newest'] for model in map(_model, model_names)
+            if any(field.name == 'updated' for field in model._meta.get_fields())
+        ]
+        timestamps = [value.timestamp() for value in newest if value is not None]
+        changed = fragments.changed_at(model_names)
+        if changed is not None:
+            timestamps.append(changed)
+        found = int(max(timestamps, default=0))
+        cache.set(key, found, fragments.timeout())
+    return datetime.datetime.fromtimestamp(found, tz=datetime.timezone.utc) if found else None
+
+
+def _model(name):
+    return apps.get_model('base', name)
+
+
+def page_validators(request, model_names, vary_on=None):
+    '''
+    Returns ( etag, last_modified ) for the page, or None when it shouldn't be cached at all.
+    '''
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    # a flash message ( "Room created" ... ) is part of the page once, a 304 would keep it from being shown.
+    if len(messages.get_messages(request)):
+        return None
+    model_versions = fragments.versions(model_names)
+    parts = [*model_versions, request.get_full_path()]
+    last_modified = None
+    if request.user.is_authenticated:
+        parts += [request.user.id, sorted(unread.counts(request.user.id).items())]
+    else:
+        # a logged in page depends on more than the models, so only anonymous pages get a Last-Modified.
+        last_modified = _last_modified(model_names, model_versions)
+        parts.append(last_modified)
+    if vary_on is not None:
+        parts.append(vary_on(request))
+    raw = ':'.join(str(part) for part in parts)
+    # weak ( W/ ): the same data renders the same page, but not byte for byte ( "5 minutes ago", CSRF tokens ).
+    return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"', last_modified
+
+
+def not_modified(request, validators):
+    etag, last_modified = validators
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def add_cache_headers(request, response, validators):
+    patch_vary_headers(response, ['Cookie'])
+    if validators is None or response.status_code not in (200, 304):
+        return response
+    etag, last_modified = validators
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    sets_cookie = bool(response.cookies) or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    if request.user.is_authenticated or sets_cookie:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.PAGE_CACHE_MAX_AGE)
+    return response
+
+
+def conditional_page(*model_names, vary_on=None):
+    '''
+    `model_names` are the models the page shows, `vary_on( request )` can add anything else it depends on.
+    Works on sync and async views.
+    '''
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                validators = await sync_to_async(page_validators)(request, model_names, vary_on)
+                response = not_modified(request, validators) if validators else None
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return await sync_to_async(add_cache_headers)(request, response, validators)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            validators = page_validators(request, model_names, vary_on)
+            response = not_modified(request, validators) if validators else None
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return add_cache_headers(request, response, validators)
+        return wrapper
+    return decorator
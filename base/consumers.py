@@ -0,0 +1,151 @@
+import asyncio
+import json
+import math
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http.cookie import parse_cookie
+
+from . import ratelimit
+from .models import Message, Room
+from .realtime import encode_frame, get_broker, message_frame, room_channel
+
+'''
+NOTE:
+The WebSocket side of a room page ( routing.py sends /ws/room/<pk>/ here ).
+
+1. the browser connects with its normal session cookie, so we know who it is, same as the room view.
+2. we subscribe to the room's channel on the broker ( realtime.py ) and send every frame that arrives to the browser.
+3. ?after=<message id> asks for the messages the browser missed, like after a reconnect.
+   Only those are sent, not the whole history.
+4. the browser can post a message over the socket: {"type": "message", "body": "..."}.
+   It's saved exactly like the form POST in views.room, and comes back to everyone as a broadcast.
+'''
+
+# a client that missed more than this should just reload the page.
+HISTORY_LIMIT = 100
+
+# custom close codes ( 4000-4999 are free for applications ).
+CLOSE_OVERFLOW = 4000
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+
+def _headers(scope):
+    return {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def _same_origin(scope):
+    # browsers always send Origin on WebSockets. Without this check any other website could open a socket
+    # with our user's cookies ( cross-site WebSocket hijacking ).
+    headers = _headers(scope)
+    origin = headers.get('origin')
+    return origin is None or urlsplit(origin).netloc == headers.get('host')
+
+
+def _user_for_scope(scope):
+    cookies = parse_cookie(_headers(scope).get('cookie', ''))
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    return get_user(SimpleNamespace(session=session))
+
+
+def _after_id(scope):
+    values = parse_qs(scope.get('query_string', b'').decode()).get('after')
+    try:
+        return int(values[0]) if values else None
+    except ValueError:
+        return None
+
+
+def _history(room_id, after):
+    messages = list(
+        Message.objects.filter(room_id=room_id, id__gt=after).select_related('user').order_by('id')[:HISTORY_LIMIT + 1]
+    )
+    frames = [message_frame(message) for message in messages[:HISTORY_LIMIT]]
+    if len(messages) > HISTORY_LIMIT:
+        frames.append({'type': 'reload'})
+    return frames
+
+
+def _post_message(room_id, user, body):
+    room = Room.objects.get(id=room_id)
+    room.post_message(user, body)
+
+
+async def _close(send, code):
+    await send({'type': 'websocket.close', 'code': code})
+
+
+async def _send_frame(send, frame):
+    await send({'type': 'websocket.send', 'text': encode_frame(frame)})
+
+
+async def _handle_client_frame(send, event, room_id, user):
+    try:
+        frame = json.loads(event.get('text') or '')
+    except ValueError:
+        frame = None
+    if not isinstance(frame, dict) or frame.get('type') != 'message':
+        await _send_frame(send, {'type': 'error', 'detail': 'Unknown frame.'})
+        return
+    body = str(frame.get('body') or '').strip()
+    if body:
+        # same limit as the message form, a socket is no way around it ( check ratelimit.py ).
+        wait = await sync_to_async(ratelimit.take_token)('post-message', f"user:{user.pk}")
+        if wait:
+            await _send_frame(send, {'type': 'error', 'detail': 'Too many messages.', 'retry_after': math.ceil(wait)})
+            return
+        await sync_to_async(_post_message)(room_id, user, body)
+
+
+async def room_socket(scope, receive, send, pk):
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if not _same_origin(scope):
+        return await _close(send, CLOSE_FORBIDDEN)
+    user = await sync_to_async(_user_for_scope)(scope)
+    if not user.is_authenticated:
+        return await _close(send, CLOSE_UNAUTHORIZED)
+    room_id = int(pk)
+    if not await Room.objects.filter(id=room_id).aexists():
+        return await _close(send, CLOSE_NOT_FOUND)
+
+    # subscribe before reading the history, so nothing posted in between is lost ( the client drops duplicates by id ).
+    subscription = get_broker().subscribe(room_channel(room_id))
+    receiver = listener = None
+    try:
+        await send({'type': 'websocket.accept'})
+        after = _after_id(scope)
+        if after is not None:
+            for frame in await sync_to_async(_history)(room_id, after):
+                await _send_frame(send, frame)
+
+        receiver = asyncio.ensure_future(receive())
+        listener = asyncio.ensure_future(subscription.get())
+        while True:
+            done, pending = await asyncio.wait({receiver, listener}, return_when=asyncio.FIRST_COMPLETED)
+            if listener in done:
+                if subscription.overflowed:
+                    await _close(send, CLOSE_OVERFLOW)
+                    break
+                await _send_frame(send, listener.result())
+                listener = asyncio.ensure_future(subscription.get())
+            if receiver in done:
+                event = receiver.result()
+                if event['type'] == 'websocket.disconnect':
+                    break
+                if event['type'] == 'websocket.receive':
+                    await _handle_client_frame(send, event, room_id, user)
+                receiver = asyncio.ensure_future(receive())
+    finally:
+        subscription.close()
+        for task in (receiver, listener):
+            if task is not None and not task.done():
+                task.cancel()
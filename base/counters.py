@@ -0,0 +1,64 @@
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+'''
+NOTE:
+Helpers for the denormalized counters ( Topic.room_count, Room.participant_count, Room.message_count ).
+
+adjust() is what signals.py calls on every write. It does "SET count = count + 1" in the database ( F() ),
+not "read the count, add 1 in python, save", so two requests writing at the same time can't overwrite each other.
+
+recount() recomputes every counter from the real rows. It is what `python manage.py recount` and the migration use.
+Room.message_count also counts the archived messages of the room ( check archive.py ).
+'''
+
+
+def adjust(queryset, **deltas):
+    if not deltas:
+        return 0
+    return queryset.update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def _count_of(queryset, group_by):
+    return Coalesce(
+        Subquery(queryset.order_by().values(group_by).annotate(total=Count('pk')).values('total')),
+        Value(0),
+    )
+
+
+def recount(apps=global_apps, using=DEFAULT_DB_ALIAS):
+    '''
+    Returns how many rows had a wrong counter, per counter.
+    '''
+    Topic = apps.get_model('base', 'Topic')
+    Room = apps.get_model('base', 'Room')
+    Message = apps.get_model('base', 'Message')
+    Membership = Room.participants.through
+
+    messages = _count_of(Message.objects.using(using).filter(room=OuterRef('pk')), 'room')
+    try:
+        MessageArchive = apps.get_model('base', 'MessageArchive')
+    except LookupError:
+        # the migrations that ran before the archive existed.
+        MessageArchive = None
+    if MessageArchive is not None:
+        archived = MessageArchive.objects.using(using).filter(room=OuterRef('pk')).order_by().values('room')
+        messages = messages + Coalesce(
+            Subquery(archived.annotate(total=Sum('message_count')).values('total')),
+            Value(0),
+        )
+
+    fixed = {}
+    counters = [
+        ('topic.room_count', Topic, 'room_count',
+         _count_of(Room.objects.using(using).filter(topic=OuterRef('pk')), 'topic')),
+        ('room.participant_count', Room, 'participant_count',
+         _count_of(Membership.objects.using(using).filter(room=OuterRef('pk')), 'room')),
+        ('room.message_count', Room, 'message_count', messages),
+    ]
+    for label, model, field, actual in counters:
+        drifted = model.objects.using(using).alias(actual=actual).exclude(**{field: F('actual')})
+        fixed[label] = drifted.update(**{field: actual})
+    return fixed
@@ -0,0 +1,89 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+'''
+NOTE:
+Read replica routing ( settings.DATABASES['replica'], check studybud/database.py ).
+
+The pages that only read ( settings.DATABASE_REPLICA_VIEWS, like home and the API GET views ) run their queries
+on the replica, everything else and every write goes to the primary ( 'default' ).
+
+A replica is usually a little behind the primary. So after a POST ( a new message, a new room ) we set a short lived
+cookie, and while it's there that browser reads from the primary too. That way you always see your own message
+after posting it, even when the replica hasn't caught up yet.
+
+ReplicaMiddleware decides per request and keeps the decision in a ContextVar, which is per thread / per asyncio task,
+so concurrent requests don't see each other's choice. ReplicaRouter reads it.
+'''
+
+REPLICA = 'replica'
+PRIMARY = 'default'
+PIN_COOKIE = 'studybud_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('studybud_read_alias', default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def read_alias():
+    return _read_alias.get() or PRIMARY
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica copies the primary's schema by itself.
+        return db != REPLICA
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            replica_configured()
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+            and getattr(request.resolver_match, 'url_name', None) in settings.DATABASE_REPLICA_VIEWS
+        ):
+            _read_alias.set(REPLICA)
+        return None
+
+    def process_response(self, request, response):
+        # the worker thread is reused for the next request, so don't leave the choice behind.
+        _read_alias.set(None)
+        if request.method not in SAFE_METHODS and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def tune_sqlite(connection):
+    '''
+    NOTE:
+    SQLite's default journal ( DELETE mode ) locks the whole file for a write, so readers wait for every message post.
+    In WAL mode readers keep reading the last committed data while one writer appends to the -wal file.
+    synchronous=NORMAL is safe with WAL ( a power cut can lose the last transactions, never corrupt the file ).
+    The busy timeout itself comes from OPTIONS['timeout'] in studybud/database.py.
+
+    SQLITE_JOURNAL_MODE ( settings.py ) is WAL unless you say otherwise. WAL is written into the database file itself
+    and leaves -wal / -shm files next to it ( they're in .gitignore ).
+    '''
+    if connection.vendor != 'sqlite' or not settings.SQLITE_JOURNAL_MODE:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        if settings.SQLITE_JOURNAL_MODE.upper() == 'WAL':
+            cursor.execute("PRAGMA synchronous=NORMAL")
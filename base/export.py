@@ -0,0 +1,180 @@
+import datetime
+import hmac
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import archive
+from .models import Message, MessageArchive, Room, Topic, User
+
+'''
+NOTE:
+NDJSON export of the public data, for the analytics jobs ( /api/export/ and `python manage.py export_studybud` ).
+
+NDJSON is one JSON object per line, like {"type": "room", "id": 1, ...}, so a client can read it line by line
+without loading the whole file. On our side every table is read with .values().iterator( chunk_size ), which
+fetches a chunk of rows at a time instead of the whole table, so memory stays the same for 1.000 or 10.000.000 rows.
+
+The first line is {"type": "export", "started": ...}. Pass that "started" back as since= next time and you only get
+the rooms and messages updated after it. Topics and users don't have an "updated" column, so they're always sent
+in full ( they're small next to the messages ). Deleted rows don't show up in an incremental export.
+
+/api/export/ sends every message body and the whole user list, so like /metrics it's not public: only staff, or
+a client with `Authorization: Bearer <EXPORT_TOKEN>` ( settings.py, for the analytics jobs ), may read it.
+
+The messages that were archived ( check archive.py ) come first, with "archived": true, then the ones still
+in the messages table. The archive is read a few chunks at a time, each chunk is up to archive.CHUNK_SIZE messages.
+'''
+
+CHUNK_SIZE = 2000
+# archive chunks read at once, every one of them holds up to archive.CHUNK_SIZE messages.
+ARCHIVES_PER_READ = 20
+# how many lines we join into one string before handing it to the response / the file.
+LINES_PER_WRITE = 200
+
+# ( type, model, public fields, filtered by ?since= )
+TABLES = {
+    'topics': ('topic', Topic, ('id', 'name', 'room_count'), False),
+    'users': ('user', User, ('id', 'username', 'name', 'bio', 'avatar'), False),
+    'rooms': ('room', Room, ('id', 'name', 'description', 'host_id', 'topic_id', 'participant_count',
+                             'message_count', 'created', 'updated'), True),
+    'messages': ('message', Message, ('id', 'room_id', 'user_id', 'body', 'created', 'updated'), True),
+}
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def may_export(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    # compare_digest, so the time it takes doesn't tell how much of the token was right.
+    return bool(settings.EXPORT_TOKEN) and scheme.lower() == 'bearer' and hmac.compare_digest(
+        token.strip().encode(), settings.EXPORT_TOKEN.encode())
+
+
+def parse_since(value):
+    '''
+    Accepts a date ( 2024-05-01 ) or a datetime ( 2024-05-01T10:00:00+00:00 ), None when it's empty.
+    '''
+    if not value:
+        return None
+    try:
+        # both raise ValueError for a well formed but impossible date, like 2024-13-45.
+        since = parse_datetime(value)
+        day = parse_date(value) if since is None else None
+    except ValueError:
+        since = day = None
+    if since is None:
+        if day is None:
+            raise InvalidExport(f"since must be a date or a datetime, got {value!r}.")
+        since = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def parse_types(value):
+    if not value:
+        return list(TABLES)
+    types = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in types if name not in TABLES]
+    if unknown or not types:
+        raise InvalidExport(f"Unknown type(s): {', '.join(unknown) or value}. Pick from {', '.join(TABLES)}.")
+    return types
+
+
+def table_queryset(name, since=None, using=DEFAULT_DB_ALIAS):
+    label, model, fields, incremental = TABLES[name]
+    rows = model._base_manager.using(using)
+    if incremental:
+        if since is not None:
+            rows = rows.filter(updated__gt=since)
+        # ( updated, id ) is indexed, check the Meta.indexes in models.py.
+        rows = rows.order_by('updated', 'id')
+    else:
+        rows = rows.order_by('id')
+    return label, rows.values(*fields)
+
+
+def archive_queryset(since=None, using=DEFAULT_DB_ALIAS):
+    # the chunks with a message updated after `since`, archive.export_rows() picks those messages out.
+    chunks = MessageArchive.objects.using(using)
+    if since is not None:
+        chunks = chunks.filter(newest__gt=since)
+    return chunks.order_by('newest', 'id').values('room_id', 'data')
+
+
+def to_line(label, row):
+    return json.dumps({'type': label, **row}, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+def header_line(since, types):
+    return to_line('export', {'started': timezone.now(), 'since': since, 'types': types})
+
+
+def _batches(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def _table_lines(name, since, using, chunk_size):
+    label, rows = table_queryset(name, since, using)
+    if name == 'messages':
+        for chunk in archive_queryset(since, using).iterator(chunk_size=ARCHIVES_PER_READ):
+            for row in archive.export_rows(chunk['room_id'], chunk['data'], since):
+                yield to_line(label, row)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield to_line(label, row)
+
+
+def _lines(since, types, using, chunk_size):
+    yield header_line(since, types)
+    for name in types:
+        yield from _table_lines(name, since, using, chunk_size)
+
+
+def export_ndjson(since=None, types=None, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+    '''
+    Yields the export as strings of whole NDJSON lines.
+    '''
+    return _batches(_lines(since, types or list(TABLES), using, chunk_size))
+
+
+async def _atable_lines(name, since, using, chunk_size):
+    label, rows = table_queryset(name, since, using)
+    if name == 'messages':
+        async for chunk in archive_queryset(since, using).aiterator(chunk_size=ARCHIVES_PER_READ):
+            for row in archive.export_rows(chunk['room_id'], chunk['data'], since):
+                yield to_line(label, row)
+    async for row in rows.aiterator(chunk_size=chunk_size):
+        yield to_line(label, row)
+
+
+async def aexport_ndjson(since=None, types=None, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+    '''
+    Same as export_ndjson(), as an async generator. Django can only stream an async iterator under ASGI
+    ( a sync one gets read into memory first ), so the async views use this one.
+    '''
+    types = types or list(TABLES)
+    batch = [header_line(since, types)]
+    for name in types:
+        async for line in _atable_lines(name, since, using, chunk_size):
+            batch.append(line)
+            if len(batch) >= LINES_PER_WRITE:
+                yield ''.join(batch)
+                batch = []
+    if batch:
+        yield ''.join(batch)
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+'''
+NOTE:
+Fragment cache for the parts of a page that only change when the data behind them changes
+( the topics sidebar, the recent activity panel, the room cards in the feed ).
+
+Each fragment says which models it depends on, like {% fragment 'sidebar' depends 'Topic' 'Room' %}.
+Every model has a version number in the cache, and signals.py bumps it whenever a row of that model is saved or deleted.
+The versions are part of the cache key, so a write doesn't have to find and delete old fragments:
+the next render simply looks for a key that doesn't exist yet, and the old entries expire on their own.
+
+It only uses cache.get / set / add / incr, so it works with the local-memory and file based cache backends ( no Redis needed ).
+'''
+
+VERSION_PREFIX = 'fragment-version'
+CHANGED_PREFIX = 'fragment-changed'
+FRAGMENT_PREFIX = 'fragment'
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def get_cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+def _version_key(model_name):
+    return f"{VERSION_PREFIX}:{model_name.lower()}"
+
+
+def _changed_key(model_name):
+    return f"{CHANGED_PREFIX}:{model_name.lower()}"
+
+
+def versions(model_names):
+    cache = get_cache()
+    keys = [_version_key(name) for name in model_names]
+    found = cache.get_many(keys)
+    return [found.get(key, 0) for key in keys]
+
+
+def bump(model_name):
+    cache = get_cache()
+    key = _version_key(model_name)
+    # add() only sets the key when it's missing, incr() needs it to exist.
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # it expired or was evicted between add() and incr().
+            cache.set(key, 1, timeout=None)
+    # when it happened, for Last-Modified ( check conditional.py ); deletes don't leave an `updated` behind.
+    cache.set(_changed_key(model_name), time.time(), timeout=None)
+
+
+def changed_at(model_names):
+    # the unix time of the newest bump of any of these models, None when we don't know.
+    found = get_cache().get_many([_changed_key(name) for name in model_names])
+    return max(found.values(), default=None)
+
+
+def fragment_key(name, model_versions, vary_on=()):
+    vary = hashlib.md5(':'.join(str(value) for value in vary_on).encode()).hexdigest()
+    version = '.'.join(str(v) for v in model_versions)
+    return f"{FRAGMENT_PREFIX}:{name}:{version}:{vary}"
+
+
+def cached(name, model_names, vary_on, seconds, render):
+    '''
+    The html of a fragment, from the cache or from render() ( then kept for `seconds`, None for the default ).
+    {% fragment %} uses it in the django templates, fragment() in the jinja2 ones ( jinja2env.py ).
+    '''
+    key = fragment_key(name, versions(model_names), vary_on)
+    cache = get_cache()
+    html = cache.get(key)
+    record(name, hit=html is not None)
+    if html is None:
+        html = render()
+        cache.set(key, html, int(seconds) if seconds is not None else timeout())
+    return html
+
+
+def record(name, hit):
+    with _stats_lock:
+        counts = _stats.setdefault(name, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+
+
+def stats():
+    '''
+    Hits and misses per fragment name, since this process started.
+    '''
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,64 @@
+import os
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.template.defaultfilters import timesince_filter
+from django.templatetags.static import static
+from django.urls import reverse
+from jinja2 import Environment, FileSystemBytecodeCache, Undefined
+from markupsafe import Markup
+
+from . import fragments
+from .templatetags.avatars import avatar
+from .templatetags.icons import icon
+
+'''
+NOTE:
+The jinja2 environment for the hot pages ( home, room, user-profile ), the second template engine in TEMPLATES.
+
+Django templates are interpreted: every render walks the nodes of the template and resolves every {{ room.host.id }}
+by trying a dict lookup, an attribute and a list index in turn. jinja2 compiles a template to python once, so
+rendering is running that code, and the loops of the feed, the activity panel and the topics get a lot cheaper
+( `python manage.py bench_templates` shows how much ). The compiled code is kept on disk
+( JINJA2_BYTECODE_CACHE_DIR ), so a new worker doesn't compile everything again.
+
+The ported templates are in base/jinja2/ ( main.html and navbar.html too, a top level jinja2/ folder would hide
+the jinja2 package itself ), next to the django ones,
+and PAGE_TEMPLATE_ENGINES in settings.py says which engine renders which page. Keep the two versions in step.
+The tags become functions:
+    {% url 'room' room.id %}     -> {{ url('room', room.id) }}
+    {% static 'js/room.js' %}    -> {{ static('js/room.js') }}
+    {% avatar user 28 %}         -> {{ avatar(user, 28) }}
+    {% icon 'remove' %}          -> {{ icon('remove') }}
+    {% csrf_token %}             -> {{ csrf_input }}
+    {% fragment 'sidebar' depends 'Topic' vary x %} ... {% endfragment %}
+                                 -> {% call fragment('sidebar', ['Topic'], [x]) %} ... {% endcall %}
+Both engines use the same fragment cache entries, the html is the same.
+'''
+
+
+def url(name, *args):
+    return reverse(name, args=args)
+
+
+def fragment(name, depends, vary=(), timeout=None, caller=None):
+    return Markup(fragments.cached(name, depends, vary, timeout, caller))
+
+
+def environment(**options):
+    if settings.JINJA2_BYTECODE_CACHE_DIR:
+        os.makedirs(settings.JINJA2_BYTECODE_CACHE_DIR, exist_ok=True)
+    options.setdefault('bytecode_cache', FileSystemBytecodeCache(settings.JINJA2_BYTECODE_CACHE_DIR))
+    # a missing value is empty, like in the django templates ( room.topic.name of a room without a topic ).
+    options['undefined'] = Undefined
+    env = Environment(**options)
+    env.globals.update({
+        'url': url,
+        'static': static,
+        'avatar': avatar,
+        'icon': icon,
+        'fragment': fragment,
+        'get_messages': get_messages,
+    })
+    env.filters['timesince'] = timesince_filter
+    return env
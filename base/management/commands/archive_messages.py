@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from base.archive import CHUNK_SIZE, archive_messages, parse_age, to_archive
+
+
+class Command(BaseCommand):
+    help = "Moves the messages not updated for a while into the message archive ( run it from cron, like every night )."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', default='180d', help="like 180d, 12w or 36h ( a plain number is days )")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="messages per archive row")
+        parser.add_argument('--dry-run', action='store_true', help="only count what would be archived")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        try:
+            older_than = parse_age(options['older_than'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size has to be at least 1")
+        if options['dry_run']:
+            self.stdout.write(f"would archive {to_archive(older_than, using=options['database'])} messages")
+            return
+        rooms, chunks, messages = archive_messages(older_than, using=options['database'],
+                                                   chunk_size=options['chunk_size'])
+        self.stdout.write(f"archived {messages} messages of {rooms} rooms into {chunks} chunks")
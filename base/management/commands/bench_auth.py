@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from base import auth
+from base.models import User
+
+from .loadtest import percentile
+
+'''
+NOTE:
+Times the login and the session / user part of every logged in request, for each session engine
+( SESSION_ENGINES in settings.py ), with and without the cached request.user ( base/auth.py ):
+
+    python manage.py bench_auth --requests 200
+
+"login" is a POST to /login/ ( one user lookup and one password hash, check PASSWORD_HASHER ),
+"page" a GET of a page that only needs the session and the user. The queries columns count the queries on
+django_session and base_user per page request. The bench user only lives inside a transaction that is rolled back.
+'''
+
+PASSWORD = 'Bench-auth-1'
+STOCK_MIDDLEWARE = 'django.contrib.auth.middleware.AuthenticationMiddleware'
+CACHED_MIDDLEWARE = 'base.auth.CachedAuthenticationMiddleware'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.session = self.user = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'django_session' in sql:
+            self.session += 1
+        elif '"base_user"' in sql and sql.lstrip().upper().startswith('SELECT'):
+            self.user += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Times the login and the session / user lookups of a logged in request for every session engine."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="page requests per setup")
+        parser.add_argument('--logins', type=int, default=5, help="logins per setup ( each one hashes the password )")
+        parser.add_argument('--engine', action='append', dest='engines', choices=list(settings.SESSION_ENGINES),
+                            help="only these session engines ( default: all )")
+
+    def handle(self, *args, **options):
+        engines = options['engines'] or list(settings.SESSION_ENGINES)
+        self.stdout.write(f"password hasher: {get_hasher().algorithm}")
+        self.stdout.write(
+            f"{'session engine':<16}{'user cache':<12}{'login p50 ms':>14}{'page p50 ms':>13}{'page p95 ms':>13}"
+            f"{'session q':>11}{'user q':>8}"
+        )
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            user = User.objects.create_user(username='bench-auth', email='bench-auth@example.com', password=PASSWORD)
+            try:
+                for engine in engines:
+                    for cached_user in (False, True):
+                        self.run(user, engine, cached_user, options)
+            finally:
+                auth.forget_user(user.pk)
+                # never keep the bench user.
+                transaction.set_rollback(True, using=DEFAULT_DB_ALIAS)
+
+    def run(self, user, engine, cached_user, options):
+        swap = {STOCK_MIDDLEWARE: CACHED_MIDDLEWARE} if cached_user else {CACHED_MIDDLEWARE: STOCK_MIDDLEWARE}
+        middleware = [swap.get(name, name) for name in settings.MIDDLEWARE]
+        # the test client sends "Host: testserver", which ALLOWED_HOSTS would reject outside of the tests.
+        with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[engine], MIDDLEWARE=middleware,
+                               ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            client = Client()
+            logins = []
+            for _ in range(options['logins']):
+                client.logout()
+                start = time.perf_counter()
+                response = client.post(reverse('login'), {'email': user.email, 'password': PASSWORD})
+                logins.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 302:
+                    self.stderr.write(f"{engine}: the login failed ( {response.status_code} )")
+                    return
+            url = reverse('update-user')
+            client.get(url)
+            counter, pages = QueryCounter(), []
+            with connection.execute_wrapper(counter):
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    client.get(url)
+                    pages.append((time.perf_counter() - start) * 1000)
+            client.logout()
+        logins.sort()
+        pages.sort()
+        requests = options['requests'] or 1
+        self.stdout.write(
+            f"{engine:<16}{'on' if cached_user else 'off':<12}{percentile(logins, 0.5):>14.2f}"
+            f"{percentile(pages, 0.5):>13.2f}{percentile(pages, 0.95):>13.2f}"
+            f"{counter.session / requests:>11.2f}{counter.user / requests:>8.2f}"
+        )
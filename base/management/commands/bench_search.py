@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from base import roomcards
+from base.models import Room, Topic, User
+from base.search import QLookupBackend, get_backend
+
+# a few thousand made up words, so the benchmark has rare terms as well as very common ones.
+RARE_WORDS = [f"{a}{b}{c}" for a in ("ka", "lo", "mi", "su", "te", "vo") for b in ("ran", "mel", "dov", "pix", "qua")
+              for c in range(100)]
+
+WORDS = (
+    "python django flask rust golang algebra calculus physics chemistry biology history spanish french "
+    "react vue svelte docker kubernetes linux networking databases postgres sqlite statistics economics"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the full text search backend against the old icontains Q-lookup search. "
+        "With --rooms it first adds that many synthetic rooms inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=0, help="synthetic rooms to add before measuring")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--query', action='append', dest='queries',
+                            help="search term to time, can be given more than once")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        queries = options['queries'] or ['py', 'python', 'kubernetes linux', 'miqua42', 'vopix9']
+        with transaction.atomic(using=using):
+            if options['rooms']:
+                self.seed(options['rooms'], using)
+            backends = [('q-lookup', QLookupBackend(using)), ('index', get_backend(using))]
+            self.stdout.write(f"{'query':<20}{'backend':<12}{'hits':>8}{'p50 ms':>10}{'p95 ms':>10}")
+            for q in queries:
+                for label, backend in backends:
+                    timings = []
+                    for _ in range(options['iterations']):
+                        start = time.perf_counter()
+                        hits = backend.search_rooms(q)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    timings.sort()
+                    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+                    self.stdout.write(
+                        f"{q:<20}{label:<12}{len(hits):>8}{statistics.median(timings):>10.2f}{p95:>10.2f}"
+                    )
+            # never keep the synthetic rows.
+            transaction.set_rollback(True, using=using)
+
+    def seed(self, count, using):
+        rng = random.Random(0)
+        host, created = User.objects.using(using).get_or_create(
+            email='bench-search@example.com', defaults={'username': 'bench-search'}
+        )
+        topics = [Topic.objects.using(using).get_or_create(name=word.title())[0] for word in WORDS]
+        rooms = [
+            Room(
+                host=host,
+                topic=rng.choice(topics),
+                name=' '.join(rng.choices(WORDS, k=3)),
+                description=' '.join(rng.choices(WORDS, k=20) + rng.choices(RARE_WORDS, k=2)),
+            )
+            for _ in range(count)
+        ]
+        Room.objects.using(using).bulk_create(rooms, batch_size=1000)
+        # bulk_create skips the signals, so the index ( and the room cards ) are built in one go.
+        get_backend(using).rebuild()
+        roomcards.refresh([room.id for room in rooms], using)
+        self.stdout.write(f"added {count} synthetic rooms")
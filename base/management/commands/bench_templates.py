@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+from base.models import Message, Room, Topic, User
+from base.roomcards import Card
+
+'''
+NOTE:
+How long the loops of the hot pages take to render, with each template engine ( TEMPLATES in settings.py, and
+base/jinja2env.py for jinja2, which has to be installed ):
+
+    python manage.py bench_templates --rows 50 500 5000
+
+feed is feed_component.html with that many room cards, activity is activity_component.html with that many messages
+and topics is topics_component.html with that many topics. The rows are made up in memory, so only the rendering
+is timed, and the fragment cache is a dummy one here, so every render does all of the work.
+'''
+
+COMPONENTS = {
+    'feed': 'base/feed_component.html',
+    'activity': 'base/activity_component.html',
+    'topics': 'base/topics_component.html',
+}
+BENCH_CACHES = {**settings.CACHES, 'bench-templates': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def make_context(rows):
+    now = timezone.now()
+    users = [User(id=i, username=f"user{i}", email=f"user{i}@example.com", avatar='avatar.svg')
+             for i in range(1, 51)]
+    rooms = [Room(id=i, name=f"room {i}") for i in range(1, 51)]
+    cards = [
+        Card({'id': i, 'name': f"room {i}", 'host_id': i % 50 + 1, 'host_username': f"user{i % 50 + 1}",
+              'host_avatar': 'avatar.svg', 'topic_id': i % 20 + 1, 'topic_name': f"topic {i % 20}",
+              'participant_count': i % 30, 'created': now, 'updated': now})
+        for i in range(1, rows + 1)
+    ]
+    messages = [
+        Message(id=i, user=users[i % 50], room=rooms[i % 50], body=f"message number {i}", created=now)
+        for i in range(1, rows + 1)
+    ]
+    topics = [Topic(id=i, name=f"topic {i}", room_count=rows - i) for i in range(1, rows + 1)]
+    return {'rooms': cards, 'room_messages': messages, 'topics': topics}
+
+
+class Command(BaseCommand):
+    help = "Times the feed, activity and topics components with the django and the jinja2 template engines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[50, 500, 5000])
+        parser.add_argument('--repeat', type=int, default=5, help="renders per measurement, the median is shown")
+
+    def handle(self, *args, **options):
+        names = [name for name in ('django', 'jinja2') if name in [engine.name for engine in engines.all()]]
+        if 'jinja2' not in names:
+            self.stderr.write("jinja2 isn't installed ( `pip install jinja2` ), only timing the django templates.")
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.resolver_match = resolve('/')
+
+        self.stdout.write(f"{'rows':>6}  {'component':<10}" + ''.join(f"{name + ' ms':>12}" for name in names)
+                          + (f"{'speedup':>9}" if len(names) == 2 else ''))
+        with override_settings(CACHES=BENCH_CACHES, FRAGMENT_CACHE_ALIAS='bench-templates'):
+            for rows in options['rows']:
+                context = make_context(rows)
+                for component, template_name in COMPONENTS.items():
+                    timings = [self.time(engines[name].get_template(template_name), context, request,
+                                         options['repeat']) for name in names]
+                    line = f"{rows:>6}  {component:<10}" + ''.join(f"{ms:>12.2f}" for ms in timings)
+                    if len(timings) == 2:
+                        line += f"{timings[0] / timings[1]:>8.1f}x"
+                    self.stdout.write(line)
+
+    def time(self, template, context, request, repeat):
+        # the first render compiles / warms up whatever the engine caches.
+        template.render(context, request)
+        durations = []
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            template.render(context, request)
+            durations.append((time.perf_counter() - start) * 1000)
+        return statistics.median(durations)
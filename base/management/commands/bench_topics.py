@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from base import topicindex
+from base.models import Topic
+
+SYLLABLES = "ka lo mi su te vo ran mel dov pix qua py dja go rus alg cal phy che bio net dat sta eco".split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the topic autocomplete ( topicindex.py ) and the trending topics. "
+        "With --topics it first adds that many synthetic topics inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topics', type=int, default=100000, help="synthetic topics to add before measuring")
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--prefix', action='append', dest='prefixes',
+                            help="prefix to time, can be given more than once")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        prefixes = options['prefixes'] or ['', 'p', 'py', 'kal', 'quadov', 'zzz']
+        try:
+            with transaction.atomic(using=using):
+                if options['topics']:
+                    self.seed(options['topics'], using)
+                topicindex.reset()
+                start = time.perf_counter()
+                index = topicindex.get_index()
+                self.stdout.write(f"loaded {len(index.topics)} topics in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+                self.stdout.write(f"{'prefix':<20}{'hits':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+                for prefix in prefixes:
+                    timings, hits = self.time(lambda: topicindex.complete(prefix), options['iterations'])
+                    self.report(repr(prefix), hits, timings)
+                # what a room created or deleted somewhere costs the index ( signals.py calls refresh() ).
+                rng = random.Random(1)
+                topic_ids = list(index.topics)
+                timings = []
+                for _ in range(options['iterations']):
+                    topic_id = rng.choice(topic_ids)
+                    name, room_count = index.topics[topic_id][:2]
+                    found, took = self.time_once(
+                        lambda: index.upsert(topic_id, name, max(room_count + rng.choice((-1, 1)), 0))
+                    )
+                    timings.append(took)
+                self.report("update", 1, timings)
+                timings, hits = self.time(lambda: topicindex.complete('p'), options['iterations'])
+                self.report("'p' after updates", hits, timings)
+
+                cache.delete(topicindex.TRENDING_CACHE_KEY)
+                found, took = self.time_once(topicindex.trending)
+                self.report("trending ( cold )", len(found), [took])
+                timings, hits = self.time(topicindex.trending, options['iterations'])
+                self.report("trending", hits, timings)
+                # never keep the synthetic rows.
+                transaction.set_rollback(True, using=using)
+        finally:
+            # nor the index or the cached trending topics built from them.
+            topicindex.reset()
+            cache.delete(topicindex.TRENDING_CACHE_KEY)
+
+    def time_once(self, call):
+        start = time.perf_counter()
+        found = call()
+        return found, (time.perf_counter() - start) * 1000
+
+    def time(self, call, iterations):
+        timings, hits = [], 0
+        for _ in range(iterations):
+            found, took = self.time_once(call)
+            timings.append(took)
+            hits = len(found)
+        return timings, hits
+
+    def report(self, label, hits, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        self.stdout.write(
+            f"{label:<20}{hits:>8}{statistics.median(timings):>10.3f}{p95:>10.3f}{timings[-1]:>10.3f}"
+        )
+
+    def seed(self, count, using):
+        rng = random.Random(0)
+        topics = [
+            Topic(
+                name=' '.join(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))).title() for _ in range(rng.randint(1, 3)))
+                + f" {i}",
+                # a few topics with many rooms and a long tail with hardly any, like real ones.
+                room_count=int(rng.paretovariate(1.2)) - 1,
+            )
+            for i in range(count)
+        ]
+        # bulk_create skips the signals, the index is loaded from the table afterwards.
+        Topic.objects.using(using).bulk_create(topics, batch_size=1000)
+        self.stdout.write(f"added {count} synthetic topics")
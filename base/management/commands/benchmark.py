@@ -0,0 +1,239 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import django
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from base import metrics
+from base.models import Message, Room, Task, User
+
+from .loadtest import percentile
+
+'''
+NOTE:
+Times the main pages in-process, with the test client ( WSGI ) and the async test client ( ASGI ), so it needs
+no running server and the numbers only depend on the code and the data:
+
+    python manage.py seed_studybud --users 2000 --rooms 10000 --messages 200000
+    python manage.py benchmark --output before.json
+    ... change something ...
+    python manage.py benchmark --output after.json --compare before.json
+
+For every page it reports p50 / p95 / p99 latency, the queries per request ( and how many of them were repeats,
+from MetricsMiddleware ) and the peak memory a request allocates ( tracemalloc ). The timings come from a run
+without tracemalloc, it slows python down a lot.
+
+The message POST really posts messages, they are deleted again at the end.
+With STUDYBUD_ASYNC_VIEWS=1 the ASGI client goes through the async views, otherwise through the sync ones.
+'''
+
+CLIENTS = ('wsgi', 'asgi')
+MEMORY_SAMPLES = 5
+
+
+def summarize(latencies_ms):
+    latencies_ms = sorted(latencies_ms)
+    return {
+        'p50_ms': round(percentile(latencies_ms, 0.50), 2),
+        'p95_ms': round(percentile(latencies_ms, 0.95), 2),
+        'p99_ms': round(percentile(latencies_ms, 0.99), 2),
+        'mean_ms': round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else 0.0,
+    }
+
+
+def query_stats(view):
+    # the numbers MetricsMiddleware recorded since the last registry.reset().
+    requests, duplicates, histograms = metrics.registry.snapshot()
+    if ('db_queries', view) not in histograms:
+        return None, None
+    buckets, counts, total, count = histograms[('db_queries', view)]
+    return round(total / count, 2), round(duplicates.get(view, 0) / count, 2)
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the main pages in-process and prints p50/p95/p99, queries and peak memory per page as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="timed requests per page and client")
+        parser.add_argument('--warmup', type=int, default=10, help="untimed requests first ( fills the caches )")
+        parser.add_argument('--client', action='append', dest='clients', choices=CLIENTS,
+                            help="wsgi and / or asgi ( default: both )")
+        parser.add_argument('--page', action='append', dest='pages', help="only these pages ( default: all )")
+        parser.add_argument('--cold-cache', action='store_true', help="clear the cache before every request")
+        parser.add_argument('--output', '-o', help="write the JSON here instead of stdout")
+        parser.add_argument('--compare', help="an earlier JSON result to print the changes against")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1")
+        self.room, self.user = self.pick_room_and_user()
+        scenarios = self.scenarios()
+        if options['pages']:
+            unknown = set(options['pages']) - {name for name, *rest in scenarios}
+            if unknown:
+                raise CommandError(f"unknown page(s) {', '.join(sorted(unknown))}, "
+                                   f"pick from {', '.join(name for name, *rest in scenarios)}")
+            scenarios = [scenario for scenario in scenarios if scenario[0] in options['pages']]
+
+        self.options = options
+        first_message_id = Message.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        first_task_id = Task.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        results = {}
+        try:
+            # the test clients send "Host: testserver", which ALLOWED_HOSTS would reject outside of the tests.
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for client_name in options['clients'] or CLIENTS:
+                    results[client_name] = {
+                        name: self.run_scenario(client_name, name, view, method, path, data)
+                        for name, view, method, path, data in scenarios
+                    }
+        finally:
+            # leave the data like we found it.
+            Message.objects.filter(id__gt=first_message_id).delete()
+            Task.objects.filter(id__gt=first_task_id).delete()
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'async_views': settings.ASYNC_VIEWS,
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'cold_cache': options['cold_cache'],
+                'rows': {'users': User.objects.count(), 'rooms': Room.objects.count(),
+                         'messages': Message.objects.count()},
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                out.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as previous:
+                # with the JSON on stdout, the comparison goes to stderr so the JSON stays usable.
+                self.compare(json.load(previous), report, self.stdout if options['output'] else self.stderr)
+
+    def pick_room_and_user(self):
+        # the busiest room and one of its participants, so the room page and the message POST are the heavy case.
+        room = Room.objects.order_by('-message_count', '-id').first()
+        user = room and (room.participants.order_by('id').first() or room.host)
+        if user is None:
+            raise CommandError("there is nothing to benchmark, run `python manage.py seed_studybud` first")
+        return room, user
+
+    def scenarios(self):
+        room_path = reverse('room', args=[self.room.id])
+        return [
+            # ( name, url name MetricsMiddleware labels it with, method, path, POST data )
+            ('home', 'home', 'get', reverse('home'), None),
+            ('room', 'room', 'get', room_path, None),
+            ('profile', 'user-profile', 'get', reverse('user-profile', args=[self.user.id]), None),
+            ('topics', 'topics', 'get', reverse('topics'), None),
+            ('api-rooms', 'api-rooms', 'get', reverse('api-rooms'), None),
+            ('post-message', 'room', 'post', room_path, {'body': "benchmark message"}),
+        ]
+
+    def make_client(self, client_name):
+        client_class = AsyncClient if client_name == 'asgi' else Client
+        client = client_class()
+        client.force_login(self.user)
+        return client
+
+    def run_scenario(self, client_name, name, view, method, path, data):
+        client = self.make_client(client_name)
+        request = getattr(client, method)
+        args = (path, data) if data is not None else (path,)
+        run = self.run_async if client_name == 'asgi' else self.run_sync
+
+        statuses = {}
+        run(request, args, self.options['warmup'], statuses)
+        statuses.clear()
+        metrics.registry.reset()
+        latencies = run(request, args, self.options['requests'], statuses)
+        queries, duplicates = query_stats(view)
+
+        tracemalloc.start()
+        try:
+            peaks = []
+            for _ in range(min(MEMORY_SAMPLES, self.options['requests'])):
+                tracemalloc.reset_peak()
+                run(request, args, 1, {})
+                peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        result = summarize(latencies)
+        result.update({
+            'path': path,
+            'queries_per_request': queries,
+            'duplicate_queries_per_request': duplicates,
+            'peak_memory_kb': round(max(peaks) / 1024, 1),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        })
+        if any(code >= 400 for code in statuses):
+            self.stderr.write(f"{client_name} {name}: got {result['statuses']} from {path}")
+        return result
+
+    def run_sync(self, request, args, count, statuses):
+        latencies = []
+        for _ in range(count):
+            if self.options['cold_cache']:
+                cache.clear()
+            start = time.perf_counter()
+            response = request(*args)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return latencies
+
+    def run_async(self, request, args, count, statuses):
+        # async_to_sync and not asyncio.run: the database work of the ASGI handler then runs in this thread,
+        # on the same connection as the rest of the command.
+        async def requests():
+            latencies = []
+            for _ in range(count):
+                if self.options['cold_cache']:
+                    cache.clear()
+                start = time.perf_counter()
+                response = await request(*args)
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            return latencies
+        return async_to_sync(requests)()
+
+    def compare(self, before, after, out):
+        out.write(f"compared with {before['meta'].get('commit') or 'the earlier run'}")
+        out.write(f"{'client':<6} {'page':<14}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'queries':>12}")
+        for client_name, pages in after['results'].items():
+            for name, new in pages.items():
+                old = before['results'].get(client_name, {}).get(name)
+                if old is None:
+                    continue
+                cells = []
+                for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                    change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                    cells.append(f"{old[key]:>6} > {new[key]:<6}{change:+4.0f}%")
+                out.write(f"{client_name:<6} {name:<14}" + ''.join(f"{cell:>18}" for cell in cells)
+                          + f"{old['queries_per_request']!s:>5} > {new['queries_per_request']!s:<4}")
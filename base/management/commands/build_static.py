@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from base import assets
+
+
+class Command(BaseCommand):
+    help = "Builds the icon sprite and collects the static files into STATIC_ROOT, hashed and precompressed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help="empty STATIC_ROOT first")
+
+    def handle(self, *args, **options):
+        sprite = assets.write_sprite()
+        self.stdout.write(f"wrote {sprite}")
+        call_command('collectstatic', interactive=False, clear=options['clear'], verbosity=options['verbosity'])
+        if not settings.STATIC_MANIFEST:
+            self.stdout.write(
+                "STATIC_MANIFEST is off ( DEBUG ), so the files were only copied: "
+                "set STUDYBUD_STATIC_MANIFEST=1 for hashed names and .gz / .br copies"
+            )
+        elif assets.brotli is None:
+            self.stdout.write("brotli isn't installed, only .gz copies were made")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from base import export
+
+
+class Command(BaseCommand):
+    help = "Writes topics, users ( public fields ), rooms and messages as NDJSON, like /api/export/ does."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="only rooms and messages updated after this date / datetime")
+        parser.add_argument('--types', help=f"comma separated, any of {', '.join(export.TABLES)} ( default: all )")
+        parser.add_argument('--output', '-o', help="file to write to ( default: stdout )")
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        try:
+            since = export.parse_since(options['since'])
+            types = export.parse_types(options['types'])
+        except export.InvalidExport as exc:
+            raise CommandError(str(exc))
+        chunks = export.export_ndjson(since, types, using=options['database'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                out.writelines(chunks)
+        else:
+            for chunk in chunks:
+                # ending='' --- the chunks already end with a newline.
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+'''
+NOTE:
+A small HTTP load generator to compare the sync and async views.
+
+Start the same code twice under an ASGI server, once with the sync views and once with the async ones:
+
+    STUDYBUD_ASYNC_VIEWS=0 uvicorn studybud.asgi:application --port 8000
+    STUDYBUD_ASYNC_VIEWS=1 uvicorn studybud.asgi:application --port 8001
+    python manage.py loadtest --target sync=http://127.0.0.1:8000 --target async=http://127.0.0.1:8001 \
+        --path / --path /api/rooms/ --concurrency 100 --requests 2000
+
+The pages behind login ( room, profile ) need --cookie "sessionid=..." from a logged in browser.
+Every client keeps one keep-alive connection open, like a browser would.
+'''
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Client:
+    def __init__(self, base_url, cookie=None, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.secure = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.secure else 80)
+        self.prefix = parts.path.rstrip('/')
+        self.cookie = cookie
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def connect(self):
+        context = ssl.create_default_context() if self.secure else None
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=context)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            await self.connect()
+        lines = [f"GET {self.prefix}{path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        if self.cookie:
+            lines.append(f"Cookie: {self.cookie}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        await self.writer.drain()
+        return await asyncio.wait_for(self.read_response(), self.timeout)
+
+    async def read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status
+
+
+async def run_target(base_url, paths, concurrency, total, cookie, timeout):
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+    latencies, errors, statuses = [], 0, {}
+
+    async def worker():
+        nonlocal errors
+        client = Client(base_url, cookie, timeout)
+        try:
+            while True:
+                try:
+                    path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    status = await client.get(path)
+                except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    await client.close()
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'url': base_url,
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = "Load tests one or more running servers ( like the sync and the async views ) and compares throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help="label=base url, like async=http://127.0.0.1:8001 ( can be given more than once )")
+        parser.add_argument('--path', action='append', dest='paths', help="path to request ( default: / )")
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=2000, help="requests per target")
+        parser.add_argument('--cookie', help='Cookie header to send, like "sessionid=..."')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--json', action='store_true', help="print the results as JSON")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            label, sep, url = target.partition('=')
+            if not sep or not url.startswith(('http://', 'https://')):
+                raise CommandError(f"--target must look like label=http://host:port, got {target!r}")
+            targets.append((label, url))
+        paths = options['paths'] or ['/']
+
+        results = {}
+        for label, url in targets:
+            results[label] = asyncio.run(run_target(
+                url, paths, options['concurrency'], options['requests'], options['cookie'], options['timeout']
+            ))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{len(paths)} path(s), {options['concurrency']} concurrent clients")
+        self.stdout.write(f"{'target':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}  statuses")
+        for label, result in results.items():
+            self.stdout.write(
+                f"{label:<10}{result['requests_per_second']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                f"{result['p99_ms']:>10}{result['errors']:>8}  {result['statuses']}"
+            )
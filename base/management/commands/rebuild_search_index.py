@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from base.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Drops and rebuilds the room and topic search index from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['database'])
+        with transaction.atomic(using=options['database']):
+            backend.install()
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search index with {type(backend).__name__}."))
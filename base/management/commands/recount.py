@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from base.counters import recount
+from base.roomcards import rebuild
+
+
+class Command(BaseCommand):
+    help = ("Recomputes Topic.room_count, Room.participant_count and Room.message_count and repairs any drift, "
+            "then writes the room cards of the feed again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            fixed = recount(using=options['database'])
+            cards = rebuild(using=options['database'])
+        for label, rows in fixed.items():
+            self.stdout.write(f"{label}: fixed {rows} row(s)")
+        self.stdout.write(f"room cards: rebuilt {cards}")
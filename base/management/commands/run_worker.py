@@ -0,0 +1,53 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+
+from base import ratelimit, taskqueue
+
+# seconds between two clean ups of the finished tasks and the full rate limit buckets.
+PURGE_EVERY = 3600
+
+
+class Command(BaseCommand):
+    help = "Runs the background tasks ( check base/taskqueue.py ). Start one or more of these next to the web server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="run the due tasks once and exit ( for cron )")
+        parser.add_argument('--batch', type=int, default=20, help="tasks to claim at a time")
+        parser.add_argument('--sleep', type=float, default=1.0, help="seconds to wait when there's nothing to do")
+        parser.add_argument('--purge-after', type=int, default=7,
+                            help="days to keep finished tasks ( and so their idempotency keys )")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def purge(self, options):
+        using = options['database']
+        purged = taskqueue.purge(datetime.timedelta(days=options['purge_after']), using=using)
+        if purged:
+            self.stdout.write(f"purged {purged} finished task(s)")
+        buckets = ratelimit.purge(using=using)
+        if buckets:
+            self.stdout.write(f"purged {buckets} full rate limit bucket(s)")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        self.purge(options)
+        purged_at = time.monotonic()
+        try:
+            while True:
+                # like a request: don't keep a connection the database has already closed.
+                close_old_connections()
+                if time.monotonic() - purged_at > PURGE_EVERY:
+                    self.purge(options)
+                    purged_at = time.monotonic()
+                succeeded, failed = taskqueue.run_pending(options['batch'], using=using)
+                if succeeded or failed:
+                    self.stdout.write(f"ran {succeeded + failed} task(s), {failed} failed")
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            # a task that was running when we stopped is picked up again after taskqueue.LOCK_TIMEOUT.
+            self.stdout.write("stopped")
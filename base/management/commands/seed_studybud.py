@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from base import seed
+
+
+class Command(BaseCommand):
+    help = "Bulk loads made up users, rooms and messages for benchmarking ( check base/seed.py )."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--rooms', type=int, default=5000)
+        parser.add_argument('--messages', type=int, default=100000)
+        parser.add_argument('--topics', type=int, default=20, help=f"at most {len(seed.WORDS)}")
+        parser.add_argument('--seed', type=int, default=0, help="the same seed makes the same data")
+        parser.add_argument('--prefix', default='seed', help="usernames are <prefix><number>")
+        parser.add_argument('--batch-size', type=int, default=seed.BATCH_SIZE)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic(using=options['database']):
+            written = seed.seed(
+                options['users'], options['rooms'], options['messages'], topics=options['topics'],
+                seed=options['seed'], prefix=options['prefix'], using=options['database'],
+                batch_size=options['batch_size'],
+            )
+        for label, rows in written.items():
+            self.stdout.write(f"{label}: {rows}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded in {time.perf_counter() - start:.1f}s, every seeded user's password is {seed.PASSWORD!r}."
+        ))
@@ -0,0 +1,31 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from base import avatars, fragments, roomcards
+from base.models import User
+
+
+class Command(BaseCommand):
+    help = "Stores the avatars uploaded before avatars.py existed under their content hash, with thumbnails."
+
+    def handle(self, *args, **options):
+        converted = missing = 0
+        for user in User.objects.exclude(avatar='').exclude(avatar__startswith='avatars/').only('id', 'avatar'):
+            name = user.avatar.name
+            if name.endswith('.svg'):
+                # the default avatar.svg ( a vector image ) is already tiny.
+                continue
+            if not default_storage.exists(name):
+                missing += 1
+                self.stderr.write(f"user {user.id}: {name} is missing")
+                continue
+            with default_storage.open(name) as file:
+                stored = avatars.store(file)
+            # update() skips the signals, store() already did the work of signals.store_avatar.
+            User.objects.filter(id=user.id).update(avatar=stored)
+            user.avatar = stored
+            roomcards.update_host(user)
+            converted += 1
+        if converted:
+            fragments.bump('User')
+        self.stdout.write(f"converted {converted} avatar(s), {missing} missing")
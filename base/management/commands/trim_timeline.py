@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from base.timeline import TIMELINE_LENGTH, trim
+
+
+class Command(BaseCommand):
+    help = "Cuts every user's activity timeline back to the newest entries ( run it from cron, like every hour )."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--length', type=int, default=TIMELINE_LENGTH, help="entries to keep per user")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        deleted = trim(options['length'], using=options['database'])
+        self.stdout.write(f"deleted {deleted} timeline entries")
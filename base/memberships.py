@@ -0,0 +1,43 @@
+from . import unread
+from .models import Membership
+
+'''
+NOTE:
+"Is this user a participant of this room?", asked a few times while handling one request
+( the room page shows a Leave button, posting a message joins the room when needed ).
+
+The answer is kept on the request, so it costs at most one query per room per request, and none at all when the
+page already fetched it with the room ( queries.room_detail annotates is_member, views.room passes it to remember() ).
+Joining happens in Room.post_message() ( models.py ), views.room remembers it afterwards. leave() keeps the
+remembered answer up to date itself.
+'''
+
+REQUEST_ATTR = '_studybud_memberships'
+
+
+def _remembered(request):
+    if not hasattr(request, REQUEST_ATTR):
+        setattr(request, REQUEST_ATTR, {})
+    return getattr(request, REQUEST_ATTR)
+
+
+def remember(request, room_id, is_member):
+    _remembered(request)[int(room_id)] = bool(is_member)
+
+
+def is_member(request, room_id):
+    if not request.user.is_authenticated:
+        return False
+    remembered = _remembered(request)
+    room_id = int(room_id)
+    if room_id not in remembered:
+        remembered[room_id] = Membership.objects.filter(user_id=request.user.id, room_id=room_id).exists()
+    return remembered[room_id]
+
+
+def leave(request, room):
+    # remove() goes through m2m_changed like add(), so the participant counter ( signals.py ) follows.
+    if is_member(request, room.id):
+        room.participants.remove(request.user)
+        remember(request, room.id, False)
+        unread.expire([request.user.id])
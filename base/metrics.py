@@ -0,0 +1,220 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+'''
+NOTE:
+Per view performance numbers: how long every page takes, how much of that is the database, how many queries
+it runs and how many of those are repeats of a query it already ran ( the usual sign of an N+1 ).
+
+MetricsMiddleware measures every request and labels it with the url name ( home, room, user-profile, api-rooms ... ).
+    - every response gets a Server-Timing header, the browser's dev tools show it in the network tab.
+    - /metrics shows the totals in the Prometheus text format ( check views.metricsPage ).
+    - a request slower than METRICS_SLOW_REQUEST_MS logs the SQL it ran, with the time of every query.
+
+Queries are seen through a wrapper on every database connection ( install(), connected in signals.py ).
+It finds the request it belongs to through a ContextVar, so it also works for the async views, whose queries
+run in another thread ( sync_to_async copies the context along ).
+
+The numbers live in the memory of each process; with several workers, Prometheus scrapes and adds them up per process.
+'''
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+# a slow request logs at most this many statements.
+MAX_LOGGED_QUERIES = 100
+
+_current = ContextVar('studybud_metrics_request', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}  # ( view, status ) -> count
+            self.duplicates = {}  # view -> count
+            self.histograms = {}  # ( metric, view ) -> Histogram
+
+    def _histogram(self, metric, view, buckets):
+        key = (metric, view)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        return self.histograms[key]
+
+    def record(self, view, status, seconds, db_seconds, queries, duplicates):
+        with self.lock:
+            self.requests[(view, status)] = self.requests.get((view, status), 0) + 1
+            self.duplicates[view] = self.duplicates.get(view, 0) + duplicates
+            self._histogram('request_duration_seconds', view, DURATION_BUCKETS).observe(seconds)
+            self._histogram('db_duration_seconds', view, DURATION_BUCKETS).observe(db_seconds)
+            self._histogram('db_queries', view, QUERY_BUCKETS).observe(queries)
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self.histograms.items()}
+            return dict(self.requests), dict(self.duplicates), histograms
+
+
+registry = Registry()
+
+
+class RequestRecorder:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}  # sql -> how many times it ran
+        self.log = []  # ( seconds, sql ) for the slow request log
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_seconds += elapsed
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+            if len(self.log) < MAX_LOGGED_QUERIES:
+                self.log.append((elapsed, sql))
+
+    @property
+    def duplicates(self):
+        # the same SQL ( with other parameters ) over and over is what an N+1 looks like.
+        return sum(count - 1 for count in self.statements.values())
+
+
+def _wrapper(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection):
+    # connection_created runs again after a reconnect, the wrapper only needs to be there once.
+    if _wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_wrapper)
+
+
+def server_timing(seconds, recorder):
+    db_ms = recorder.db_seconds * 1000
+    return (f'total;dur={seconds * 1000:.1f}, db;dur={db_ms:.1f};desc="{recorder.queries} queries", '
+            f'app;dur={max(seconds * 1000 - db_ms, 0):.1f}')
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder, start = RequestRecorder(), time.perf_counter()
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        recorder, start = RequestRecorder(), time.perf_counter()
+        token = _current.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    def finish(self, request, response, recorder, seconds):
+        view = getattr(request.resolver_match, 'url_name', None) or 'unresolved'
+        registry.record(view, response.status_code, seconds, recorder.db_seconds, recorder.queries,
+                        recorder.duplicates)
+        response['Server-Timing'] = server_timing(seconds, recorder)
+        if seconds * 1000 >= settings.METRICS_SLOW_REQUEST_MS and random.random() < settings.METRICS_SLOW_SAMPLE_RATE:
+            log_slow_request(request, view, seconds, recorder)
+        return response
+
+
+def log_slow_request(request, view, seconds, recorder):
+    lines = [f"slow request: {request.method} {request.get_full_path()} ( {view} ) took {seconds * 1000:.0f}ms, "
+             f"{recorder.queries} queries in {recorder.db_seconds * 1000:.0f}ms, {recorder.duplicates} duplicates"]
+    lines += [f"  {elapsed * 1000:7.1f}ms  {sql}" for elapsed, sql in recorder.log]
+    if recorder.queries > len(recorder.log):
+        lines.append(f"  ... and {recorder.queries - len(recorder.log)} more")
+    logger.warning('\n'.join(lines))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+HELP = {
+    'request_duration_seconds': "Time spent on a request, by url name.",
+    'db_duration_seconds': "Time a request spent waiting for the database.",
+    'db_queries': "Number of SQL queries per request.",
+}
+
+
+def render(extra=()):
+    '''
+    Everything in the Prometheus text format. `extra` are more ( name, type, help, [( labels, value )] ) to add.
+    '''
+    requests, duplicates, histograms = registry.snapshot()
+    out = ['# HELP studybud_requests_total Requests, by url name and status code.',
+           '# TYPE studybud_requests_total counter']
+    for (view, status), count in sorted(requests.items()):
+        out.append(f'studybud_requests_total{_labels(view=view, status=status)} {count}')
+    out += ['# HELP studybud_duplicate_queries_total Queries that repeated an earlier query of the same request.',
+            '# TYPE studybud_duplicate_queries_total counter']
+    for view, count in sorted(duplicates.items()):
+        out.append(f'studybud_duplicate_queries_total{_labels(view=view)} {count}')
+    for metric, help_text in HELP.items():
+        out += [f'# HELP studybud_{metric} {help_text}', f'# TYPE studybud_{metric} histogram']
+        for (name, view), (buckets, counts, total, count) in sorted(histograms.items()):
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                out.append(f'studybud_{metric}_bucket{_labels(view=view, le=bound)} {cumulative}')
+            out.append(f'studybud_{metric}_sum{_labels(view=view)} {total}')
+            out.append(f'studybud_{metric}_count{_labels(view=view)} {count}')
+    for name, kind, help_text, samples in extra:
+        out += [f'# HELP studybud_{name} {help_text}', f'# TYPE studybud_{name} {kind}']
+        out += [f'studybud_{name}{_labels(**labels)} {value}' for labels, value in samples]
+    return '\n'.join(out) + '\n'
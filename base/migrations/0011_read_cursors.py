@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def start_read_cursors(apps, schema_editor):
+    # the participants from before read cursors existed start as "read up to now",
+    # otherwise every message ever posted in their rooms would show up as unread.
+    Membership = apps.get_model('base', 'Membership')
+    Message = apps.get_model('base', 'Message')
+    using = schema_editor.connection.alias
+    newest = (Message.objects.using(using).filter(room_id=OuterRef('room_id')).order_by()
+              .values('room_id').annotate(newest=Max('id')).values('newest'))
+    Membership.objects.using(using).filter(last_read_message_id=0).update(
+        last_read_message_id=Coalesce(Subquery(newest), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_membership'),
+    ]
+
+    operations = [
+        migrations.RunPython(start_read_cursors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+def fill_room_cards(apps, schema_editor):
+    from base.roomcards import rebuild
+    rebuild(apps, using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_rate_limit_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomCard',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('host_id', models.BigIntegerField(null=True)),
+                ('host_username', models.CharField(blank=True, max_length=50)),
+                ('host_avatar', models.CharField(blank=True, max_length=100)),
+                ('topic_id', models.BigIntegerField(null=True)),
+                ('topic_name', models.CharField(blank=True, max_length=200)),
+                ('participant_count', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField()),
+                ('updated', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-updated', '-id'], name='card_updated_id_idx'), models.Index(fields=['host_id', '-updated', '-id'], name='card_host_updated_id_idx'), models.Index(fields=['-participant_count', '-id'], name='card_popular_idx'), models.Index(fields=['topic_id'], name='card_topic_idx')],
+            },
+        ),
+        migrations.RunPython(fill_room_cards, migrations.RunPython.noop),
+    ]
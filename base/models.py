@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 
 
@@ -14,14 +14,66 @@ class User(AbstractUser):
     # this will now set the email as username, so while logging in we need the email and not the username.
     REQUIRED_FIELDS = []
 
-class Topic(models.Model):
+class CounterFieldsMixin:
+    '''
+    NOTE:
+    The counter columns ( like Topic.room_count ) are only ever changed with "count = count + 1" updates from signals.py.
+    A normal save() writes every column, so saving a topic we loaded a while ago would put its old count back.
+    Here save() leaves the counter_fields out of the UPDATE, unless update_fields is given explicitly.
+    '''
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class TopicQuerySet(models.QuerySet):
+    def popular(self):
+        return self.order_by('-room_count', 'name')
+
+
+class Topic(CounterFieldsMixin, models.Model):
     # this is the parent of Room class
     name = models.CharField(max_length=200)
+    room_count = models.PositiveIntegerField(default=0, editable=False)
+    # people following a topic get its new messages in their timeline ( check TimelineEntry ).
+    followers = models.ManyToManyField(User, related_name='followed_topics', blank=True)
+    '''
+    NOTE:
+    room_count is a denormalized counter. Instead of running a COUNT over the rooms table every time we show a topic,
+    signals.py adds or removes 1 whenever a room is created, deleted or moved to another topic.
+    If it ever drifts, `python manage.py recount` fixes it.
+    '''
+
+    objects = TopicQuerySet.as_manager()
+    counter_fields = ('room_count',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-room_count', 'name'], name='topic_room_count_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.name
 
-class Room(models.Model):
+class RoomQuerySet(models.QuerySet):
+    def for_feed(self):
+        '''
+        NOTE:
+        feed_component.html touches room.host, room.topic and the number of participants for every room.
+        Without this every card would cost three extra queries (host, topic and a COUNT), so a page with
+        100 rooms would run 300+ queries. select_related() joins host and topic into the same query and
+        the participant count is a column on the room itself ( participant_count ), so the whole feed is fetched in one go.
+        '''
+        return self.select_related('host', 'topic')
+
+
+class Room(CounterFieldsMixin, models.Model):
     host = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     topic = models.ForeignKey(Topic, on_delete=models.SET_NULL, null=True)
     '''
@@ -44,7 +96,12 @@ class Room(models.Model):
     # null = True means, it can be left blank while creating the database.
     # blank = True, means it can be left blank while filling up the form.
     
-    participants = models.ManyToManyField(User, related_name='participants', blank=True)
+    participants = models.ManyToManyField(User, related_name='participants', blank=True, through='Membership')
+    # through='Membership' --- the table behind participants is our own model now, so a membership can carry
+    # when the user joined and how far they've read ( check Membership below ).
+    # denormalized counters, kept up to date by signals.py ( same as Topic.room_count ).
+    participant_count = models.PositiveIntegerField(default=0, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
 
     updated = models.DateTimeField(auto_now=True)  # this will take a snap of the time whenever this model/table was updated.
     # auto_now = True, means it will automatically take the snaps of time and we don't need to do anything manually.
@@ -53,12 +110,84 @@ class Room(models.Model):
     # auto_now_add = True, it will only take a snap of time when we first save or create this instance. 
     # It'll never change if we save the instance multiple times, while the autp_save will change.
 
+    objects = RoomQuerySet.as_manager()
+    counter_fields = ('participant_count', 'message_count')
+
     class Meta:
         ordering = ['-updated', '-created']
+        indexes = [
+            # these match the ( updated, id ) keys used by pagination.py, so every page is an index range scan.
+            models.Index(fields=['-updated', '-id'], name='room_updated_id_idx'),
+            models.Index(fields=['host', '-updated', '-id'], name='room_host_updated_id_idx'),
+            models.Index(fields=['-participant_count', '-id'], name='room_popular_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # remember which topic the room had when it was loaded, so signals.py can tell when updateRoom moves it.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_topic_id = instance.__dict__.get('topic_id')
+        return instance
+
+    def post_message(self, user, body, join=True):
+        '''
+        NOTE:
+        Used by the message form in views.room and by the room WebSocket ( consumers.py ), so both save a message the same way.
+        atomic() makes the message, the participant and the counters they update ( signals.py ) commit together.
+        participants.add() costs a SELECT and an INSERT, so callers that already know the user is a participant
+        ( views.room does, check memberships.py ) pass join=False.
+        Someone joining by posting has read the room up to their own message ( check unread.py ).
+        '''
+        with transaction.atomic():
+            message = Message.objects.create(user=user, room=self, body=body)
+            if join:
+                self.participants.add(user, through_defaults={'last_read_message_id': message.id})
+        return message
 
     def __str__(self):
         return self.name
 
+class RoomCard(models.Model):
+    '''
+    NOTE:
+    What a room's card in the feed ( feed_component.html ) shows, copied into one flat row per room:
+    the host's username and avatar, the topic name, the participant count and the dates.
+    The feed reads a page of these with one values() query ( queries.feed_cards ), instead of loading a Room,
+    its host User and its Topic as model instances for every card. signals.py keeps the copies up to date
+    ( check roomcards.py ).
+    '''
+    # the room's id. Not a ForeignKey, so the feed never joins the rooms table; signals.py deletes it with the room.
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=200)
+    host_id = models.BigIntegerField(null=True)
+    host_username = models.CharField(max_length=50, blank=True)
+    host_avatar = models.CharField(max_length=100, blank=True)
+    topic_id = models.BigIntegerField(null=True)
+    topic_name = models.CharField(max_length=200, blank=True)
+    participant_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # the same orderings as the Room indexes, for pagination.py.
+            models.Index(fields=['-updated', '-id'], name='card_updated_id_idx'),
+            models.Index(fields=['host_id', '-updated', '-id'], name='card_host_updated_id_idx'),
+            models.Index(fields=['-participant_count', '-id'], name='card_popular_idx'),
+            models.Index(fields=['topic_id'], name='card_topic_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class MessageQuerySet(models.QuerySet):
+    def for_activity(self):
+        # activity_component.html and room.html show the author and the room of every message,
+        # so we join them in with the messages instead of fetching them one by one.
+        return self.select_related('user', 'room')
+
+
 class Message(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
@@ -75,8 +204,19 @@ class Message(models.Model):
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated', '-created']
+        indexes = [
+            models.Index(fields=['-updated', '-id'], name='message_updated_id_idx'),
+            models.Index(fields=['room', '-updated', '-id'], name='message_room_updated_id_idx'),
+            models.Index(fields=['user', '-updated', '-id'], name='message_user_updated_id_idx'),
+            # "messages of this room after id X", what the unread counts of queries.my_rooms() ask for.
+            models.Index(fields=['room', 'id'], name='message_room_id_idx'),
+            # the messages of the trending window ( topicindex.trending() ).
+            models.Index(fields=['created'], name='message_created_idx'),
+        ]
         
     '''
     NOTE:
@@ -88,4 +228,137 @@ class Message(models.Model):
     '''
 
     def __str__(self):
-        return self.body[0:50]
\ No newline at end of file
+        return self.body[0:50]
+
+
+class Membership(models.Model):
+    '''
+    NOTE:
+    One row per participant of a room, the table behind Room.participants.
+    It's the same table the plain ManyToManyField used ( db_table ), migration 0010 only added the new columns.
+
+    last_read_message_id is the newest message of the room the user has seen, everything after it is unread.
+    It's a plain number and not a ForeignKey, so deleting that message doesn't touch the membership.
+
+    The ( user, room ) index is for "the rooms of this user", the unique ( room, user ) one django made for the
+    ManyToManyField already covers "the participants of this room".
+    '''
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='memberships')
+    joined_at = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'base_room_participants'
+        unique_together = [('room', 'user')]
+        indexes = [
+            models.Index(fields=['user', 'room'], name='membership_user_room_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} in {self.room_id}"
+
+
+class TimelineEntry(models.Model):
+    '''
+    NOTE:
+    Every user's "Recent Activities", stored ahead of time ( fan-out on write ).
+
+    Showing the newest messages of the rooms you are in used to mean sorting ( a slice of ) the whole messages table
+    on every page view. Now when a message is posted, signals.py adds one row here for every participant of the room,
+    every follower of its topic and the author. Reading the panel is then "the newest 20 rows of this user",
+    which is a range read on the ( user, -id ) index no matter how many messages there are in total.
+
+    Rows are only ever added, so the list would grow forever; `python manage.py trim_timeline` cuts every user's
+    timeline back to TIMELINE_LENGTH entries ( run it from cron ).
+    '''
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='timeline_entries')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'message'], name='timeline_user_message_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-id'], name='timeline_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.message_id}"
+
+
+class MessageArchive(models.Model):
+    '''
+    NOTE:
+    Old messages of a room, moved out of the messages table by `python manage.py archive_messages` ( check archive.py ).
+    One row holds up to a chunk of them as zlib compressed json lines, newest first, so the messages table and its
+    indexes only keep the recent ( hot ) messages the pages actually read.
+    '''
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='archives')
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    oldest = models.DateTimeField()
+    newest = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', '-id'], name='archive_room_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_id}: {self.first_message_id}-{self.last_message_id}"
+
+
+class Task(models.Model):
+    '''
+    NOTE:
+    A job for the background worker ( `python manage.py run_worker` ), check taskqueue.py.
+    The queue is just this table, so it needs nothing but the database we already have.
+    '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # enqueueing a task with a key that's already in the table does nothing, so the same work isn't done twice.
+    key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    # a running task whose worker died is picked up again once this has passed.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ( {self.status} )"
+
+
+class RateLimitBucket(models.Model):
+    '''
+    NOTE:
+    One token bucket of the database rate limit backend ( check ratelimit.py ), like "post-message:user:42".
+    A missing row is a full bucket, so old rows can be deleted at any time.
+    '''
+    key = models.CharField(max_length=200, primary_key=True)
+    tokens = models.FloatField()
+    # when tokens was worked out, in unix time.
+    stamp = models.FloatField()
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
@@ -0,0 +1,158 @@
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+'''
+NOTE:
+Keyset (cursor) pagination.
+
+OFFSET pagination ( LIMIT 20 OFFSET 100000 ) makes the database walk over and throw away every row before the page,
+so the deeper you go the slower it gets. Keyset pagination remembers the sort key of the last row we showed,
+( updated, id ) here, and asks for the rows that come after it: WHERE (updated, id) < (last_updated, last_id).
+With a composite index on the same columns that is an index range scan, so page 1 and page 10.000 cost the same.
+
+The cursor we hand to the client is just those values, json encoded and base64'd so it's safe to put in a url.
+'''
+
+DEFAULT_ORDERING = ('-updated', '-id')
+PAGE_SIZE = 20
+# the ordering fields that hold a timestamp, every other one ( id, participant_count, search_rank ... ) is an int.
+DATETIME_FIELDS = {'updated', 'created'}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _cursor_value(field, value):
+    # a tampered cursor can hold anything json can, it must not reach the query as it is.
+    if field.lstrip('-') in DATETIME_FIELDS:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None:
+            raise ValueError(value)
+        return parsed
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(cursor, length, ordering=None):
+    '''
+    The values of a cursor, as a list of `length`. With the ordering they are checked and converted too
+    ( a datetime for updated, an int for the rest ), anything else is an InvalidCursor.
+    '''
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor(cursor)
+    if ordering is not None:
+        try:
+            # parse_datetime raises ValueError for a well formed but impossible date ( 2024-13-45 ).
+            values = [_cursor_value(field, value) for field, value in zip(ordering, values)]
+        except ValueError as exc:
+            raise InvalidCursor(cursor) from exc
+    return values
+
+
+def _after(ordering, values):
+    # builds (f1 < v1) OR (f1 = v1 AND f2 < v2) OR ... for the given ordering.
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, next_url=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.next_url = next_url
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _page_queryset(queryset, cursor, per_page, ordering):
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(_after(ordering, decode_cursor(cursor, len(ordering), ordering)))
+    # we ask for one extra row, if it comes back there is a next page.
+    return queryset[:per_page + 1]
+
+
+def _value_of(row, name):
+    # model instances, or the dicts of a values() queryset.
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _make_page(rows, per_page, ordering):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([_value_of(last, field.lstrip('-')) for field in ordering])
+    return KeysetPage(rows, next_cursor)
+
+
+def _link_next_page(request, page, param):
+    if page.has_next:
+        params = request.GET.copy()
+        params[param] = page.next_cursor
+        page.next_url = f"{request.path}?{params.urlencode()}"
+    return page
+
+
+def paginate(queryset, cursor=None, per_page=PAGE_SIZE, ordering=DEFAULT_ORDERING):
+    rows = list(_page_queryset(queryset, cursor, per_page, ordering))
+    return _make_page(rows, per_page, ordering)
+
+
+async def apaginate(queryset, cursor=None, per_page=PAGE_SIZE, ordering=DEFAULT_ORDERING):
+    # same as paginate(), for the async views.
+    rows = [row async for row in _page_queryset(queryset, cursor, per_page, ordering)]
+    return _make_page(rows, per_page, ordering)
+
+
+def paginate_request(request, queryset, per_page=PAGE_SIZE, ordering=DEFAULT_ORDERING, param='cursor'):
+    '''
+    NOTE:
+    Same as paginate(), but reads the cursor from ?cursor= and builds the link to the next page,
+    keeping the rest of the query string ( like ?q= ) as it is.
+    A broken or tampered cursor just gives back the first page.
+    '''
+    try:
+        page = paginate(queryset, request.GET.get(param), per_page, ordering)
+    except InvalidCursor:
+        page = paginate(queryset, None, per_page, ordering)
+    return _link_next_page(request, page, param)
+
+
+async def apaginate_request(request, queryset, per_page=PAGE_SIZE, ordering=DEFAULT_ORDERING, param='cursor'):
+    try:
+        page = await apaginate(queryset, request.GET.get(param), per_page, ordering)
+    except InvalidCursor:
+        page = await apaginate(queryset, None, per_page, ordering)
+    return _link_next_page(request, page, param)
@@ -0,0 +1,142 @@
+from django.db.models import Count, Exists, F, Max, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import roomcards, search
+from .models import Membership, Message, Room, RoomCard, Topic, User
+from .pagination import DEFAULT_ORDERING
+
+'''
+NOTE:
+The querysets behind the pages, shared by the normal views ( views.py ) and the async ones ( async_views.py ).
+Nothing here touches the database, these only build the querysets; each view decides how to run them.
+'''
+
+# ?sort=popular on home orders rooms by the denormalized participant_count ( check counters.py ).
+POPULAR_ORDERING = ('-participant_count', '-id')
+# newest timeline entry first, check timeline().
+TIMELINE_ORDERING = ('-timeline_id',)
+
+
+def feed_rooms(q='', sort=None, room_ids=None):
+    '''
+    Returns ( rooms, ordering ) for the room feed. When searching, room_ids are the
+    matches from search.search_rooms(q), best match first.
+    '''
+    rooms = Room.objects.for_feed()
+    if q:
+        return search.with_search_rank(rooms, room_ids or []), search.SEARCH_ORDERING
+    return rooms, POPULAR_ORDERING if sort == 'popular' else DEFAULT_ORDERING
+
+
+def feed_cards(q='', sort=None, room_ids=None):
+    '''
+    Same as feed_rooms(), but the room cards as values() rows ( check roomcards.py ), for feed_component.html.
+    '''
+    cards = RoomCard.objects.all()
+    if q:
+        cards, ordering = search.with_search_rank(cards, room_ids or []), search.SEARCH_ORDERING
+    else:
+        ordering = POPULAR_ORDERING if sort == 'popular' else DEFAULT_ORDERING
+    return cards.values(*roomcards.FIELDS, *cards.query.annotations), ordering
+
+
+def hosted_cards(user_id):
+    return RoomCard.objects.filter(host_id=user_id).values(*roomcards.FIELDS)
+
+
+def recent_activity(limit, topic_ids=None, user_id=None):
+    room_messages = Message.objects.for_activity()
+    if topic_ids is not None:
+        room_messages = room_messages.filter(room__topic__in=topic_ids)
+    if user_id is not None:
+        room_messages = room_messages.filter(user_id=user_id)
+    return room_messages.order_by('-updated', '-id')[:limit]
+
+
+def timeline(user_id):
+    '''
+    The messages in a user's timeline ( models.TimelineEntry ), as Message objects with a timeline_id.
+    Order it by TIMELINE_ORDERING: that is a range read on the ( user, -id ) index of the timeline table,
+    then one primary key lookup per message, instead of sorting the messages table.
+    '''
+    return (Message.objects.for_activity().filter(timeline_entries__user_id=user_id)
+            .annotate(timeline_id=F('timeline_entries__id')))
+
+
+def home_activity(limit, topic_ids=None, viewer_id=None):
+    # when searching it's the messages of the matching topics, a logged in user gets their timeline,
+    # and everyone else the newest messages.
+    if topic_ids is None and viewer_id is not None:
+        return timeline(viewer_id).order_by(*TIMELINE_ORDERING)[:limit]
+    return recent_activity(limit, topic_ids=topic_ids)
+
+
+def sidebar_topics(limit=None):
+    topics = Topic.objects.popular()
+    return topics[:limit] if limit else topics
+
+
+def room_detail(pk, viewer_id=None):
+    rooms = Room.objects.select_related('host', 'topic').filter(id=pk)
+    if viewer_id is not None:
+        # whether the viewer is a participant comes with the room, for memberships.remember().
+        rooms = rooms.annotate(is_member=Exists(Membership.objects.filter(room_id=OuterRef('id'), user_id=viewer_id)))
+    return rooms
+
+
+def room_messages(pk):
+    return Message.objects.filter(room_id=pk).select_related('user')
+
+
+def room_participants(pk):
+    return User.objects.filter(participants=pk)
+
+
+def my_rooms(user_id):
+    '''
+    The rooms a user is a participant of, as Membership objects with their room and an `unread` count,
+    the rooms with the most unread messages first.
+    It's one query: the user's memberships come from the ( user, room ) index and every unread count is a
+    range read on the ( room, id ) index of the messages, "messages of this room after last_read_message_id".
+    '''
+    unread = (Message.objects.filter(room_id=OuterRef('room_id'), id__gt=OuterRef('last_read_message_id'))
+              .order_by().values('room_id').annotate(total=Count('id')).values('total'))
+    return (Membership.objects.filter(user_id=user_id).select_related('room', 'room__topic')
+            .annotate(unread=Coalesce(Subquery(unread), Value(0)))
+            .order_by('-unread', '-room__updated', '-room_id'))
+
+
+def unread_counts(user_id):
+    '''
+    ( room_id, unread ) for every room of the user with messages after their read cursor, in one aggregate query.
+    It's the same join as my_rooms(), without loading the rooms ( check unread.py ).
+    '''
+    return (Message.objects
+            .filter(room__memberships__user_id=user_id, id__gt=F('room__memberships__last_read_message_id'))
+            .order_by().values('room_id').annotate(unread=Count('id')).values_list('room_id', 'unread'))
+
+
+def api_rooms(q='', topic=None, room_ids=None, with_participants=False):
+    '''
+    Returns ( rooms, ordering ) for /api/rooms/, with the same search as the feed.
+    Only the participant ids are prefetched, and only when the client asked for them.
+    '''
+    rooms, ordering = feed_rooms(q, None, room_ids)
+    if topic:
+        rooms = rooms.filter(topic__name__iexact=topic)
+    if with_participants:
+        rooms = rooms.prefetch_related(Prefetch('participants', queryset=User.objects.only('id')))
+    return rooms, ordering
+
+
+def api_room(pk, with_participants=False):
+    rooms = room_detail(pk)
+    if with_participants:
+        rooms = rooms.prefetch_related(Prefetch('participants', queryset=User.objects.only('id')))
+    return rooms
+
+
+
+def last_modified_aggregates():
+    # for rooms.aggregate(): the newest Room.updated and how many rooms there are ( so a delete changes the ETag too ).
+    return {'last_modified': Max('updated'), 'count': Count('id')}
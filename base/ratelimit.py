@@ -0,0 +1,221 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from .models import RateLimitBucket
+
+'''
+NOTE:
+Rate limits for the writes: posting a message, creating a room, registering.
+
+Every write takes the database's write lock for a moment, and SQLite has only one. Without a limit a single client
+posting in a loop keeps it busy and every other user waits behind them ( the slow requests in /metrics ).
+
+    @rate_limit('post-message', key='user', methods=['POST'])
+    def room(request, pk):
+        ...
+
+The room WebSocket ( consumers.py ) posts messages too, it takes its tokens from the same post-message buckets.
+
+It's a token bucket per limit and per user ( key='user' ) or address ( key='ip' ), with the rate and the burst
+from RATE_LIMITS in settings.py: a bucket holds up to `burst` tokens, every write takes one, and it fills up again
+at `rate`. So a few quick messages in a row are fine, a steady stream faster than the rate isn't.
+A write without a token gets 429 Too Many Requests with Retry-After ( when the next token is there ),
+before the view runs, so it never reaches the database.
+
+Where the buckets live is RATE_LIMIT_BACKEND ( settings.py ):
+    - memory: a dict in this process. The cheapest, but every process ( worker ) has its own buckets.
+    - cache: the cache framework, shared by the processes when the cache is ( STUDYBUD_CACHE_DIR ). A get and a set,
+      not atomic, so two writes at the very same moment can both get the last token. Good enough for a limit.
+    - database: a RateLimitBucket row per bucket, exact ( SELECT ... FOR UPDATE ) across all the processes,
+      but it's one more ( small ) write for every limited request, refused ones included. purge() deletes the
+      rows of the buckets that are full again.
+The address is REMOTE_ADDR. Behind a reverse proxy that's the proxy itself, it has to pass the client's on.
+'''
+
+RATE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# the memory backend forgets the least recently used buckets past this many ( a forgotten bucket is a full one ).
+MEMORY_MAX_BUCKETS = 10000
+CACHE_PREFIX = 'ratelimit'
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+class HttpResponseTooManyRequests(HttpResponse):
+    status_code = 429
+
+
+def parse_rate(rate):
+    # "30/m" -> tokens per second
+    count, _, unit = rate.partition('/')
+    return int(count) / RATE_UNITS[unit or 's']
+
+
+def take(state, now, rate, burst):
+    '''
+    One token from a bucket. state is ( tokens, stamp ) or None for a full bucket.
+    Returns the new state and how many seconds until there's a token, 0 when we got one.
+    '''
+    tokens = burst if state is None else min(burst, state[0] + (now - state[1]) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, rate, burst, now):
+        with self.lock:
+            state, wait = take(self.buckets.pop(key, None), now, rate, burst)
+            self.buckets[key] = state
+            if len(self.buckets) > MEMORY_MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBackend:
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def take(self, key, rate, burst, now):
+        cache = caches[self.alias]
+        key = f"{CACHE_PREFIX}:{key}"
+        state, wait = take(cache.get(key), now, rate, burst)
+        # once it's full again the entry can go, a missing bucket is a full one.
+        cache.set(key, state, timeout=math.ceil((burst - state[0]) / rate) + 1)
+        return wait
+
+    def reset(self):
+        # cache.clear() in the tests takes the buckets with it.
+        pass
+
+
+class DatabaseBackend:
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def take(self, key, rate, burst, now):
+        with transaction.atomic(using=self.using):
+            bucket, created = (RateLimitBucket.objects.using(self.using).select_for_update()
+                               .get_or_create(key=key, defaults={'tokens': burst, 'stamp': now}))
+            (bucket.tokens, bucket.stamp), wait = take((bucket.tokens, bucket.stamp), now, rate, burst)
+            bucket.save(using=self.using, update_fields=['tokens', 'stamp'])
+        return wait
+
+    def reset(self):
+        pass
+
+
+def purge(using=DEFAULT_DB_ALIAS):
+    '''
+    Deletes the RateLimitBucket rows that have filled up again ( a missing row is a full bucket ), so the table
+    doesn't keep a row for every user and address that ever wrote. `run_worker` calls it now and then.
+    Returns how many rows were deleted.
+    '''
+    # untouched for as long as the slowest limit takes to fill from empty, any bucket is full by now.
+    refill = max((burst / parse_rate(rate) for rate, burst in settings.RATE_LIMITS.values()), default=0)
+    return RateLimitBucket.objects.using(using).filter(stamp__lt=time.time() - refill).delete()[0]
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    # one instance per backend, the memory one keeps its buckets in it.
+    path = settings.RATE_LIMIT_BACKENDS[settings.RATE_LIMIT_BACKEND]
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+        return _backends[path]
+
+
+def reset():
+    for backend in list(_backends.values()):
+        backend.reset()
+    with _stats_lock:
+        _stats.clear()
+
+
+def client_key(request, key):
+    if key == 'user' and request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    # anonymous requests are limited by their address, whatever the limit says.
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def take_token(name, client):
+    '''
+    Takes a token of the `name` limit for client ( "user:42" ). Returns the seconds to wait, 0 when it may go on.
+    '''
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0
+    rate, burst = settings.RATE_LIMITS[name]
+    wait = get_backend().take(f"{name}:{client}", parse_rate(rate), burst, time.time())
+    if wait:
+        with _stats_lock:
+            _stats[name] = _stats.get(name, 0) + 1
+    return wait
+
+
+def check(request, name, key):
+    return take_token(name, client_key(request, key))
+
+
+def stats():
+    '''
+    Refused requests per limit name, since this process started.
+    '''
+    with _stats_lock:
+        return dict(_stats)
+
+
+def too_many_requests(wait):
+    response = HttpResponseTooManyRequests(f"Too many requests, try again in {math.ceil(wait)} seconds.",
+                                           content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(name, key='user', methods=('POST',)):
+    '''
+    Limits the `methods` requests of a view by the `name` limit of RATE_LIMITS, per user ( key='user' ) or per
+    address ( key='ip' ). Works on sync and async views, put it under @login_required so the user is known.
+    '''
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    wait = await sync_to_async(check)(request, name, key)
+                    if wait:
+                        return too_many_requests(wait)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                wait = check(request, name, key)
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import avatars
+
+'''
+NOTE:
+Pub/sub for live room updates.
+
+Every open room page keeps a WebSocket open ( consumers.py ). The socket subscribes to its room's channel,
+and whenever a message is created or deleted signals.py publishes a small JSON frame to that channel,
+which every subscriber sends straight to its browser. No more reloading the page to see new messages.
+
+The broker is pluggable with the REALTIME_BROKER setting. InMemoryBroker fans out inside one process,
+which is all a single ASGI server ( and the tests ) need. Running several server processes needs a broker that
+talks to something shared, it only has to provide the same subscribe() / publish() methods.
+'''
+
+# how many frames can wait for a slow client before we give up on it ( it reconnects and catches up from history ).
+SUBSCRIPTION_BUFFER = 256
+
+
+def room_channel(room_id):
+    return f"room.{room_id}"
+
+
+def message_frame(message):
+    user = message.user
+    return {
+        'type': 'message',
+        'id': message.id,
+        'room': message.room_id,
+        'user': {'id': user.id, 'username': user.username, 'avatar': avatars.thumbnail_url(user.avatar, 28) or None},
+        'body': message.body,
+        'created': message.created.isoformat(),
+    }
+
+
+def encode_frame(frame):
+    return json.dumps(frame, separators=(',', ':'))
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_BUFFER)
+        self.overflowed = False
+
+    def deliver(self, frame):
+        # runs on the subscriber's event loop.
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, frame):
+        '''
+        NOTE:
+        publish() is called from the views and signals, which run in a worker thread and not on the event loop
+        the sockets live on. call_soon_threadsafe() hands the frame over to each subscriber's own loop.
+        '''
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, frame)
+            except RuntimeError:
+                # the loop is already closed, the socket is gone.
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'REALTIME_BROKER', 'base.realtime.InMemoryBroker'))()
+        return _broker
+
+
+def publish_message(message):
+    get_broker().publish(room_channel(message.room_id), message_frame(message))
+
+
+def publish_deleted_message(room_id, message_id):
+    get_broker().publish(room_channel(room_id), {'type': 'delete', 'id': message_id, 'room': room_id})
@@ -0,0 +1,152 @@
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import CharField, F, OuterRef, Subquery, Value
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Coalesce
+
+from .models import Room, RoomCard, User
+
+'''
+NOTE:
+The room cards of the feed ( RoomCard in models.py ).
+
+A page of the feed used to load 20-100 Rooms with select_related('host', 'topic'): three model instances per card,
+each with its own state and every column of three tables, for the six values a card shows.
+Now queries.feed_cards() reads the RoomCard rows as plain dicts ( values() ), and to_cards() wraps each one
+in a Card, a small object with __slots__ that feed_component.html reads just like a Room
+( room.host.username, room.topic.name ... ). The host and the topic are only made when the template asks,
+so a card that comes out of the fragment cache never makes them at all.
+
+The copies are kept up to date by signals.py:
+    - a room is saved / deleted: refresh() writes its card again ( one SELECT with the joins, one upsert ).
+    - a user changes their username or avatar, a topic is renamed: one UPDATE of their cards.
+    - a user / topic is deleted: the rooms lose their host / topic ( SET_NULL ), so do the cards.
+    - someone joins or leaves: the participant_count is copied over from the room.
+Anything that goes around the signals ( bulk_create, update() ) has to call rebuild() or refresh() itself,
+like seed.py does; `python manage.py recount` rebuilds them too.
+'''
+
+FIELDS = ('id', 'name', 'host_id', 'host_username', 'host_avatar', 'topic_id', 'topic_name',
+          'participant_count', 'created', 'updated')
+UPDATE_FIELDS = [name for name in FIELDS if name != 'id']
+BATCH_SIZE = 1000
+
+AVATAR_FIELD = User._meta.get_field('avatar')
+
+
+class CardHost:
+    __slots__ = ('id', 'username', 'avatar')
+
+    def __init__(self, id, username, avatar):
+        self.id = id
+        self.username = username
+        # a FieldFile, so {% avatar %} finds the url and the thumbnails the same way as for a User.
+        self.avatar = FieldFile(None, AVATAR_FIELD, avatar or None)
+
+    def __str__(self):
+        return self.username
+
+
+class CardTopic:
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class Card:
+    '''
+    One RoomCard row, read like a Room by feed_component.html.
+    '''
+    __slots__ = (*FIELDS, 'search_rank', 'unread')
+
+    def __init__(self, row):
+        for name in FIELDS:
+            setattr(self, name, row[name])
+        self.search_rank = row.get('search_rank')
+        self.unread = 0
+
+    @property
+    def host(self):
+        return CardHost(self.host_id, self.host_username, self.host_avatar) if self.host_id else None
+
+    @property
+    def topic(self):
+        return CardTopic(self.topic_id, self.topic_name) if self.topic_id else None
+
+    def __str__(self):
+        return self.name
+
+
+def to_cards(page):
+    # the values() rows of a page -> Cards, in place.
+    page.object_list = [Card(row) for row in page.object_list]
+    return page
+
+
+def _card_values(rooms):
+    # a card's columns, straight from the room and its joins.
+    return rooms.order_by().values(
+        'id', 'name', 'host_id', 'topic_id', 'participant_count', 'created', 'updated',
+        host_username=Coalesce(F('host__username'), Value('')),
+        host_avatar=Coalesce(F('host__avatar'), Value(''), output_field=CharField()),
+        topic_name=Coalesce(F('topic__name'), Value('')),
+    )
+
+
+def refresh(room_ids, using=DEFAULT_DB_ALIAS):
+    '''
+    Writes the cards of these rooms again, and drops the ones whose room is gone.
+    '''
+    cards = [RoomCard(**row) for row in _card_values(Room.objects.using(using).filter(id__in=room_ids))]
+    if cards:
+        RoomCard.objects.using(using).bulk_create(cards, update_conflicts=True, unique_fields=['id'],
+                                                  update_fields=UPDATE_FIELDS)
+    gone = set(room_ids) - {card.id for card in cards}
+    if gone:
+        RoomCard.objects.using(using).filter(id__in=gone).delete()
+
+
+def update_host(user, using=DEFAULT_DB_ALIAS):
+    RoomCard.objects.using(using).filter(host_id=user.pk).update(
+        host_username=user.username or '', host_avatar=user.avatar.name or '',
+    )
+
+
+def forget_host(user_id, using=DEFAULT_DB_ALIAS):
+    RoomCard.objects.using(using).filter(host_id=user_id).update(host_id=None, host_username='', host_avatar='')
+
+
+def update_topic(topic, using=DEFAULT_DB_ALIAS):
+    RoomCard.objects.using(using).filter(topic_id=topic.pk).update(topic_name=topic.name)
+
+
+def forget_topic(topic_id, using=DEFAULT_DB_ALIAS):
+    RoomCard.objects.using(using).filter(topic_id=topic_id).update(topic_id=None, topic_name='')
+
+
+def copy_participant_counts(room_ids, using=DEFAULT_DB_ALIAS):
+    count = Room.objects.using(using).filter(id=OuterRef('id')).values('participant_count')[:1]
+    RoomCard.objects.using(using).filter(id__in=room_ids).update(participant_count=Subquery(count))
+
+
+def rebuild(apps=global_apps, using=DEFAULT_DB_ALIAS, batch_size=BATCH_SIZE):
+    '''
+    Writes every card again from the rooms, returns how many there are. Run it inside a transaction.
+    '''
+    Room = apps.get_model('base', 'Room')
+    RoomCard = apps.get_model('base', 'RoomCard')
+    RoomCard.objects.using(using).all().delete()
+    rows = _card_values(Room.objects.using(using).all()).iterator(chunk_size=batch_size)
+    total, batch = 0, []
+    for row in rows:
+        batch.append(RoomCard(**row))
+        if len(batch) == batch_size:
+            RoomCard.objects.using(using).bulk_create(batch)
+            total, batch = total + len(batch), []
+    RoomCard.objects.using(using).bulk_create(batch)
+    return total + len(batch)
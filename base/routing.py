@@ -0,0 +1,22 @@
+import re
+
+from . import consumers
+
+'''
+NOTE:
+urls.py for WebSockets. studybud/asgi.py hands every "websocket" connection to websocket_application(),
+which finds the consumer whose pattern matches the path.
+'''
+
+websocket_urlpatterns = [
+    (re.compile(r'^/ws/room/(?P<pk>\d+)/$'), consumers.room_socket),
+]
+
+
+async def websocket_application(scope, receive, send):
+    for pattern, consumer in websocket_urlpatterns:
+        match = pattern.match(scope['path'])
+        if match:
+            return await consumer(scope, receive, send, **match.groupdict())
+    await receive()
+    await send({'type': 'websocket.close', 'code': consumers.CLOSE_NOT_FOUND})
@@ -0,0 +1,291 @@
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+'''
+NOTE:
+Full text search for rooms and topics.
+
+The old search did `icontains` on the topic name, room name and description. A LIKE '%py%' can't use an index,
+so every keystroke in the search bar read the whole rooms table ( and joined topics into it ).
+
+Here we keep a separate search index next to the normal tables and ask it for the matching ids, best match first:
+    * SQLite   -> FTS5 virtual tables ( base_room_fts, base_topic_fts ), ranked with bm25()
+    * Postgres -> tsvector columns with a GIN index ( base_room_search, base_topic_search ), ranked with ts_rank()
+    * anything else falls back to the old icontains lookups ( QLookupBackend ).
+
+signals.py keeps the index in sync whenever a room or topic is saved or deleted,
+and `python manage.py rebuild_search_index` builds it again from scratch.
+'''
+
+# we never need more than this many matches, nobody pages that far into search results.
+SEARCH_RESULT_LIMIT = 1000
+
+# every page that shows search results orders by the rank annotated with with_search_rank().
+SEARCH_ORDERING = ('search_rank', 'id')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(q):
+    return [token.lower() for token in TOKEN_RE.findall(q or '')]
+
+
+class QLookupBackend:
+    '''
+    The original Q() + icontains search. It needs no index, so it works on every database,
+    and bench_search uses it as the baseline.
+    '''
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def execute(self, sql, params=()):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description:
+                return cursor.fetchall()
+        return []
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def index_room(self, room):
+        pass
+
+    def remove_room(self, room_id):
+        pass
+
+    def index_topic(self, topic):
+        pass
+
+    def remove_topic(self, topic_id):
+        pass
+
+    def search_rooms(self, q, limit=SEARCH_RESULT_LIMIT):
+        from .models import Room
+        rooms = Room.objects.using(self.using).filter(
+            Q(topic__name__icontains=q) |
+            Q(name__icontains=q) |
+            Q(description__icontains=q)
+        ).order_by('-updated', '-id')
+        return list(rooms.values_list('id', flat=True)[:limit])
+
+    def search_topics(self, q, limit=SEARCH_RESULT_LIMIT):
+        from .models import Topic
+        topics = Topic.objects.using(self.using).filter(name__icontains=q).order_by('name')
+        return list(topics.values_list('id', flat=True)[:limit])
+
+
+class SQLiteFTS5Backend(QLookupBackend):
+    # name matches count the most, then the topic, then the description.
+    ROOM_WEIGHTS = (10.0, 2.0, 5.0)
+
+    def match_expression(self, q):
+        # every word is treated as a prefix ( "py" finds "python" ), and quoting them stops FTS5
+        # from reading things like AND / NEAR / * typed in the search bar as query syntax.
+        return ' '.join(f'"{token}"*' for token in tokenize(q))
+
+    def install(self):
+        self.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS base_room_fts USING fts5("
+            "name, description, topic, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        self.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS base_topic_fts USING fts5("
+            "name, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def uninstall(self):
+        self.execute("DROP TABLE IF EXISTS base_room_fts")
+        self.execute("DROP TABLE IF EXISTS base_topic_fts")
+
+    def rebuild(self):
+        self.execute("DELETE FROM base_room_fts")
+        self.execute(
+            "INSERT INTO base_room_fts (rowid, name, description, topic) "
+            "SELECT r.id, r.name, COALESCE(r.description, ''), COALESCE(t.name, '') "
+            "FROM base_room r LEFT JOIN base_topic t ON t.id = r.topic_id"
+        )
+        self.execute("DELETE FROM base_topic_fts")
+        self.execute("INSERT INTO base_topic_fts (rowid, name) SELECT id, name FROM base_topic")
+
+    def index_room(self, room):
+        self.remove_room(room.id)
+        self.execute(
+            "INSERT INTO base_room_fts (rowid, name, description, topic) VALUES (%s, %s, %s, %s)",
+            [room.id, room.name, room.description or '', room.topic.name if room.topic_id else ''],
+        )
+
+    def remove_room(self, room_id):
+        self.execute("DELETE FROM base_room_fts WHERE rowid = %s", [room_id])
+
+    def index_topic(self, topic):
+        self.remove_topic(topic.id)
+        self.execute("INSERT INTO base_topic_fts (rowid, name) VALUES (%s, %s)", [topic.id, topic.name])
+
+    def remove_topic(self, topic_id):
+        self.execute("DELETE FROM base_topic_fts WHERE rowid = %s", [topic_id])
+
+    def search_rooms(self, q, limit=SEARCH_RESULT_LIMIT):
+        expression = self.match_expression(q)
+        if not expression:
+            return []
+        weights = ', '.join(str(weight) for weight in self.ROOM_WEIGHTS)
+        rows = self.execute(
+            f"SELECT rowid FROM base_room_fts WHERE base_room_fts MATCH %s "
+            f"ORDER BY bm25(base_room_fts, {weights}), rowid LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in rows]
+
+    def search_topics(self, q, limit=SEARCH_RESULT_LIMIT):
+        expression = self.match_expression(q)
+        if not expression:
+            return []
+        rows = self.execute(
+            "SELECT rowid FROM base_topic_fts WHERE base_topic_fts MATCH %s ORDER BY rank, rowid LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in rows]
+
+
+class PostgresBackend(QLookupBackend):
+    # 'simple' config: no stemming or stop words, topic names like "Go" or "C" must stay searchable.
+    ROOM_DOCUMENT = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C')"
+    )
+
+    def match_expression(self, q):
+        return ' & '.join(f'{token}:*' for token in tokenize(q))
+
+    def install(self):
+        self.execute(
+            "CREATE TABLE IF NOT EXISTS base_room_search ("
+            "room_id bigint PRIMARY KEY REFERENCES base_room (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS base_room_search_document_idx ON base_room_search USING GIN (document)"
+        )
+        self.execute(
+            "CREATE TABLE IF NOT EXISTS base_topic_search ("
+            "topic_id bigint PRIMARY KEY REFERENCES base_topic (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS base_topic_search_document_idx ON base_topic_search USING GIN (document)"
+        )
+
+    def uninstall(self):
+        self.execute("DROP TABLE IF EXISTS base_room_search")
+        self.execute("DROP TABLE IF EXISTS base_topic_search")
+
+    def rebuild(self):
+        self.execute("TRUNCATE base_room_search, base_topic_search")
+        self.execute(
+            "INSERT INTO base_room_search (room_id, document) "
+            "SELECT r.id, " + self.ROOM_DOCUMENT % ('r.name', "COALESCE(t.name, '')", "COALESCE(r.description, '')") +
+            " FROM base_room r LEFT JOIN base_topic t ON t.id = r.topic_id"
+        )
+        self.execute(
+            "INSERT INTO base_topic_search (topic_id, document) "
+            "SELECT id, to_tsvector('simple', name) FROM base_topic"
+        )
+
+    def index_room(self, room):
+        self.execute(
+            "INSERT INTO base_room_search (room_id, document) VALUES (%s, " + self.ROOM_DOCUMENT + ") "
+            "ON CONFLICT (room_id) DO UPDATE SET document = EXCLUDED.document",
+            [room.id, room.name, room.topic.name if room.topic_id else '', room.description or ''],
+        )
+
+    def remove_room(self, room_id):
+        self.execute("DELETE FROM base_room_search WHERE room_id = %s", [room_id])
+
+    def index_topic(self, topic):
+        self.execute(
+            "INSERT INTO base_topic_search (topic_id, document) VALUES (%s, to_tsvector('simple', %s)) "
+            "ON CONFLICT (topic_id) DO UPDATE SET document = EXCLUDED.document",
+            [topic.id, topic.name],
+        )
+
+    def remove_topic(self, topic_id):
+        self.execute("DELETE FROM base_topic_search WHERE topic_id = %s", [topic_id])
+
+    def search_rooms(self, q, limit=SEARCH_RESULT_LIMIT):
+        expression = self.match_expression(q)
+        if not expression:
+            return []
+        rows = self.execute(
+            "SELECT room_id FROM base_room_search, to_tsquery('simple', %s) query "
+            "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, room_id LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in rows]
+
+    def search_topics(self, q, limit=SEARCH_RESULT_LIMIT):
+        expression = self.match_expression(q)
+        if not expression:
+            return []
+        rows = self.execute(
+            "SELECT topic_id FROM base_topic_search, to_tsquery('simple', %s) query "
+            "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, topic_id LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in rows]
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresBackend,
+}
+
+_backends = {}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    if using not in _backends:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = BACKENDS.get(connections[using].vendor, QLookupBackend)
+        _backends[using] = backend_class(using)
+    return _backends[using]
+
+
+def search_rooms(q, limit=SEARCH_RESULT_LIMIT, using=DEFAULT_DB_ALIAS):
+    return get_backend(using).search_rooms(q, limit)
+
+
+def search_topics(q, limit=SEARCH_RESULT_LIMIT, using=DEFAULT_DB_ALIAS):
+    return get_backend(using).search_topics(q, limit)
+
+
+def with_search_rank(queryset, ids):
+    '''
+    NOTE:
+    The search index gives us ids best match first, but `filter(id__in=ids)` forgets that order.
+    This keeps only the matching rows and annotates each with its position in the result ( search_rank ),
+    so we can order_by('search_rank') and paginate on it like any other column.
+    '''
+    if not ids:
+        return queryset.none().annotate(search_rank=Value(0, output_field=IntegerField()))
+    return queryset.filter(id__in=ids).annotate(
+        search_rank=Case(
+            *[When(id=pk, then=Value(position)) for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    )
@@ -0,0 +1,147 @@
+import collections
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max
+
+from . import counters, fragments, roomcards
+from .models import Message, Room, TimelineEntry, Topic, User
+from .search import get_backend
+from .timeline import TIMELINE_LENGTH
+
+'''
+NOTE:
+Made up data at a realistic scale, for the benchmarks ( `python manage.py seed_studybud`, then `benchmark` ).
+
+Everything goes in with bulk_create, in batches, so a million messages take minutes and not hours.
+bulk_create skips save() and the signals, so afterwards seed() does in one go what signals.py does per row:
+the counters ( counters.recount ), the room cards, the search index, the timelines and the fragment cache versions.
+
+Like real rooms, a few rooms get most of the messages: room number n gets about 1/n of the traffic of the first one.
+The same `seed` number makes the same data again.
+'''
+
+BATCH_SIZE = 1000
+MAX_PARTICIPANTS = 20
+# every seeded user can log in with this.
+PASSWORD = 'studybud'
+
+WORDS = (
+    "python django flask rust golang algebra calculus physics chemistry biology history spanish french "
+    "react vue svelte docker kubernetes linux networking databases postgres sqlite statistics economics "
+    "exam notes homework project question answer help tonight weekend chapter lecture deadline review"
+).split()
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(model, objects, using, batch_size, **kwargs):
+    # bulk_create() turns its argument into a list first, so feed it one batch at a time to keep the memory flat.
+    for batch in _batches(objects, batch_size):
+        model.objects.using(using).bulk_create(batch, **kwargs)
+
+
+def _new_ids(model, since, using):
+    # ids only grow, so everything after the old max id is what we just inserted.
+    return list(model.objects.using(using).filter(id__gt=since).order_by('id').values_list('id', flat=True))
+
+
+def _max_id(model, using):
+    return model.objects.using(using).aggregate(top=Max('id'))['top'] or 0
+
+
+def seed(users, rooms, messages, topics=20, seed=0, prefix='seed', using=DEFAULT_DB_ALIAS, batch_size=BATCH_SIZE):
+    '''
+    Adds `users` users, `rooms` rooms and `messages` messages ( and up to `topics` topics ) and returns
+    how many rows of each it wrote. Run it inside a transaction, the command does.
+    '''
+    rng = random.Random(seed)
+    written = {}
+
+    topic_ids = []
+    for word in WORDS[:topics]:
+        topic, created = Topic.objects.using(using).get_or_create(name=word.title())
+        topic_ids.append(topic.id)
+    written['topics'] = len(topic_ids)
+
+    # one hash for everyone, hashing the password per user would take most of the time.
+    password = make_password(PASSWORD)
+    start = _max_id(User, using)
+    _insert(User, (
+        User(username=f"{prefix}{start + i}", email=f"{prefix}{start + i}@example.com",
+             name=f"{prefix.title()} User {start + i}", password=password)
+        for i in range(1, users + 1)
+    ), using, batch_size)
+    user_ids = _new_ids(User, start, using)
+    written['users'] = len(user_ids)
+    if not user_ids:
+        user_ids = list(User.objects.using(using).values_list('id', flat=True))
+
+    start = _max_id(Room, using)
+    _insert(Room, (
+        Room(host_id=rng.choice(user_ids), topic_id=rng.choice(topic_ids) if topic_ids else None,
+             name=' '.join(rng.choices(WORDS, k=3)).capitalize(),
+             description=' '.join(rng.choices(WORDS, k=rng.randint(5, 30))))
+        for _ in range(rooms)
+    ), using, batch_size)
+    room_ids = _new_ids(Room, start, using)
+    written['rooms'] = len(room_ids)
+
+    Membership = Room.participants.through
+    participants = {
+        room_id: rng.sample(user_ids, rng.randint(1, min(MAX_PARTICIPANTS, len(user_ids))))
+        for room_id in room_ids
+    } if user_ids else {}
+    _insert(Membership, (
+        Membership(room_id=room_id, user_id=user_id) for room_id, members in participants.items() for user_id in members
+    ), using, batch_size)
+    written['participants'] = sum(len(members) for members in participants.values())
+
+    start = _max_id(Message, using)
+    if room_ids:
+        cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(room_ids) + 1)))
+        picked = (rng.choices(room_ids, cum_weights=cumulative)[0] for _ in range(messages))
+        _insert(Message, (
+            Message(room_id=room_id, user_id=rng.choice(participants[room_id]),
+                    body=' '.join(rng.choices(WORDS, k=rng.randint(3, 40))).capitalize())
+            for room_id in picked
+        ), using, batch_size)
+    written['messages'] = Message.objects.using(using).filter(id__gt=start).count()
+
+    written['timeline'] = _fill_timelines(start, participants, using, batch_size)
+    counters.recount(using=using)
+    roomcards.rebuild(using=using)
+    get_backend(using).rebuild()
+    for model in (Topic, User, Room, Message):
+        fragments.bump(model.__name__)
+    return written
+
+
+def _fill_timelines(after_message_id, participants, using, batch_size):
+    '''
+    timeline.fan_out() runs a few queries per message, too slow for this many. Every author of a seeded message
+    is a participant of its room, so the recipients are just the room's participants, which we already know.
+    Only the newest TIMELINE_LENGTH entries of every user are kept, the same as trim_timeline would leave.
+    '''
+    newest = collections.defaultdict(lambda: collections.deque(maxlen=TIMELINE_LENGTH))
+    new_messages = (Message.objects.using(using).filter(id__gt=after_message_id)
+                    .order_by('id').values_list('id', 'room_id'))
+    for message_id, room_id in new_messages.iterator(chunk_size=batch_size * 10):
+        for user_id in participants.get(room_id, ()):
+            newest[user_id].append(message_id)
+    entries = sorted((message_id, user_id) for user_id, ids in newest.items() for message_id in ids)
+    _insert(TimelineEntry, (
+        TimelineEntry(user_id=user_id, message_id=message_id) for message_id, user_id in entries
+    ), using, batch_size, ignore_conflicts=True)
+    return len(entries)
@@ -0,0 +1,288 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import archive, auth, avatars, counters, db, fragments, metrics, realtime, roomcards, search, tasks, topicindex
+from .models import Message, Room, Topic, User
+
+'''
+NOTE:
+Signals are functions django calls for us when something happens to a model, like after a Room is saved.
+They are connected in apps.py ( BaseConfig.ready ) so they're active as soon as django starts.
+'''
+
+
+@receiver(post_save, sender=Room)
+def index_room(sender, instance, using, **kwargs):
+    search.get_backend(using).index_room(instance)
+
+
+@receiver(post_delete, sender=Room)
+def unindex_room(sender, instance, using, **kwargs):
+    search.get_backend(using).remove_room(instance.id)
+
+
+@receiver(post_save, sender=Topic)
+def index_topic(sender, instance, using, created, **kwargs):
+    search.get_backend(using).index_topic(instance)
+    if not created:
+        # the topic name is part of every room's search text, so a rename has to reach its rooms too.
+        # a topic can have thousands of rooms, so the worker does that ( check tasks.py ).
+        tasks.index_topic_rooms.enqueue(instance.id, using=using)
+
+
+@receiver(pre_delete, sender=Topic)
+def remember_topic_rooms(sender, instance, using, **kwargs):
+    # deleting a topic sets room.topic to NULL with a plain UPDATE ( no signals ), so we note which rooms to reindex.
+    instance._search_room_ids = list(instance.room_set.using(using).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Topic)
+def unindex_topic(sender, instance, using, **kwargs):
+    search.get_backend(using).remove_topic(instance.id)
+    room_ids = getattr(instance, '_search_room_ids', [])
+    if room_ids:
+        tasks.index_rooms.enqueue(room_ids, using=using)
+
+
+# ---- denormalized counters ( check counters.py ) ----
+
+@receiver(post_save, sender=Room)
+def count_room_topic(sender, instance, created, using, raw=False, **kwargs):
+    if raw:
+        return
+    old_topic_id = None if created else getattr(instance, '_loaded_topic_id', instance.topic_id)
+    if old_topic_id != instance.topic_id:
+        if old_topic_id:
+            counters.adjust(Topic.objects.using(using).filter(id=old_topic_id), room_count=-1)
+        if instance.topic_id:
+            counters.adjust(Topic.objects.using(using).filter(id=instance.topic_id), room_count=1)
+        _refresh_topic_index([old_topic_id, instance.topic_id], using)
+    instance._loaded_topic_id = instance.topic_id
+
+
+@receiver(post_delete, sender=Room)
+def uncount_room_topic(sender, instance, using, **kwargs):
+    if instance.topic_id:
+        counters.adjust(Topic.objects.using(using).filter(id=instance.topic_id), room_count=-1)
+        _refresh_topic_index([instance.topic_id], using)
+
+
+@receiver(post_save, sender=Message)
+def count_message(sender, instance, created, using, raw=False, **kwargs):
+    if created and not raw:
+        counters.adjust(Room.objects.using(using).filter(id=instance.room_id), message_count=1)
+
+
+@receiver(post_delete, sender=Message)
+def uncount_message(sender, instance, using, **kwargs):
+    # an archived message isn't gone, it's still counted ( check archive.py ), the same below.
+    if archive.archiving():
+        return
+    counters.adjust(Room.objects.using(using).filter(id=instance.room_id), message_count=-1)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def count_participants(sender, instance, action, reverse, pk_set, using, **kwargs):
+    '''
+    NOTE:
+    m2m_changed fires for room.participants.add(user) and for the other side, user.participants.add(room).
+    django only puts the ids that were really added/removed into pk_set, so adding someone who is
+    already a participant doesn't change the count.
+    '''
+    if action == 'pre_clear':
+        # clear() doesn't tell us what it removes, so count it before it happens.
+        if reverse:
+            instance._cleared_room_ids = list(instance.participants.using(using).values_list('id', flat=True))
+        else:
+            instance._cleared_count = instance.participants.using(using).count()
+        return
+    if action == 'post_clear':
+        if reverse:
+            rooms = Room.objects.using(using).filter(id__in=instance._cleared_room_ids)
+            counters.adjust(rooms, participant_count=-1)
+        else:
+            counters.adjust(Room.objects.using(using).filter(id=instance.id),
+                            participant_count=-instance._cleared_count)
+        return
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    sign = 1 if action == 'post_add' else -1
+    if reverse:
+        counters.adjust(Room.objects.using(using).filter(id__in=pk_set), participant_count=sign)
+    else:
+        counters.adjust(Room.objects.using(using).filter(id=instance.id), participant_count=sign * len(pk_set))
+
+
+@receiver(pre_delete, sender=User)
+def uncount_deleted_participant(sender, instance, using, **kwargs):
+    # the user's rows in the participants table are removed by the database cascade, without m2m_changed.
+    counters.adjust(Room.objects.using(using).filter(participants=instance), participant_count=-1)
+
+
+# ---- activity timelines ( check timeline.py ) ----
+
+@receiver(post_save, sender=Message)
+def fan_out_message(sender, instance, created, using, raw=False, **kwargs):
+    # one row per participant and follower, the worker writes them after the request ( check tasks.py ).
+    if created and not raw:
+        tasks.fan_out_message.enqueue(instance.id, key=f"fan-out:{instance.id}", using=using)
+
+
+@receiver(post_delete, sender=Message)
+def expire_unread_counts(sender, instance, using, **kwargs):
+    # a deleted unread message is one less to show ( check unread.py ), new ones are handled by the fan-out.
+    if archive.archiving():
+        return
+    # deleting a room deletes all its messages, one task per room is enough.
+    tasks.expire_unread_counts.enqueue(instance.room_id, key=f"expire-unread:{instance.room_id}", debounce=1,
+                                       using=using)
+
+
+# ---- live room updates ( check realtime.py ) ----
+
+@receiver(post_save, sender=Message)
+def broadcast_message(sender, instance, created, using, raw=False, **kwargs):
+    # on_commit: the frame only goes out once the message is really saved.
+    if created and not raw:
+        transaction.on_commit(lambda: realtime.publish_message(instance), using=using)
+
+
+@receiver(post_delete, sender=Message)
+def broadcast_deleted_message(sender, instance, using, **kwargs):
+    if archive.archiving():
+        return
+    room_id, message_id = instance.room_id, instance.id
+    transaction.on_commit(lambda: realtime.publish_deleted_message(room_id, message_id), using=using)
+
+
+# ---- topic autocomplete ( check topicindex.py ) ----
+
+def _refresh_topic_index(topic_ids, using):
+    # the autocomplete ranks by room_count, so the rooms moving it count as a change of the topic too.
+    topic_ids = [topic_id for topic_id in topic_ids if topic_id]
+    transaction.on_commit(lambda: topicindex.refresh(topic_ids, using), using=using)
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+def refresh_topic_index(sender, instance, using, **kwargs):
+    _refresh_topic_index([instance.id], using)
+
+
+# ---- room cards of the feed ( check roomcards.py ) ----
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def refresh_room_card(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        roomcards.refresh([instance.id], using)
+
+
+@receiver(post_save, sender=User)
+def update_host_cards(sender, instance, created, using, update_fields=None, raw=False, **kwargs):
+    # logging in saves last_login only, that doesn't show on a card.
+    if created or raw or (update_fields is not None and not {'username', 'avatar'} & set(update_fields)):
+        return
+    roomcards.update_host(instance, using)
+
+
+@receiver(post_delete, sender=User)
+def forget_host_cards(sender, instance, using, **kwargs):
+    roomcards.forget_host(instance.pk, using)
+
+
+@receiver(post_save, sender=Topic)
+def update_topic_cards(sender, instance, created, using, raw=False, **kwargs):
+    if not created and not raw:
+        roomcards.update_topic(instance, using)
+
+
+@receiver(post_delete, sender=Topic)
+def forget_topic_cards(sender, instance, using, **kwargs):
+    roomcards.forget_topic(instance.pk, using)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def copy_participant_counts(sender, instance, action, reverse, pk_set, using, **kwargs):
+    # after count_participants above has changed the rooms.
+    if action == 'post_clear':
+        room_ids = instance._cleared_room_ids if reverse else [instance.id]
+    elif action in ('post_add', 'post_remove') and pk_set:
+        room_ids = pk_set if reverse else [instance.id]
+    else:
+        return
+    roomcards.copy_participant_counts(room_ids, using)
+
+
+@receiver(pre_delete, sender=User)
+def copy_deleted_participant_counts(sender, instance, using, **kwargs):
+    # after uncount_deleted_participant above.
+    room_ids = list(Room.objects.using(using).filter(participants=instance).values_list('id', flat=True))
+    if room_ids:
+        roomcards.copy_participant_counts(room_ids, using)
+
+
+# ---- template fragment cache ( check fragments.py ) ----
+
+def _bump_fragments(model_name, using):
+    # after the commit, so a page rendered in between can't cache the old rows under the new version.
+    transaction.on_commit(lambda: fragments.bump(model_name), using=using)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=User)
+def expire_fragments(sender, using, **kwargs):
+    # archive_messages() bumps Message once for the whole run.
+    if sender is Message and archive.archiving():
+        return
+    _bump_fragments(sender.__name__, using)
+
+
+@receiver(post_save, sender=User)
+def expire_user_fragments(sender, using, update_fields=None, **kwargs):
+    # the fragments only show a user's name and avatar, logging in saves last_login only ( like update_host_cards ).
+    if update_fields is not None and not {'username', 'avatar'} & set(update_fields):
+        return
+    _bump_fragments('User', using)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def expire_participant_fragments(sender, action, using, **kwargs):
+    # the room cards show participant_count, which counters.py updates without saving the Room.
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _bump_fragments('Room', using)
+
+
+# ---- cached request.user ( check auth.py ) ----
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, using, **kwargs):
+    # now, and again after the commit in case a request cached the old row in between.
+    auth.forget_user(instance.pk)
+    user_id = instance.pk
+    transaction.on_commit(lambda: auth.forget_user(user_id), using=using)
+
+
+# ---- database connections ( check db.py ) ----
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    db.tune_sqlite(connection)
+    metrics.install(connection)
+
+
+# ---- avatars ( check avatars.py ) ----
+
+@receiver(pre_save, sender=User)
+def store_avatar(sender, instance, raw=False, **kwargs):
+    # a new upload is not "committed" yet; we store it with its thumbnails instead of django saving it as it is.
+    if not raw and instance.avatar and not instance.avatar._committed:
+        avatars.store_upload(instance.avatar)
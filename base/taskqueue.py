@@ -0,0 +1,156 @@
+import datetime
+import inspect
+import logging
+import math
+import traceback
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+
+'''
+NOTE:
+A small background task queue that lives in the database ( the Task model ), so it runs without Redis.
+
+    @task
+    def fan_out_message(message_id):
+        ...
+
+    fan_out_message.enqueue(message.id, key=f"fan-out:{message.id}")
+
+enqueue() doesn't write the task right away, it waits for the current transaction to commit ( transaction.on_commit ).
+So the request only pays for one small INSERT after its own writes, a rolled back request leaves no task behind,
+and the worker never picks up a task for a message it can't see yet.
+
+`python manage.py run_worker` takes the tasks whose run_at has passed and runs them. A task that raises is tried
+again later ( 2, 4, 8 ... seconds ) until max_attempts, then it stays in the table as failed with its traceback.
+With a key, enqueueing the same work twice ( a retried request, a double click ) only makes one task.
+A key stays taken after the task is done ( until purge() ), so work that has to run again every time, like
+expiring a cache, passes debounce=seconds too: the key then only holds for that window, and its one task runs
+when the window ends, after everything that enqueued it ( deleting a room enqueues once per message ).
+
+Task arguments are stored as JSON, so pass ids and not model instances. A task with a `using` argument gets the
+database alias it was enqueued on ( and the worker runs its transaction on ), so its reads and writes go there too.
+
+With TASKS_ALWAYS_EAGER = True ( the tests use it, and runserver with DEBUG on ) enqueue() just calls the function,
+like before the queue existed.
+'''
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+RETRY_DELAY = 2  # seconds, doubled on every attempt
+LOCK_TIMEOUT = 300  # seconds a worker may spend on one task before another worker takes it over
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.takes_using = 'using' in inspect.signature(func).parameters
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def run(self, args, kwargs, using):
+        if self.takes_using:
+            kwargs = {**kwargs, 'using': using}
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, key=None, delay=0, debounce=None, using=DEFAULT_DB_ALIAS, **kwargs):
+        if settings.TASKS_ALWAYS_EAGER:
+            return self.run(args, kwargs, using)
+        transaction.on_commit(lambda: self.insert(args, kwargs, key, delay, using, debounce), using=using)
+
+    def insert(self, args, kwargs, key=None, delay=0, using=DEFAULT_DB_ALIAS, debounce=None):
+        run_at = timezone.now() + datetime.timedelta(seconds=delay)
+        if key is not None and debounce:
+            # the window is picked at the commit, so the task never runs before a commit that shares its key.
+            window_end = math.ceil(run_at.timestamp() / debounce) * debounce
+            key = f"{key}:{window_end}"
+            run_at = datetime.datetime.fromtimestamp(window_end, tz=datetime.timezone.utc)
+        new_task = Task(name=self.name, args=list(args), kwargs=kwargs, key=key, max_attempts=self.max_attempts,
+                        run_at=run_at)
+        # ignore_conflicts: a task with the same key is already there ( queued, running or done ).
+        Task.objects.using(using).bulk_create([new_task], ignore_conflicts=key is not None)
+
+
+def task(func=None, *, name=None, max_attempts=5):
+    def register(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        registry[task_name] = TaskFunction(func, task_name, max_attempts)
+        return registry[task_name]
+    return register(func) if func is not None else register
+
+
+def _claim(using, limit):
+    '''
+    Marks up to `limit` due tasks as running and returns them. The UPDATE only succeeds for a task that is still
+    in the state we read it in, so two workers can't both claim the same task ( also on SQLite ).
+    '''
+    now = timezone.now()
+    due = Q(status=Task.QUEUED, run_at__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+    candidates = Task.objects.using(using).filter(due).order_by('run_at', 'id')[:limit]
+    claimed = []
+    for candidate in candidates:
+        updated = Task.objects.using(using).filter(
+            id=candidate.id, status=candidate.status, attempts=candidate.attempts
+        ).update(status=Task.RUNNING, attempts=candidate.attempts + 1,
+                 locked_until=now + datetime.timedelta(seconds=LOCK_TIMEOUT), updated=now)
+        if updated:
+            candidate.status, candidate.attempts = Task.RUNNING, candidate.attempts + 1
+            claimed.append(candidate)
+    return claimed
+
+
+def _finish(claimed, using, **fields):
+    Task.objects.using(using).filter(id=claimed.id).update(locked_until=None, updated=timezone.now(), **fields)
+
+
+def run_task(claimed, using=DEFAULT_DB_ALIAS):
+    '''
+    Runs one claimed task, returns True when it worked.
+    '''
+    function = registry.get(claimed.name)
+    try:
+        if function is None:
+            raise LookupError(f"no task called {claimed.name!r} ( is its module imported? )")
+        # the task's own writes and marking it done commit together.
+        with transaction.atomic(using=using):
+            function.run(claimed.args, claimed.kwargs, using)
+            _finish(claimed, using, status=Task.DONE, last_error='')
+        return True
+    except Exception:
+        error = traceback.format_exc()
+        if claimed.attempts >= claimed.max_attempts:
+            logger.error("task %s ( %s ) failed for good: %s", claimed.id, claimed.name, error)
+            _finish(claimed, using, status=Task.FAILED, last_error=error)
+        else:
+            retry_at = timezone.now() + datetime.timedelta(seconds=RETRY_DELAY * 2 ** (claimed.attempts - 1))
+            logger.warning("task %s ( %s ) failed, retrying at %s", claimed.id, claimed.name, retry_at)
+            _finish(claimed, using, status=Task.QUEUED, run_at=retry_at, last_error=error)
+        return False
+
+
+def run_pending(limit=100, using=DEFAULT_DB_ALIAS):
+    '''
+    Runs the tasks that are due ( at most `limit` ), returns ( succeeded, failed ).
+    '''
+    succeeded = failed = 0
+    for claimed in _claim(using, limit):
+        if run_task(claimed, using):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+def purge(older_than, using=DEFAULT_DB_ALIAS):
+    # finished tasks are kept for a while so their keys keep working, then this removes them.
+    cutoff = timezone.now() - older_than
+    return Task.objects.using(using).filter(status=Task.DONE, updated__lt=cutoff).delete()[0]
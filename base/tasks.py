@@ -0,0 +1,48 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import fragments, search, timeline, unread
+from .models import Message, Room
+from .taskqueue import task
+
+'''
+NOTE:
+The background tasks ( check taskqueue.py ). signals.py enqueues them when messages and rooms are written.
+
+The rule of thumb: work that is one small write stays in the request ( counters, indexing one room ),
+work that grows with the data ( one row per participant, every room of a topic ) goes here.
+They take `using`, the database they were enqueued on, and read and write only there.
+'''
+
+
+@task
+def fan_out_message(message_id, using=DEFAULT_DB_ALIAS):
+    message = Message.objects.using(using).filter(id=message_id).only('id', 'room_id', 'user_id').first()
+    # the message may have been deleted before the worker got to it.
+    if message is not None:
+        timeline.fan_out(message, using=using)
+        # the activity panels ( and the ETags of home ) were rendered before these rows existed, the Message bump
+        # after the post came too early for them. Once more after our commit, when the rows can be read.
+        transaction.on_commit(lambda: fragments.bump('Message'), using=using)
+        # the room's participants have one more unread message now.
+        unread.expire_room(message.room_id, using)
+
+
+@task
+def expire_unread_counts(room_id, using=DEFAULT_DB_ALIAS):
+    unread.expire_room(room_id, using)
+
+
+@task
+def index_rooms(room_ids, using=DEFAULT_DB_ALIAS):
+    backend = search.get_backend(using)
+    found = Room.objects.using(using).filter(id__in=room_ids).select_related('topic')
+    for room in found:
+        backend.index_room(room)
+    for room_id in set(room_ids) - {room.id for room in found}:
+        backend.remove_room(room_id)
+
+
+@task
+def index_topic_rooms(topic_id, using=DEFAULT_DB_ALIAS):
+    # a renamed topic changes the search text of all its rooms.
+    index_rooms(list(Room.objects.using(using).filter(topic_id=topic_id).values_list('id', flat=True)), using)
@@ -0,0 +1,30 @@
+from django import template
+from django.utils.html import format_html
+
+from .. import avatars
+
+register = template.Library()
+
+'''
+NOTE:
+{% avatar user 28 %} --- the <img> for a 28px avatar ( check base/avatars.py ).
+
+For avatars with thumbnails it's a <picture>: browsers that read WebP take the .webp one, the others the .jpg,
+and srcset gives retina screens the 2x thumbnail. Older avatars get a plain <img> of the original file.
+'''
+
+
+@register.simple_tag
+def avatar(user, size):
+    size = int(size)
+    alt = f"@{user.username}" if user and user.username else ""
+    image = user.avatar if user else None
+    if avatars.digest_of(image) is None:
+        return format_html('<img src="{}" width="{}" height="{}" alt="{}" loading="lazy" />',
+                           image.url if image else '', size, size, alt)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" />'
+        '<img src="{}" srcset="{}" width="{}" height="{}" alt="{}" loading="lazy" /></picture>',
+        avatars.srcset(image, size, 'webp'),
+        avatars.thumbnail_url(image, size), avatars.srcset(image, size, 'jpg'), size, size, alt,
+    )
@@ -0,0 +1,63 @@
+from django import template
+
+from .. import fragments
+
+register = template.Library()
+
+'''
+NOTE:
+{% fragment 'sidebar' depends 'Topic' 'Room' vary request.path timeout 300 %} ... {% endfragment %}
+
+Renders the block once and keeps the html in the cache ( check base/fragments.py ).
+    depends -- the models the block shows; saving or deleting any of them makes the next render fresh.
+    vary    -- values the block looks different for, like the user or the page.
+    timeout -- seconds to keep it ( optional ), useful when the block shows things like "5 minutes ago".
+While the cached copy is used, nothing inside the block runs, so lazy querysets it loops over never hit the database.
+'''
+
+KEYWORDS = ('depends', 'vary', 'timeout')
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, depends, vary_on, timeout):
+        self.nodelist = nodelist
+        self.name = name
+        self.depends = depends
+        self.vary_on = vary_on
+        self.timeout = timeout
+
+    def render(self, context):
+        return fragments.cached(
+            self.name.resolve(context),
+            [model.resolve(context) for model in self.depends],
+            [value.resolve(context) for value in self.vary_on],
+            self.timeout.resolve(context) if self.timeout else None,
+            lambda: self.nodelist.render(context),
+        )
+
+
+@register.tag('fragment')
+def do_fragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' needs at least a fragment name.")
+    sections = {keyword: [] for keyword in KEYWORDS}
+    current = None
+    for bit in bits[2:]:
+        if bit in KEYWORDS:
+            current = bit
+        elif current is None:
+            raise template.TemplateSyntaxError(
+                f"'{bits[0]}' expected one of {', '.join(KEYWORDS)} after the name, got {bit!r}."
+            )
+        else:
+            sections[current].append(parser.compile_filter(bit))
+    if not sections['depends']:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' needs the models it depends on, like depends 'Room'.")
+    if len(sections['timeout']) > 1:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a single timeout.")
+
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    timeout = sections['timeout'][0] if sections['timeout'] else None
+    return FragmentNode(nodelist, parser.compile_filter(bits[1]), sections['depends'], sections['vary'], timeout)
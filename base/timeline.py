@@ -0,0 +1,67 @@
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count
+
+'''
+NOTE:
+Helpers for TimelineEntry ( models.py ): the per user "Recent Activities".
+
+fan_out() runs for every new message ( signals.py ) and adds it to the timeline of everyone who should see it.
+trim() keeps the table from growing forever, `python manage.py trim_timeline` calls it.
+'''
+
+# how many entries every user keeps, the panel only shows RECENT_ACTIVITY_LIMIT of them ( views.py ).
+TIMELINE_LENGTH = 200
+BATCH_SIZE = 1000
+
+
+def recipients(message, apps=global_apps, using=DEFAULT_DB_ALIAS):
+    '''
+    The ids of the users that get this message: the room's participants, the followers of its topic and the author
+    ( views.room adds the author to the participants only after saving the message ).
+    '''
+    Room = apps.get_model('base', 'Room')
+    Topic = apps.get_model('base', 'Topic')
+    ids = set(Room.participants.through.objects.using(using)
+              .filter(room_id=message.room_id).values_list('user_id', flat=True))
+    topic_id = Room.objects.using(using).filter(id=message.room_id).values_list('topic_id', flat=True).first()
+    if topic_id:
+        ids.update(Topic.followers.through.objects.using(using)
+                   .filter(topic_id=topic_id).values_list('user_id', flat=True))
+    ids.add(message.user_id)
+    return ids
+
+
+def fan_out(message, apps=global_apps, using=DEFAULT_DB_ALIAS):
+    TimelineEntry = apps.get_model('base', 'TimelineEntry')
+    entries = [TimelineEntry(user_id=user_id, message_id=message.id)
+               for user_id in sorted(recipients(message, apps, using))]
+    # ignore_conflicts: the ( user, message ) pair is unique, so running it twice for a message is harmless.
+    TimelineEntry.objects.using(using).bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(entries)
+
+
+def trim(length=TIMELINE_LENGTH, apps=global_apps, using=DEFAULT_DB_ALIAS):
+    '''
+    Deletes everything but the newest `length` entries of every user. Returns how many rows were deleted.
+    '''
+    TimelineEntry = apps.get_model('base', 'TimelineEntry')
+    entries = TimelineEntry.objects.using(using)
+    too_long = (entries.order_by().values('user_id').annotate(total=Count('id'))
+                .filter(total__gt=length).values_list('user_id', flat=True))
+    deleted = 0
+    for user_id in list(too_long):
+        # the id of the oldest entry we keep, found on the ( user, -id ) index.
+        newest_first = entries.filter(user_id=user_id).order_by('-id').values_list('id', flat=True)
+        oldest_kept = list(newest_first[length - 1:length])
+        if oldest_kept:
+            deleted += entries.filter(user_id=user_id, id__lt=oldest_kept[0]).delete()[0]
+    return deleted
+
+
+def backfill(apps=global_apps, using=DEFAULT_DB_ALIAS, per_user=TIMELINE_LENGTH):
+    # fills the timelines from the messages that were posted before TimelineEntry existed ( used by the migration ).
+    Message = apps.get_model('base', 'Message')
+    for message in Message.objects.using(using).order_by('id').only('id', 'room_id', 'user_id').iterator():
+        fan_out(message, apps, using)
+    return trim(per_user, apps, using)
@@ -0,0 +1,235 @@
+import bisect
+import datetime
+import heapq
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Message, Topic
+from .search import tokenize
+
+'''
+NOTE:
+Topic autocomplete ( the topic field of the room form, /api/topics?q= ) and the trending topics.
+
+Autocomplete:
+Every process keeps the topic names in memory as one sorted list of ( key, topic id ), with a key for the whole
+name and one per word ( so "lea" finds "Machine Learning" ). All the keys starting with a prefix sit next to each
+other in that list, so two bisects find them without looking at the other topics, and the best of those by
+room_count are the answer. The first 1-2 letters match a big share of all topics, so their answers are worked out
+while loading and then kept up to date by every change ( check _update_memo() ).
+signals.py updates the list after a topic is saved or deleted, or a room moves its room_count
+( refresh(), after the commit ). Changes made by other processes reach it when it's reloaded, every
+TOPIC_INDEX_MAX_AGE seconds, in a background thread while the requests keep using the old one.
+
+Trending:
+The topics with the most messages in the last TRENDING_WINDOW_HOURS, a window that moves with the clock.
+It's one GROUP BY over the messages of the window ( the message_created_idx index finds them ), cached for a minute.
+'''
+
+AUTOCOMPLETE_LIMIT = 10
+# prefixes this short are remembered, with this many answers.
+MEMO_PREFIX_LENGTH = 2
+MEMO_SIZE = 50
+
+TRENDING_CACHE_KEY = 'trending-topics'
+TRENDING_CACHE_TIMEOUT = 60
+TRENDING_SIZE = 50
+
+TopicMatch = namedtuple('TopicMatch', ['id', 'name', 'room_count'])
+TrendingTopic = namedtuple('TrendingTopic', ['id', 'name', 'messages'])
+
+
+def keys_of(name):
+    return tuple(sorted({name.lower(), *tokenize(name)}))
+
+
+def rank_of(topic_id, name, room_count):
+    # what the matches are sorted by: most rooms first, then by name.
+    return (-room_count, name.lower(), topic_id)
+
+
+class TopicIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # sorted ( key, topic id )
+        self.keys = []
+        # topic id -> ( name, room_count, rank, keys )
+        self.topics = {}
+        # short prefix -> the ranks of its best MEMO_SIZE matches, best first
+        self.memo = {}
+        self.loaded_at = None
+
+    def load(self, rows):
+        '''
+        Builds the index from ( id, name, room_count ) rows.
+        '''
+        keys, topics = [], {}
+        for topic_id, name, room_count in rows:
+            entry = (name, room_count, rank_of(topic_id, name, room_count), keys_of(name))
+            topics[topic_id] = entry
+            keys.extend((key, topic_id) for key in entry[3])
+        keys.sort()
+        # one walk over all the topics, best first, answers every short prefix at once.
+        ranked = sorted(entry[2] for entry in topics.values())
+        memo = {'': ranked[:MEMO_SIZE]}
+        for rank in ranked:
+            prefixes = {key[:length] for key in topics[rank[2]][3] for length in range(1, MEMO_PREFIX_LENGTH + 1)}
+            for prefix in prefixes:
+                found = memo.setdefault(prefix, [])
+                if len(found) < MEMO_SIZE:
+                    found.append(rank)
+        with self.lock:
+            self.keys, self.topics, self.memo = keys, topics, memo
+            self.loaded_at = time.monotonic()
+
+    def upsert(self, topic_id, name, room_count):
+        with self.lock:
+            old = self._remove(topic_id)
+            entry = (name, room_count, rank_of(topic_id, name, room_count), keys_of(name))
+            self.topics[topic_id] = entry
+            for key in entry[3]:
+                bisect.insort(self.keys, (key, topic_id))
+            self._update_memo(old, entry)
+
+    def remove(self, topic_id):
+        with self.lock:
+            self._update_memo(self._remove(topic_id), None)
+
+    def _remove(self, topic_id):
+        old = self.topics.pop(topic_id, None)
+        for key in old[3] if old else ():
+            i = bisect.bisect_left(self.keys, (key, topic_id))
+            if i < len(self.keys) and self.keys[i] == (key, topic_id):
+                del self.keys[i]
+        return old
+
+    def _update_memo(self, old, new):
+        '''
+        Keeps the remembered answers right after one topic changed, instead of forgetting all of them:
+        a remembered list with fewer than MEMO_SIZE ranks holds every match, so it can always be fixed in place.
+        A full one only while the topic moves up ( a new room ), when it moves down or goes away the next best
+        match isn't known and that prefix is worked out again when it's asked for.
+        '''
+        for prefix, ranks in list(self.memo.items()):
+            complete = len(ranks) < MEMO_SIZE
+            was = old is not None and old[2] in ranks
+            matches = new is not None and any(key.startswith(prefix) for key in new[3])
+            if was and not complete and (not matches or new[2] > old[2]):
+                del self.memo[prefix]
+                continue
+            if was:
+                ranks = [rank for rank in ranks if rank != old[2]]
+            if matches and (complete or was or new[2] < ranks[-1]):
+                bisect.insort(ranks, new[2])
+            self.memo[prefix] = ranks[:MEMO_SIZE]
+
+    def complete(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        '''
+        TopicMatch( id, name, room_count )s of the topics with a word starting with prefix, most rooms first.
+        '''
+        prefix = prefix.strip().lower()
+        with self.lock:
+            if len(prefix) <= MEMO_PREFIX_LENGTH and limit <= MEMO_SIZE:
+                if prefix not in self.memo:
+                    self.memo[prefix] = self._best(prefix, MEMO_SIZE)
+                ranks = self.memo[prefix][:limit]
+            else:
+                ranks = self._best(prefix, limit)
+            return [TopicMatch(rank[2], *self.topics[rank[2]][:2]) for rank in ranks]
+
+    def _best(self, prefix, limit):
+        topics = self.topics
+        if not prefix:
+            return heapq.nsmallest(limit, (entry[2] for entry in topics.values()))
+        lo = bisect.bisect_left(self.keys, (prefix,))
+        hi = bisect.bisect_left(self.keys, (prefix + '\U0010ffff',), lo)
+        # a topic can match on more than one of its words.
+        ids = {topic_id for key, topic_id in self.keys[lo:hi]}
+        return heapq.nsmallest(limit, (topics[topic_id][2] for topic_id in ids))
+
+
+_index = TopicIndex()
+_reloading = threading.Lock()
+# topics that changed while a reload was reading the table, refresh() them again once it's swapped in.
+_changed_while_reloading = set()
+
+
+def _rows(using=DEFAULT_DB_ALIAS):
+    return Topic.objects.using(using).values_list('id', 'name', 'room_count').iterator(chunk_size=5000)
+
+
+def _reload():
+    try:
+        try:
+            _index.load(_rows())
+        finally:
+            _reloading.release()
+        # whatever changed from here on goes straight into the new index.
+        changed = list(_changed_while_reloading)
+        _changed_while_reloading.clear()
+        _apply(changed)
+    finally:
+        # this thread's own database connection.
+        connections.close_all()
+
+
+def get_index():
+    if _index.loaded_at is None:
+        _index.load(_rows())
+    elif time.monotonic() - _index.loaded_at > settings.TOPIC_INDEX_MAX_AGE and _reloading.acquire(blocking=False):
+        # reading 100k topics takes a second or two, the requests keep answering from the old index meanwhile.
+        threading.Thread(target=_reload, name='topic-index-reload', daemon=True).start()
+    return _index
+
+
+def complete(prefix, limit=AUTOCOMPLETE_LIMIT):
+    return get_index().complete(prefix, limit)
+
+
+def refresh(topic_ids, using=DEFAULT_DB_ALIAS):
+    # an index that isn't loaded yet reads everything when it's first used anyway.
+    if _index.loaded_at is None:
+        return
+    if _reloading.locked():
+        _changed_while_reloading.update(topic_ids)
+    _apply(topic_ids, using)
+
+
+def _apply(topic_ids, using=DEFAULT_DB_ALIAS):
+    found = {row[0]: row for row in Topic.objects.using(using).filter(id__in=topic_ids)
+             .values_list('id', 'name', 'room_count')}
+    for topic_id in topic_ids:
+        if topic_id in found:
+            _index.upsert(*found[topic_id])
+        else:
+            _index.remove(topic_id)
+
+
+def reset():
+    _index.clear()
+    _changed_while_reloading.clear()
+
+
+def trending(limit=10):
+    '''
+    TrendingTopic( id, name, messages )s of the topics with the most messages in the window, busiest first.
+    '''
+    found = cache.get(TRENDING_CACHE_KEY)
+    if found is None:
+        since = timezone.now() - datetime.timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+        rows = (Message.objects.filter(created__gte=since, room__topic__isnull=False).order_by()
+                .values('room__topic_id', 'room__topic__name').annotate(messages=Count('id'))
+                .order_by('-messages', 'room__topic__name')[:TRENDING_SIZE])
+        found = [TrendingTopic(row['room__topic_id'], row['room__topic__name'], row['messages']) for row in rows]
+        cache.set(TRENDING_CACHE_KEY, found, TRENDING_CACHE_TIMEOUT)
+    return found[:limit]
@@ -0,0 +1,72 @@
+import datetime
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import queries
+from .models import Membership
+
+'''
+NOTE:
+"N new" on the room cards, so nobody has to open every room to find the ones with new messages.
+
+Every Membership has a read cursor, last_read_message_id: the newest message of the room the user has seen.
+views.room moves it forward when it shows the newest messages ( mark_read ).
+The unread counts of all of a user's rooms come from one aggregate query ( queries.unread_counts ) and are cached
+per user. Posting a message expires the cached counts of the room's participants ( tasks.fan_out_message ),
+deleting one does the same ( signals.py ), and reading a room expires the reader's own.
+'''
+
+CACHE_TIMEOUT = 300
+# last_seen is only written again after this long, so reloading a room doesn't UPDATE every time.
+LAST_SEEN_PRECISION = datetime.timedelta(minutes=1)
+
+
+def _key(user_id):
+    return f"unread:{user_id}"
+
+
+def counts(user_id):
+    '''
+    { room_id: unread messages } for the user's rooms that have any.
+    '''
+    key = _key(user_id)
+    found = cache.get(key)
+    if found is None:
+        found = dict(queries.unread_counts(user_id))
+        cache.set(key, found, CACHE_TIMEOUT)
+    return found
+
+
+def annotate_rooms(user, rooms):
+    # sets room.unread on the rooms of a page, for feed_component.html.
+    found = counts(user.id) if user.is_authenticated else {}
+    for room in rooms:
+        room.unread = found.get(room.id, 0)
+    return rooms
+
+
+def mark_read(user_id, room_id, message_id):
+    '''
+    Moves the user's read cursor of the room up to message_id ( never back ) and notes when they were last here.
+    '''
+    now = timezone.now()
+    stale = (Q(last_read_message_id__lt=message_id) | Q(last_seen__isnull=True)
+             | Q(last_seen__lt=now - LAST_SEEN_PRECISION))
+    Membership.objects.filter(Q(user_id=user_id, room_id=room_id) & stale).update(
+        last_read_message_id=Greatest(F('last_read_message_id'), message_id), last_seen=now,
+    )
+    found = cache.get(_key(user_id))
+    if found and room_id in found:
+        cache.delete(_key(user_id))
+
+
+def expire(user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+def expire_room(room_id, using=DEFAULT_DB_ALIAS):
+    expire(Membership.objects.using(using).filter(room_id=room_id).values_list('user_id', flat=True))
@@ -1,22 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# home, room and userProfile also come as async views ( async_views.py ), ASYNC_VIEWS in settings.py picks which ones we use.
+pages = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('login/', views.loginPage, name='login'),
     path('logout/', views.logoutUser, name='logout'),
     path('register/', views.registerPage, name='register'),
 
-    path('', views.home, name='home'),
-    path('room/<str:pk>/', views.room, name='room'),
-    path('profile/<str:pk>/', views.userProfile, name='user-profile'),
+    path('', pages.home, name='home'),
+    path('room/<str:pk>/', pages.room, name='room'),
+    path('profile/<str:pk>/', pages.userProfile, name='user-profile'),
 
     path('create-room/', views.createRoom, name='create-room'),
     path('update-room/<str:pk>', views.updateRoom, name='update-room'),
     path('delete-room/<str:pk>', views.deleteRoom, name='delete-room'),
     path('delete-message/<str:pk>', views.deleteMessage, name='delete-message'),
+    path('leave-room/<str:pk>/', views.leaveRoom, name='leave-room'),
 
     path('update-user/', views.updateUser, name='update-user'),
     path('topics/', views.topicsPage, name='topics'),
+    path('follow-topic/<str:pk>/', views.followTopic, name='follow-topic'),
     path('activity/', views.activityPage, name='activity'),
     
 ]
\ No newline at end of file
@@ -1,11 +1,36 @@
+import re
+
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.static import serve
+from django.utils.cache import patch_vary_headers
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from .models import Room, Topic, Message, User
+from django.db import transaction
+from django.db.models import Count
+from .models import Room, Topic, Message, Task, User
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from .forms import RoomForm, UserForm, MyUserCreationForm
+from .pagination import paginate_request
+from .conditional import conditional_page
+from . import (archive, assets, avatars, fragments, memberships, metrics, queries, ratelimit, roomcards, search,
+               topicindex, unread)
+from .ratelimit import rate_limit
+
+
+ROOMS_PER_PAGE = 20
+MESSAGES_PER_PAGE = 50
+# the "Recent Activities" panel on home and profile only ever shows the newest few messages.
+RECENT_ACTIVITY_LIMIT = 20
+# topics the room form suggests before anything is typed.
+ROOM_FORM_TOPICS = 20
+TRENDING_TOPICS = 5
+# Cache-Control max-age of the uploads, check serveMedia().
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_MAX_AGE = 60 * 60
+# collectstatic's content hashed names, like style.3f2a9c1b7d4e.css, check serveStatic().
+STATIC_HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
 
 
 # Create your views here.
@@ -17,12 +42,14 @@ def loginPage(request):
         return redirect('home')
     
     if request.method == "POST":
-        email = request.POST.get('email').lower()
+        email = (request.POST.get('email') or '').lower()
         password = request.POST.get('password')
-        try:
-            user = User.objects.get(email=email)
-        except:
-            messages.error(request, "User does not exists.")
+        '''
+        NOTE:
+        There used to be a User.objects.get(email=email) here first, to say "User does not exists.".
+        authenticate() looks the user up itself, so that was a second query for every login,
+        and it told anyone trying emails which ones have an account.
+        '''
         user = authenticate(request, email=email, password=password)
         if user is not None:
             login(request, user)
@@ -36,6 +63,8 @@ def logoutUser(request):
     logout(request)
     return redirect('home')
 
+# one address can only sign up so many accounts in a row ( check ratelimit.py ).
+@rate_limit('register', key='ip')
 def registerPage(request):
     page = 'register'
     form = MyUserCreationForm()
@@ -65,7 +94,21 @@ def registerPage(request):
     return render(request, 'base/login_register.html', {'form': form})
 
 
+def page_engine(page):
+    # the template engine that renders a page ( PAGE_TEMPLATE_ENGINES in settings.py, check jinja2env.py ).
+    return settings.PAGE_TEMPLATE_ENGINES.get(page, 'django')
+
+
 # @login_required(login_url="login")
+# the room feed, the topics, the activity panel and the hosts on the cards ( check conditional.py ).
+HOME_DEPENDS_ON = ('Room', 'Topic', 'Message', 'User')
+
+
+def followed_topic_ids(request):
+    return sorted(request.user.followed_topics.values_list('id', flat=True))
+
+
+@conditional_page(*HOME_DEPENDS_ON)
 def home(request):
     q = request.GET.get('q') if request.GET.get('q') != None else ''
     '''
@@ -75,35 +118,29 @@ def home(request):
     That's why we added this if-else statement "if request.GET.get('q') != None else ''" --- so that if the filter is "All"
     then all of the rooms will be shown, otherwise based on the filter rooms will be shown.
 
-    Also while using the filter() we gave the argument name as, "topic__name__icontains" === where the __icontains part helps us 
-    to do a case insensitive search for all records that have the value "Py" in the lastname column, where q = Py.
-    So if we have searched like writing only "Py" instead of full "Python", then based on the search it'll match whatever is the closesest
-    match to it and show that to us.
-
-    NOTE:
-    The "icontains" lookup is used to get records that contains a specified value.
-
-    The "icontains" lookup is case insensitive.
-
-    For a case sensitive search, use the "contains" lookup.
+    UPDATE:
+    the search used to be Q(topic__name__icontains=q) | Q(name__icontains=q) | Q(description__icontains=q).
+    "icontains" can't use an index, so every search read the whole rooms table.
+    Now search.search_rooms() asks the full text index for the matching room ids ( best match first ).
+    It still matches the start of words, so searching "Py" finds "Python". Check search.py for the details.
     '''
-    rooms = Room.objects.filter(
-        Q(topic__name__icontains=q) |
-        Q(name__icontains = q) |
-        Q(description__icontains = q)
-        )
+    room_ids = search.search_rooms(q) if q else None
+    rooms, ordering = queries.feed_cards(q, request.GET.get('sort'), room_ids)
+    # the querysets themselves are built in queries.py, so the async views ( async_views.py ) use the very same ones.
+    # the cards are flat copies of what feed_component.html shows of a room, read as plain rows ( roomcards.py ).
+    room_count = len(room_ids) if q else rooms.count()
+    rooms_page = roomcards.to_cards(paginate_request(request, rooms, per_page=ROOMS_PER_PAGE, ordering=ordering))
     '''
     NOTE:
-    Q() --- this is also a lookup method in django like __icontains.
-    Let's say we don't want to search through the topic, instead we want to search with the name,
-    then we cannot do that.
-    That's why to make the search/filter more dynamic we use the Q() to filter with whaterver value we pass.
-    And thus while using Q() we can either use it with multiple filters separately by using "or" 
-    or we can use "and" to use multiple filters at once.
+    paginate_request() only fetches one page of rooms, and the ?cursor= in the url tells it where the last page ended.
+    Check pagination.py for why we use a cursor and not page numbers.
     '''
-    room_count = rooms.count()
-    topics = Topic.objects.all()[0:5]
-    room_messages = Message.objects.filter(Q(room__topic__name__icontains=q))
+    unread.annotate_rooms(request.user, rooms_page)
+    # room.unread for the "N new" on the cards, the counts of all our rooms come from one cached query ( unread.py ).
+    topics = queries.sidebar_topics(5)
+    viewer_id = request.user.id if request.user.is_authenticated else None
+    room_messages = queries.home_activity(RECENT_ACTIVITY_LIMIT, topic_ids=search.search_topics(q) if q else None,
+                                          viewer_id=viewer_id)
     '''
     NOTE:
     Here by doing "Message.objects.all()" --- we're getting all the messages, but we can also use filter here
@@ -113,17 +150,23 @@ def home(request):
     now the all() is changed to filter() method with the Q-lookup method, which makes it filter the feed based upon the topics
     we choose form the topics bar.
 
-    However we can also filter it to show our friends' messages only.
+    UPDATE:
+    a logged in user now sees their own timeline here: the messages of the rooms they're in and the topics they follow.
+    Check TimelineEntry in models.py.
     '''
-    context = {'rooms': rooms, 'topics': topics, "room_count": room_count,
-                "room_messages": room_messages}
-    return render(request, 'base/home.html', context)
+    # the busiest topics of the last day, cached for a minute ( topicindex.py ).
+    trending = topicindex.trending(TRENDING_TOPICS)
+    context = {'rooms': rooms_page, 'rooms_page': rooms_page, 'topics': topics, "room_count": room_count,
+                "room_messages": room_messages, "trending": trending}
+    return render(request, 'base/home.html', context, using=page_engine('home'))
 
 
 @login_required(login_url="login")
+@rate_limit('post-message')
 def room(request, pk):
-    room = Room.objects.get(id=pk)
-    room_messages = room.message_set.all()
+    room = queries.room_detail(pk, viewer_id=request.user.id).get()
+    memberships.remember(request, room.id, room.is_member)
+    room_messages = queries.room_messages(room.id)
     '''
     NOTE:
     message_set.all() --- in django, we can query child objects from a child model. So here the parent class is the Room model
@@ -131,15 +174,12 @@ def room(request, pk):
     And message_set.all() means, give us all the set of messages related to this room.
 
     '''
-    participants = room.participants.all()
+    participants = queries.room_participants(room.id)
     if request.method == 'POST':
-        message = Message.objects.create(
-            user = request.user,
-            room = room,
-            body = request.POST.get('body')  
-            # the body is geeting whatever is passed in the form of room.html, class=comment-form. The name='body' is used here, to get the data.
-        )
-        room.participants.add(request.user)
+        room.post_message(request.user, request.POST.get('body'), join=not memberships.is_member(request, room.id))
+        memberships.remember(request, room.id, True)
+        # the body is geeting whatever is passed in the form of room.html, class=comment-form. The name='body' is used here, to get the data.
+        # post_message() ( models.py ) creates the message and adds us to the participants, unless we already are one.
         return redirect('room', pk=room.id)
         '''
         NOTE:
@@ -148,21 +188,55 @@ def room(request, pk):
         But as while commenting the request will be a POST request, this might mess up some functionality. That's why if we added that
         return statement, as then the page will be fully reloaded and we'll get back with a GET request and not a POST request.
         '''
-    context = {'room': room, 'room_messages': room_messages, 'participants': participants}
-    return render(request, 'base/room.html', context)
+    archived = 'archived' in request.GET
+    archive_url = None
+    if archived:
+        # the old messages archive_messages moved out of the messages table, only read when asked for ( archive.py ).
+        messages_page = archive.paginate_request(request, room.id, per_page=MESSAGES_PER_PAGE)
+    else:
+        messages_page = paginate_request(request, room_messages, per_page=MESSAGES_PER_PAGE)
+        if not messages_page.has_next:
+            archive_url = archive.first_page_url(request, room.id)
+    # only the newest messages are rendered, older ones are behind the "Older messages" link.
+    '''
+    NOTE:
+    The first page is kept up to date live over a WebSocket ( static/js/room.js and consumers.py ).
+    last_message_id tells the socket which messages we already rendered, so it only sends the newer ones.
+    '''
+    live = not request.GET.get('cursor') and not archived
+    last_message_id = max((message.id for message in messages_page), default=0)
+    if memberships.is_member(request, room.id) and not archived:
+        # we've now seen everything up to the newest message on this page ( check unread.py ).
+        unread.mark_read(request.user.id, room.id, last_message_id)
+    context = {'room': room, 'room_messages': messages_page, 'messages_page': messages_page,
+               'participants': participants, 'live': live, 'last_message_id': last_message_id,
+               'archive_url': archive_url, 'is_member': memberships.is_member(request, room.id)}
+    return render(request, 'base/room.html', context, using=page_engine('room'))
+
+
+@login_required(login_url="login")
+def leaveRoom(request, pk):
+    # the room stays in the feed, we just stop being a participant ( and stop getting its messages in our timeline ).
+    room = Room.objects.get(id=pk)
+    if request.method == 'POST':
+        memberships.leave(request, room)
+        return redirect('home')
+    return redirect('room', pk=room.id)
 
 
 @login_required(login_url="login")
 def userProfile(request, pk):
     user = User.objects.get(id=pk)
-    rooms = user.room_set.all()
+    rooms = queries.hosted_cards(user.id)
     # here we've kept the variable name "rooms" because in the feed_component we're using this same variable as "rooms".
     # so that it doesn't have issue with other components, we have kept the name same.
-    room_messages = user.message_set.all()
-    topics = Topic.objects.all()
-    context = {"user": user, "rooms": rooms, 
+    rooms_page = roomcards.to_cards(paginate_request(request, rooms, per_page=ROOMS_PER_PAGE))
+    unread.annotate_rooms(request.user, rooms_page)
+    room_messages = queries.recent_activity(RECENT_ACTIVITY_LIMIT, user_id=user.id)
+    topics = queries.sidebar_topics()
+    context = {"user": user, "rooms": rooms_page, "rooms_page": rooms_page,
                "room_messages": room_messages, "topics": topics}
-    return render(request, 'base/profile.html', context)
+    return render(request, 'base/profile.html', context, using=page_engine('user-profile'))
 
 
 '''
@@ -171,23 +245,26 @@ This part "@login_required(login_url="login")" --- is called a decorator, which
 restricting any user if they are not logged in to see any data like rooms, or ability to create/ delete a room.
 '''
 @login_required(login_url="login")
+@rate_limit('create-room')
 def createRoom(request):
     form = RoomForm()
-    topics = Topic.objects.all()
+    # the most used topics to start with, room_form.html asks /api/topics for more as you type ( topicindex.py ).
+    topics = topicindex.complete('', ROOM_FORM_TOPICS)
     if request.method == 'POST':
         # form = RoomForm(request.POST)
         topic_name = request.POST.get('topic')
-        topic, created = Topic.objects.get_or_create(name=topic_name)
-        '''
-        NOTE:
-        get_or_created() --- 
-        '''
-        Room.objects.create(
-            host= request.user,
-            topic= topic,
-            name= request.POST.get('name'),
-            description= request.POST.get('description'),
-        )
+        with transaction.atomic():
+            topic, created = Topic.objects.get_or_create(name=topic_name)
+            '''
+            NOTE:
+            get_or_created() --- 
+            '''
+            Room.objects.create(
+                host= request.user,
+                topic= topic,
+                name= request.POST.get('name'),
+                description= request.POST.get('description'),
+            )
         return redirect('home')
     
         # if form.is_valid:
@@ -217,17 +294,18 @@ def updateRoom(request, pk):
     To restrict that this below functionality we've added.
     If the user logged in is not the same as the room-host, then they'll be not allowed to change anything.
     '''
-    topics = Topic.objects.all()
+    topics = topicindex.complete('', ROOM_FORM_TOPICS)
     if request.user != room.host:
         return HttpResponse('You are not allowed here!!')
     if request.method == 'POST':
         form = RoomForm(request.POST, instance=room)
         topic_name = request.POST.get('topic')
-        topic, created = Topic.objects.get_or_create(name=topic_name)
-        room.name = request.POST.get('name')
-        room.topic = topic
-        room.description = request.POST.get('description')
-        room.save()
+        with transaction.atomic():
+            topic, created = Topic.objects.get_or_create(name=topic_name)
+            room.name = request.POST.get('name')
+            room.topic = topic
+            room.description = request.POST.get('description')
+            room.save()
         return redirect('home')
         
     context = {'form': form, "topics": topics, 'room': room}
@@ -248,7 +326,8 @@ def deleteRoom(request, pk):
         return HttpResponse('You are not allowed here!!')
     
     if request.method == "POST":
-        room.delete()
+        with transaction.atomic():
+            room.delete()
         return redirect('home')
     return render(request, 'base/delete.html', {'obj': room})
 
@@ -261,7 +340,8 @@ def deleteMessage(request, pk):
         return HttpResponse("You are not allowed to delete this message!")
     
     if request.method == "POST":
-        message.delete()
+        with transaction.atomic():
+            message.delete()
         return redirect('home')
     
     return render(request, 'base/delete.html', {'obj': message})
@@ -302,14 +382,93 @@ def updateUser(request):
     return render(request, 'base/update-user.html', {'form': form})
 
 @login_required(login_url="login")
+@conditional_page('Topic', 'Room', vary_on=followed_topic_ids)
 def topicsPage(request):
     q = request.GET.get('q') if request.GET.get('q') != None else ''
-    topics = Topic.objects.filter(name__icontains=q)
-    context = {"topics": topics}
+    topics = Topic.objects.popular()
+    if q:
+        topics = search.with_search_rank(topics, search.search_topics(q)).order_by('search_rank')
+    followed = set(request.user.followed_topics.values_list('id', flat=True))
+    context = {"topics": topics, "followed": followed}
     return render(request, 'base/topics.html', context)
 
+
+@login_required(login_url="login")
+def followTopic(request, pk):
+    # following a topic puts its new messages in your "Recent Activities" ( check TimelineEntry in models.py ).
+    topic = Topic.objects.get(id=pk)
+    if request.method == 'POST':
+        if topic.followers.filter(id=request.user.id).exists():
+            topic.followers.remove(request.user)
+        else:
+            topic.followers.add(request.user)
+    return redirect('topics')
+
 @login_required(login_url="login")
 def activityPage(request):
-    room_messages = Message.objects.all()
-    context = {}
-    return render(request, 'base/activity.html', context)
\ No newline at end of file
+    # the same timeline as the "Recent Activities" panel on home, a page at a time.
+    room_messages = paginate_request(request, queries.timeline(request.user.id), per_page=MESSAGES_PER_PAGE,
+                                     ordering=queries.TIMELINE_ORDERING)
+    context = {"room_messages": room_messages, "messages_page": room_messages}
+    return render(request, 'base/activity.html', context)
+
+
+def serveMedia(request, path):
+    '''
+    NOTE:
+    Serves the uploads ( MEDIA_ROOT ), this replaces django.conf.urls.static.static() in studybud/urls.py.
+    Avatars stored by avatars.py are named after their content, so the file behind a name never changes and
+    browsers may keep it for a year without asking again ( immutable ). Anything else, like the default avatar.svg,
+    can still be replaced under the same name, so that is only cached for an hour.
+    In production nginx ( or the CDN ) should serve MEDIA_ROOT with the same headers and never reach this view.
+    '''
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if avatars.STORED_NAME.match(path) or path.startswith('avatars/raw/'):
+        response['Cache-Control'] = f'public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}'
+    return response
+
+
+def serveStatic(request, path):
+    '''
+    NOTE:
+    Serves the collected static files ( STATIC_ROOT, check assets.py ) the way production does, for trying a build
+    locally. It's only in the urls with DEBUG on: django's serve() isn't made for production ( it reads every file
+    in python, with no protection against a flood of requests ), there the web server serves STATIC_ROOT.
+    When the browser accepts br or gzip and build_static made a .br / .gz copy of the file, that copy is sent instead,
+    with Content-Encoding set ( serve() does that from the file name ), so nothing is compressed per request.
+    The content hashed names never change, so browsers may keep them for a year ( immutable ), the rest for an hour.
+    '''
+    served = assets.precompressed(path, request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    response = serve(request, served, document_root=settings.STATIC_ROOT)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if STATIC_HASHED_NAME.search(path):
+        response['Cache-Control'] = f'public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}'
+    return response
+
+
+def metricsPage(request):
+    '''
+    NOTE:
+    The numbers of MetricsMiddleware ( metrics.py ) for Prometheus, plus the fragment cache hits / misses
+    ( fragments.py ), how many background tasks are waiting ( taskqueue.py ) and the rate limited writes ( ratelimit.py ).
+    Only staff and the addresses in METRICS_ALLOWED_IPS ( the Prometheus server ) may read it.
+    '''
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden()
+    fragment_stats = fragments.stats()
+    tasks = Task.objects.order_by().values_list('status').annotate(total=Count('id'))
+    extra = [
+        ('fragment_cache_hits_total', 'counter', "Template fragments served from the cache.",
+         [({'fragment': name}, counts['hits']) for name, counts in sorted(fragment_stats.items())]),
+        ('fragment_cache_misses_total', 'counter', "Template fragments that had to be rendered.",
+         [({'fragment': name}, counts['misses']) for name, counts in sorted(fragment_stats.items())]),
+        ('tasks', 'gauge', "Background tasks in the queue, by status.",
+         [({'status': status}, total) for status, total in sorted(tasks)]),
+        ('rate_limited_total', 'counter', "Writes refused by a rate limit ( 429 ), by limit.",
+         [({'limit': name}, count) for name, count in sorted(ratelimit.stats().items())]),
+    ]
+    return HttpResponse(metrics.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,72 @@
+// Live room updates
+// The room page keeps a WebSocket open ( base/consumers.py ). New messages arrive as small JSON frames and are
+// added to the page, so nobody has to reload. If the socket is not available ( like under runserver ) the
+// message form still works with a normal POST.
+
+const threads = document.querySelector("#threads");
+const messageForm = document.querySelector("#message-form");
+const threadTemplate = document.querySelector("#thread-template");
+
+if (threads && threadTemplate && threads.dataset.live === "true") {
+  const roomId = threads.dataset.roomId;
+  const userId = Number(threads.dataset.userId);
+  // these close codes mean "don't try again" ( not logged in, wrong origin, room deleted ).
+  const finalCloseCodes = [4401, 4403, 4404];
+  let lastMessageId = Number(threads.dataset.lastMessageId) || 0;
+  let socket = null;
+  let retryDelay = 1000;
+
+  const urlFor = (template, id) => template.replace("/0", `/${id}`);
+
+  const renderMessage = (frame) => {
+    if (threads.querySelector(`[data-message-id="${frame.id}"]`)) return;
+    const thread = threadTemplate.content.firstElementChild.cloneNode(true);
+    thread.dataset.messageId = frame.id;
+    const author = thread.querySelector(".thread__authorInfo");
+    author.href = urlFor(threads.dataset.profileUrl, frame.user.id);
+    author.querySelector("img").src = frame.user.avatar || "";
+    author.querySelector("span").textContent = `@${frame.user.username}`;
+    thread.querySelector(".thread__details").textContent = frame.body;
+    const deleteLink = thread.querySelector(".thread__deleteLink");
+    if (frame.user.id === userId) deleteLink.href = urlFor(threads.dataset.deleteUrl, frame.id);
+    else deleteLink.remove();
+    threads.prepend(thread);
+    lastMessageId = Math.max(lastMessageId, frame.id);
+  };
+
+  const handleFrame = (frame) => {
+    if (frame.type === "message") renderMessage(frame);
+    else if (frame.type === "delete") {
+      const thread = threads.querySelector(`[data-message-id="${frame.id}"]`);
+      if (thread) thread.remove();
+    } else if (frame.type === "reload") window.location.reload();
+  };
+
+  const connect = () => {
+    const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+    // ?after= asks only for what we haven't seen yet, so a reconnect doesn't resend the whole room.
+    socket = new WebSocket(`${scheme}://${window.location.host}/ws/room/${roomId}/?after=${lastMessageId}`);
+    socket.onopen = () => {
+      retryDelay = 1000;
+    };
+    socket.onmessage = (event) => handleFrame(JSON.parse(event.data));
+    socket.onclose = (event) => {
+      socket = null;
+      if (finalCloseCodes.includes(event.code)) return;
+      setTimeout(connect, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, 30000);
+    };
+  };
+
+  if (messageForm) {
+    messageForm.addEventListener("submit", (event) => {
+      const input = messageForm.querySelector("input[name='body']");
+      if (!socket || socket.readyState !== WebSocket.OPEN || !input.value.trim()) return;
+      event.preventDefault();
+      socket.send(JSON.stringify({ type: "message", body: input.value }));
+      input.value = "";
+    });
+  }
+
+  connect();
+}
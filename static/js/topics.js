@@ -0,0 +1,38 @@
+// Topic autocomplete
+// The room form starts with the most used topics in its <datalist>. While typing, the list is replaced with the
+// topics matching what was typed, from /api/topics?q= ( base/topicindex.py ), busiest first.
+
+const topicInput = document.querySelector("input[data-autocomplete-url]");
+
+if (topicInput) {
+  const topicList = document.getElementById(topicInput.getAttribute("list"));
+  const suggestions = {};
+  let timer = null;
+
+  const showTopics = (topics) => {
+    const options = topics.map((topic) => {
+      const option = document.createElement("option");
+      option.value = topic.name;
+      return option;
+    });
+    topicList.replaceChildren(...options);
+  };
+
+  const suggest = async (q) => {
+    if (!(q in suggestions)) {
+      const response = await fetch(`${topicInput.dataset.autocompleteUrl}?q=${encodeURIComponent(q)}`, {
+        headers: { Accept: "application/json" },
+      });
+      if (!response.ok) return;
+      suggestions[q] = await response.json();
+    }
+    // only if it's still what's in the field, answers can come back out of order.
+    if (topicInput.value.trim() === q) showTopics(suggestions[q]);
+  };
+
+  topicInput.addEventListener("input", () => {
+    clearTimeout(timer);
+    const q = topicInput.value.trim();
+    if (q) timer = setTimeout(() => suggest(q), 150);
+  });
+}
@@ -3,6 +3,8 @@ ASGI config for studybud project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+HTTP requests go to Django as usual, WebSocket connections ( live room chat ) go to base.routing.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -13,4 +15,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'studybud.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after get_asgi_application(), which sets django up ( the consumers import models ).
+from base.routing import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -13,6 +13,10 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
+from studybud.database import databases_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,11 +51,15 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'base.User'
 
 MIDDLEWARE = [
+    # first, so its timings include all the other middleware ( check base/metrics.py )
+    'base.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'base.db.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware with request.user from the cache ( check base/auth.py )
+    'base.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     
@@ -78,19 +86,93 @@ TEMPLATES = [
     },
 ]
 
+# jinja2 ( optional, `pip install jinja2` ): a faster engine for the hot pages, check base/jinja2env.py.
+# STUDYBUD_TEMPLATE_ENGINE=jinja2 renders home, room and user-profile with it, the other pages stay on django.
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+if jinja2 is not None:
+    TEMPLATES.append({
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [],
+        # the templates are in base/jinja2/
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'base.jinja2env.environment',
+        },
+    })
+# where jinja2 keeps the compiled templates, None is a folder in the system's temp dir.
+JINJA2_BYTECODE_CACHE_DIR = os.environ.get('STUDYBUD_JINJA2_CACHE_DIR')
+
+# page ( url name ) -> the engine that renders it, 'django' or 'jinja2'.
+PAGE_TEMPLATE_ENGINE = os.environ.get('STUDYBUD_TEMPLATE_ENGINE', 'django')
+if PAGE_TEMPLATE_ENGINE == 'jinja2' and jinja2 is None:
+    raise ImproperlyConfigured("STUDYBUD_TEMPLATE_ENGINE=jinja2 needs jinja2, `pip install jinja2`.")
+PAGE_TEMPLATE_ENGINES = {
+    'home': PAGE_TEMPLATE_ENGINE,
+    'room': PAGE_TEMPLATE_ENGINE,
+    'user-profile': PAGE_TEMPLATE_ENGINE,
+}
+
 WSGI_APPLICATION = 'studybud.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# DATABASE_URL, DATABASE_REPLICA_URL, CONN_MAX_AGE ... come from the environment, check studybud/database.py.
+# Without any of them it's the db.sqlite3 next to manage.py, like before.
+DATABASES = databases_from_env(os.environ, BASE_DIR / 'db.sqlite3')
+
+if 'replica' in DATABASES:
+    DATABASE_ROUTERS = ['base.db.ReplicaRouter']
+
+# url names of the read only pages that may read from the replica ( check base/db.py )
+DATABASE_REPLICA_VIEWS = ['home', 'topics', 'activity', 'api-rooms', 'api-room', 'api-export']
+# after a POST that browser reads from the primary for this long, so it sees its own writes
+DATABASE_REPLICA_STICKY_SECONDS = 10
+
+# WAL lets SQLite readers carry on while somebody writes ( check base/db.py ), the -wal / -shm files it leaves next to
+# db.sqlite3 are in .gitignore. SQLITE_JOURNAL_MODE=DELETE for the old behaviour, empty keeps the file's own mode.
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+
+
+# Sessions
+# STUDYBUD_SESSION_ENGINE picks where the sessions are kept:
+#   db             - the django_session table, a query on every logged in request
+#   cached_db      - the cache, the table only when it isn't there ( and on every write, so nothing is lost )
+#   signed_cookies - the cookie itself, signed with SECRET_KEY, no query and nothing stored on the server.
+#                    Logging out only drops the cookie, a copy of it stays valid until it expires.
+# cached_db is the default when the cache is shared by all processes ( STUDYBUD_CACHE_DIR ). With the
+# per-process local memory cache a logout in one process wouldn't reach the others, so it's db then.
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
 }
+SESSION_ENGINE = SESSION_ENGINES[
+    os.environ.get('STUDYBUD_SESSION_ENGINE', 'cached_db' if os.environ.get('STUDYBUD_CACHE_DIR') else 'db')
+]
 
+# Password hashing
+# pbkdf2 ( django's default ) or scrypt, which is memory hard and costs less CPU per login. Both stay in the list,
+# so the passwords hashed with the other one still work and are rehashed with the first one on the next login.
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHER = PASSWORD_HASHER_CHOICES[os.environ.get('STUDYBUD_PASSWORD_HASHER', 'pbkdf2')]
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [
+    hasher for hasher in (
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ) if hasher != PASSWORD_HASHER
+]
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -136,11 +218,105 @@ MEDIA_ROOT = BASE_DIR / 'static/images'
 
 MEDIA_URL = '/images/'
 
-# STATIC_ROOT = 
+# `python manage.py build_static` collects them here ( base/assets.py ), the web server serves them from here.
+STATIC_ROOT = Path(os.environ.get('STUDYBUD_STATIC_ROOT', BASE_DIR / 'staticfiles'))
+
+# Content hashed names + precompressed .gz / .br copies of the static files ( base/assets.py ).
+# Only without DEBUG by default: {% static %} then needs the manifest that build_static writes.
+STATIC_MANIFEST = os.environ.get('STUDYBUD_STATIC_MANIFEST', '0' if DEBUG else '1') == '1'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ('base.assets.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+                    else 'django.contrib.staticfiles.storage.StaticFilesStorage'),
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CORS_ORIGIN_ALLOW_ALL = True
\ No newline at end of file
+CORS_ORIGIN_ALLOW_ALL = True
+# Search
+# base/search.py picks SQLite FTS5 or Postgres full text search from the database engine.
+# Set this to a dotted path ( like 'base.search.QLookupBackend' ) to force a backend.
+SEARCH_BACKEND = None
+
+# Live room updates
+# base/realtime.py fans new messages out to the room WebSockets. The in-memory broker only reaches sockets in the
+# same process, so point this at a broker with the same subscribe() / publish() methods when running several processes.
+REALTIME_BROKER = 'base.realtime.InMemoryBroker'
+
+# Async views
+# Serve home, room, userProfile and the room API from the async views ( base/async_views.py ).
+# Worth it under an ASGI server ( like `uvicorn studybud.asgi:application` ), under WSGI each request would
+# need its own event loop instead.
+ASYNC_VIEWS = os.environ.get('STUDYBUD_ASYNC_VIEWS', '') == '1'
+
+# Cache
+# Local memory by default ( one cache per process ). Set STUDYBUD_CACHE_DIR to use a file based cache that
+# every process on the machine shares, neither needs Redis or memcached.
+if os.environ.get('STUDYBUD_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['STUDYBUD_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'studybud',
+        }
+    }
+
+# Template fragment cache ( base/fragments.py, {% fragment %} in base/templatetags/fragments.py )
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Background tasks ( base/taskqueue.py )
+# In production run `python manage.py run_worker` next to the web server, nothing else runs the queue: without it
+# the "Recent Activities" timelines stay empty and the unread counts are never expired.
+# With DEBUG on ( runserver ) the tasks run right away inside the request, so no worker is needed there.
+# STUDYBUD_TASKS_EAGER=1 / 0 says it either way.
+TASKS_ALWAYS_EAGER = os.environ.get('STUDYBUD_TASKS_EAGER', '1' if DEBUG else '0') == '1'
+
+# Request metrics ( base/metrics.py, served at /metrics )
+# requests slower than this log the SQL they ran; METRICS_SLOW_SAMPLE_RATE logs only a share of them when that's too much.
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('STUDYBUD_SLOW_REQUEST_MS', 500))
+METRICS_SLOW_SAMPLE_RATE = 1.0
+# besides staff users, who may read /metrics ( the Prometheus server )
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# /api/export/ ( base/export.py ) is for staff, and for the analytics jobs that send `Authorization: Bearer <token>`
+EXPORT_TOKEN = os.environ.get('STUDYBUD_EXPORT_TOKEN', '')
+
+# HTTP caching of the pages ( base/conditional.py ): how long a proxy may serve an anonymous page without asking again.
+PAGE_CACHE_MAX_AGE = int(os.environ.get('STUDYBUD_PAGE_CACHE_MAX_AGE', 30))
+
+# Topic autocomplete and trending topics ( base/topicindex.py )
+# every process keeps the topic names in memory, changes made by other processes show up after this many seconds.
+TOPIC_INDEX_MAX_AGE = 300
+# trending = the most messages in this many hours up to now.
+TRENDING_WINDOW_HOURS = 24
+
+# Rate limits for the writes ( base/ratelimit.py ): name -> ( rate, burst ), the rate like "30/m" ( s, m, h, d ).
+# post-message and create-room are per user, register per address.
+RATE_LIMIT_ENABLED = os.environ.get('STUDYBUD_RATE_LIMIT', '1') != '0'
+RATE_LIMITS = {
+    'post-message': ('30/m', 10),
+    'create-room': ('10/h', 5),
+    'register': ('20/h', 10),
+}
+# where the token buckets are kept, STUDYBUD_RATE_LIMIT_BACKEND picks one.
+RATE_LIMIT_BACKENDS = {
+    'memory': 'base.ratelimit.MemoryBackend',
+    'cache': 'base.ratelimit.CacheBackend',
+    'database': 'base.ratelimit.DatabaseBackend',
+}
+RATE_LIMIT_BACKEND = os.environ.get('STUDYBUD_RATE_LIMIT_BACKEND', 'cache')
@@ -1,10 +1,10 @@
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.staticfiles.storage import staticfiles_storage
 from django.views.generic.base import RedirectView
 from django.conf import settings
-from django.conf.urls.static import static
+from base.views import metricsPage, serveMedia, serveStatic
 
 
 urlpatterns = [
@@ -12,6 +12,18 @@ urlpatterns = [
     path('', include('base.urls')),
     # path('favicon.ico', RedirectView.as_view(url=staticfiles_storage.url('favicon/favicon.ico'))),
     path('api/', include('base.api.urls')),
+    path('metrics', metricsPage, name='metrics'),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# uploads ( avatars ), with far-future cache headers for the content-addressed files, check serveMedia().
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serveMedia, name='media'),
+]
+
+# the collected static files ( `python manage.py build_static` ), precompressed, check serveStatic().
+# Only with DEBUG on, to try the build locally ( STUDYBUD_STATIC_MANIFEST=1 and `runserver --nostatic`, without
+# --nostatic runserver serves STATICFILES_DIRS itself ). In production the web server serves STATIC_ROOT ( assets.py ).
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), serveStatic, name='static'),
+    ]